@@ -18,6 +18,9 @@ import {
   DEFAULT_RAG_API_PATH,
   DOCUMENT_CHUNK_PAGE_SIZE,
   DOCUMENT_PAGE_SIZE,
+  INGEST_JOB_MAX_POLLS,
+  INGEST_JOB_POLL_INTERVAL_MS,
+  INGEST_JOB_TERMINAL_STATUSES,
   KB_BULK_DELETE_API_PATH,
   KB_CREATE_API_PATH,
   KB_DELETE_API_PATH,
@@ -28,6 +31,7 @@ import {
   KB_DOCUMENT_LIST_API_PATH,
   KB_DOCUMENT_UPDATE_API_PATH,
   KB_DOCUMENT_UPLOAD_API_PATH,
+  KB_JOB_DETAIL_API_PATH,
   KB_LIST_API_PATH,
   KB_UPDATE_API_PATH,
   KNOWLEDGE_BASE_PAGE_SIZE,
@@ -37,6 +41,7 @@ import type {
   AssistantMessageItem,
   BulkDeleteDocumentResponse,
   BulkDeleteKnowledgeBaseResponse,
+  IngestJob,
   InterruptData,
   KnowledgeBase,
   KnowledgeDocument,
@@ -232,6 +237,7 @@ export default function ChatInterface() {
   const textareaRef = useRef<HTMLTextAreaElement>(null)
   const uploadInputRef = useRef<HTMLInputElement>(null)
   const abortControllerRef = useRef<AbortController | null>(null)
+  const unmountedRef = useRef(false)
   const currentAssistantMessageIdRef = useRef<string | null>(null)
   const processedToolCallIdsRef = useRef<Set<string>>(new Set())
   const lastAssistantStreamEventRef = useRef<
@@ -545,6 +551,13 @@ export default function ChatInterface() {
     [documentChunkPage]
   )
 
+  useEffect(() => {
+    unmountedRef.current = false
+    return () => {
+      unmountedRef.current = true
+    }
+  }, [])
+
   useEffect(() => {
     if (!userId) return
     void loadKnowledgeBases(userId, knowledgeBasePage, knowledgeBaseSearch)
@@ -871,21 +884,65 @@ export default function ChatInterface() {
         body: formData,
       })
 
+      let successCount = result.documents.length
+      let duplicateCount = result.duplicates.length
+      let errors = result.errors
+      if (result.job_id) {
+        let job: IngestJob | null = null
+        for (let attempt = 0; attempt < INGEST_JOB_MAX_POLLS; attempt += 1) {
+          job = await fetchJson<IngestJob>(getApiUrl(KB_JOB_DETAIL_API_PATH), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ user_id: userId, job_id: result.job_id }),
+          })
+          if (unmountedRef.current) return
+          if (
+            INGEST_JOB_TERMINAL_STATUSES.includes(job.status) ||
+            job.finished_files >= job.total_files
+          ) {
+            break
+          }
+          const running = job.files.find((item) => item.status === 'running')
+          setManagementNotice(
+            `Indexing ${job.finished_files}/${job.total_files}` +
+              (running ? ` (${running.file_name}: ${running.stage})` : '')
+          )
+          await new Promise((resolve) => setTimeout(resolve, INGEST_JOB_POLL_INTERVAL_MS))
+          if (unmountedRef.current) return
+        }
+        if (
+          !job ||
+          (!INGEST_JOB_TERMINAL_STATUSES.includes(job.status) &&
+            job.finished_files < job.total_files)
+        ) {
+          throw new Error(
+            `Indexing is still running in job ${result.job_id}; check back later.`
+          )
+        }
+        successCount = job.finished_files - job.failed_files - job.duplicate_files
+        duplicateCount = job.duplicate_files
+        errors = job.files
+          .filter((item) => item.status === 'failed')
+          .map((item) => ({ file_name: item.file_name, error: item.error || '' }))
+      }
+
       await loadKnowledgeBases(userId, knowledgeBasePage, knowledgeBaseSearch)
       await loadKnowledgeBaseDetail(userId, selectedKnowledgeBase.knowledge_base_id)
       await loadDocuments(userId, selectedKnowledgeBase.knowledge_base_id, 1, documentSearch)
       setDocumentPage(1)
 
-      const successCount = result.documents.length
-      const errorCount = result.errors.length
+      const errorCount = errors.length
+      const duplicateNotice = duplicateCount
+        ? ` ${duplicateCount} duplicate file(s) skipped.`
+        : ''
       setManagementNotice(
-        errorCount
+        (errorCount
           ? `${successCount} file(s) indexed, ${errorCount} failed.`
-          : `${successCount} file(s) indexed successfully.`
+          : `${successCount} file(s) indexed successfully.`) + duplicateNotice
       )
       if (errorCount) {
         setManagementError(
-          result.errors.map((item) => `${item.file_name}: ${item.error}`).join('\n')
+          errors.map((item) => `${item.file_name}: ${item.error}`).join('\n')
         )
       }
     } catch (error) {
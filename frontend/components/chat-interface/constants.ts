@@ -1,4 +1,4 @@
-import type { KnowledgePage } from './types'
+import type { IngestJob, KnowledgePage } from './types'
 
 export const DEFAULT_BACKEND_URL = 'http://localhost:7869'
 export const DEFAULT_AGENT_API_PATH = '/api/agent/general_api'
@@ -16,6 +16,15 @@ export const KB_DOCUMENT_UPDATE_API_PATH = '/api/rag/knowledge-bases/documents/u
 export const KB_DOCUMENT_DELETE_API_PATH = '/api/rag/knowledge-bases/documents/delete'
 export const KB_DOCUMENT_BULK_DELETE_API_PATH =
   '/api/rag/knowledge-bases/documents/bulk-delete'
+export const KB_JOB_DETAIL_API_PATH = '/api/rag/knowledge-bases/jobs/detail'
+export const INGEST_JOB_POLL_INTERVAL_MS = 2000
+// Stop polling after about an hour; the job keeps running on the server
+export const INGEST_JOB_MAX_POLLS = 1800
+export const INGEST_JOB_TERMINAL_STATUSES: ReadonlyArray<IngestJob['status']> = [
+  'succeeded',
+  'partial',
+  'failed',
+]
 
 export const KNOWLEDGE_BASE_PAGE_SIZE = 8
 export const DOCUMENT_PAGE_SIZE = 10
@@ -93,6 +93,7 @@ export interface KnowledgeDocument {
   file_size: number
   chunk_count: number
   storage_path: string
+  content_hash: string
   created_at: string
   updated_at: string
 }
@@ -104,6 +105,33 @@ export interface UploadResult {
     file_name: string
     error: string
   }>
+  duplicates: KnowledgeDocument[]
+  job_id: string | null
+}
+
+export interface IngestJobFile {
+  document_id: string
+  file_name: string
+  stage: 'queued' | 'parse' | 'split' | 'extract' | 'embed' | 'index' | 'done'
+  status: 'queued' | 'running' | 'succeeded' | 'duplicate' | 'failed'
+  error: string | null
+  chunk_count: number
+  updated_at: string
+}
+
+export interface IngestJob {
+  job_id: string
+  user_id: string
+  knowledge_base_id: string
+  operation: 'ingest' | 'replace'
+  status: 'queued' | 'running' | 'succeeded' | 'partial' | 'failed'
+  total_files: number
+  finished_files: number
+  failed_files: number
+  duplicate_files: number
+  files: IngestJobFile[]
+  created_at: string
+  updated_at: string
 }
 
 export interface PaginatedKnowledgeBaseResponse {
@@ -0,0 +1,497 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from pydantic import BaseModel
+
+from langchain_api.constant import home_path
+
+DEFAULT_CACHE_DIR = home_path / "cache"
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFKC", str(text)).strip()
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SQLiteCacheStore:
+    """
+    本地 sqlite 键值缓存，超过 max_bytes 时按最近访问时间淘汰。
+
+    namespace 用来区分模型等维度，便于按 namespace 清理。
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_namespace ON entries (namespace)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._query_total_bytes()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # sqlite 单条语句的变量数有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def set_many(self, namespace: str, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            existing = self._sizes(list(items))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, namespace, value, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (key, namespace, value, len(value), now)
+                    for key, value in items.items()
+                ],
+            )
+            self._conn.commit()
+            self._total_bytes += sum(len(value) for value in items.values())
+            self._total_bytes -= sum(existing.values())
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def purge(self, namespace: Optional[str] = None) -> int:
+        with self._lock:
+            if namespace is None:
+                cursor = self._conn.execute("DELETE FROM entries")
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                )
+            self._conn.commit()
+            self._total_bytes = self._query_total_bytes()
+            return cursor.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _evict(self) -> None:
+        # 淘汰到上限的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at ASC LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            to_delete = []
+            for key, size in rows:
+                to_delete.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+            evicted += len(to_delete)
+        self._conn.commit()
+        logger.info("缓存淘汰: path={}, 淘汰条数={}", self.path, evicted)
+
+    def _sizes(self, keys: List[str]) -> Dict[str, int]:
+        sizes: Dict[str, int] = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            sizes.update(
+                self._conn.execute(
+                    f"SELECT key, size FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            )
+        return sizes
+
+    def _query_total_bytes(self) -> int:
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return int(row[0])
+
+
+class EmbeddingCacheStats(BaseModel):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    hit_rate: float
+    memory_items: int
+    disk_items: int
+    disk_bytes: int
+    max_disk_bytes: int
+
+
+class EmbeddingCache:
+    """以 (模型名, 归一化文本哈希) 为键的向量缓存：内存 LRU + 本地 sqlite。"""
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_DIR / "embeddings.sqlite3",
+        max_bytes: int = 1024 * 1024 * 1024,
+        memory_items: int = 10000,
+    ):
+        self.store = SQLiteCacheStore(path, max_bytes=max_bytes)
+        self.memory_items = memory_items
+        self._memory: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return content_hash(model_name, normalize_text(text))
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self._memory_hits += 1
+
+        missing = [key for key in keys if key not in found]
+        disk_found = {
+            key: array("f", value).tolist()
+            for key, value in self.store.get_many(missing).items()
+        }
+        with self._lock:
+            self._disk_hits += len(disk_found)
+            self._misses += len([key for key in missing if key not in disk_found])
+            for key, vector in disk_found.items():
+                self._remember(key, vector)
+        found.update(disk_found)
+        return found
+
+    def set_many(self, namespace: str, vectors: Dict[str, List[float]]) -> None:
+        if not vectors:
+            return
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+        self.store.set_many(
+            namespace,
+            {key: array("f", vector).tobytes() for key, vector in vectors.items()},
+        )
+
+    def stats(self) -> EmbeddingCacheStats:
+        with self._lock:
+            memory_hits = self._memory_hits
+            disk_hits = self._disk_hits
+            misses = self._misses
+            memory_items = len(self._memory)
+        total = memory_hits + disk_hits + misses
+        return EmbeddingCacheStats(
+            memory_hits=memory_hits,
+            disk_hits=disk_hits,
+            misses=misses,
+            hit_rate=(memory_hits + disk_hits) / total if total else 0.0,
+            memory_items=memory_items,
+            disk_items=self.store.count(),
+            disk_bytes=self.store.total_bytes,
+            max_disk_bytes=self.store.max_bytes,
+        )
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+
+class TTLCache:
+    """带过期时间的内存 LRU，线程安全；用于短时间内重复出现的查询向量等小对象。"""
+
+    def __init__(self, max_items: int = 256, ttl_seconds: float = 300.0):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict[str, Tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        now = time.monotonic()
+        found: Dict[str, object] = {}
+        with self._lock:
+            for key in keys:
+                item = self._items.get(key)
+                if item is None:
+                    continue
+                expires_at, value = item
+                if expires_at <= now:
+                    del self._items[key]
+                    continue
+                self._items.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values: Dict[str, object]) -> None:
+        if self.max_items <= 0 or self.ttl_seconds <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, value in values.items():
+                self._items[key] = (expires_at, value)
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    透明包装 embedding 模型，命中缓存的文本不再请求 embedding 服务。
+
+    query 与 document 共用同一份缓存，要求被包装的模型对两者的向量化方式一致
+    （OpenAIEmbeddings 满足）。
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.set_many(self.model_name, computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.key(self.model_name, text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.set_many(self.model_name, {key: vector})
+        return vector
+
+    def stats(self) -> EmbeddingCacheStats:
+        return self.cache.stats()
+
+
+class TripletCache:
+    """以 (chat 模型, prompt 版本, 分块文本哈希) 为键的三元组抽取结果缓存。"""
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_CACHE_DIR / "triplets.sqlite3",
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.store = SQLiteCacheStore(path, max_bytes=max_bytes)
+
+    @staticmethod
+    def key(model_name: str, prompt_version: str, text: str) -> str:
+        return content_hash(model_name, prompt_version, normalize_text(text))
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        return {
+            key: [tuple(triplet) for triplet in json.loads(value)]
+            for key, value in self.store.get_many(keys).items()
+        }
+
+    def set_many(
+        self, model_name: str, items: Dict[str, List[Tuple[str, str, str]]]
+    ) -> None:
+        self.store.set_many(
+            model_name,
+            {
+                key: json.dumps(triplets, ensure_ascii=False).encode("utf-8")
+                for key, triplets in items.items()
+            },
+        )
+
+    def purge(self, model_name: Optional[str] = None) -> int:
+        deleted = self.store.purge(model_name)
+        logger.info("已清理三元组缓存: model={}, 条数={}", model_name, deleted)
+        return deleted
+
+
+class ConvertedPDFCache:
+    """
+    非 PDF 文件转换结果缓存，以 (转换器版本, 文件后缀, 源文件内容) 的 sha256 为文件名保存。
+
+    PDF 体积较大，直接存为磁盘文件；命中时更新文件 mtime，
+    总大小超过 max_bytes 时按 mtime 从旧到新淘汰。多进程共享同一目录，写入先落临时文件再替换。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = DEFAULT_CACHE_DIR / "converted_pdf",
+        max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(converter_version: str, suffix: str, file_bytes: bytes) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{converter_version}\0{suffix}\0".encode("utf-8"))
+        digest.update(file_bytes)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def set(self, key: str, pdf_bytes: bytes) -> Path:
+        path = self.path(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+        temp_path.write_bytes(pdf_bytes)
+        os.replace(temp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total_bytes = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+            if total_bytes <= self.max_bytes:
+                return
+
+            # 淘汰到上限的 90%，避免每次写入都触发淘汰
+            target = int(self.max_bytes * 0.9)
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+                evicted += 1
+            logger.info("缓存淘汰: path={}, 淘汰条数={}", self.cache_dir, evicted)
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(
+    max_bytes: int = 1024 * 1024 * 1024, memory_items: int = 10000
+) -> EmbeddingCache:
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                max_bytes=max_bytes, memory_items=memory_items
+            )
+        return _embedding_cache
+
+
+_triplet_cache: Optional[TripletCache] = None
+_triplet_cache_lock = threading.Lock()
+
+
+def get_triplet_cache(max_bytes: int = 256 * 1024 * 1024) -> TripletCache:
+    global _triplet_cache
+    with _triplet_cache_lock:
+        if _triplet_cache is None:
+            _triplet_cache = TripletCache(max_bytes=max_bytes)
+        return _triplet_cache
+
+
+_converted_pdf_cache: Optional[ConvertedPDFCache] = None
+_converted_pdf_cache_lock = threading.Lock()
+
+
+def get_converted_pdf_cache(max_bytes: int = 1024 * 1024 * 1024) -> ConvertedPDFCache:
+    global _converted_pdf_cache
+    with _converted_pdf_cache_lock:
+        if _converted_pdf_cache is None:
+            _converted_pdf_cache = ConvertedPDFCache(max_bytes=max_bytes)
+        return _converted_pdf_cache
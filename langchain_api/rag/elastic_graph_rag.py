@@ -1,15 +1,25 @@
 import hashlib
+import time
 import uuid
 from collections import defaultdict
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from langchain_core.documents import Document
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from loguru import logger
 from pydantic import BaseModel, Field
 
+from langchain_api.rag.cache import TripletCache, get_triplet_cache
 from langchain_api.rag.elastic_utils import Elasticsearch
+from langchain_api.rag.entity_matcher import entity_matcher_index
+from langchain_api.rag.graph_index import graph_index
+from langchain_api.rag.text_splitter import estimate_tokens
+from langchain_api.settings import settings
 from langchain_api.utils import get_chat_model
 
+# 修改 TRIPLET_PROMPT/PACKED_TRIPLET_PROMPT 或抽取逻辑时需要升级版本号，使旧的三元组缓存失效
+TRIPLET_PROMPT_VERSION = "v1"
 TRIPLET_PROMPT = """从文本中抽取知识图谱三元组。
 
 要求：
@@ -23,6 +33,20 @@ TRIPLET_PROMPT = """从文本中抽取知识图谱三元组。
 {text}
 """
 
+PACKED_TRIPLET_PROMPT = """从多段文本中分别抽取知识图谱三元组。
+
+要求：
+- 每段文本以 [段落 N] 开头，N 是段落编号，按段落分别返回结果。
+- 只抽取该段文本明确表达的事实，不要补充常识，不要跨段落组合事实。
+- subject/object 使用简洁实体名。
+- predicate 使用简短中文或英文关系短语。
+- 每个段落最多返回 20 个三元组，没有可抽取事实的段落返回空列表。
+- 只返回 JSON，格式：{{"passages":[{{"passage":1,"triplets":[{{"subject":"...","predicate":"...","object":"..."}}]}}]}}
+
+文本：
+{text}
+"""
+
 QUERY_ENTITY_PROMPT = """从问题中抽取检索知识图谱需要的实体名。
 只返回 JSON：{{"entities":["..."]}}
 
@@ -43,6 +67,19 @@ class TripletExtractionResult(BaseModel):
     )
 
 
+class PassageTriplets(BaseModel):
+    passage: int = Field(description="段落编号")
+    triplets: List[ExtractedTriplet] = Field(
+        default_factory=list, description="从该段落中明确抽取出的三元组"
+    )
+
+
+class PackedTripletExtractionResult(BaseModel):
+    passages: List[PassageTriplets] = Field(
+        default_factory=list, description="按段落编号分组的三元组"
+    )
+
+
 class QueryEntityExtractionResult(BaseModel):
     entities: List[str] = Field(default_factory=list, description="问题中的实体名")
 
@@ -50,11 +87,69 @@ class QueryEntityExtractionResult(BaseModel):
 class ElasticGraphRAG:
     """基于 Elasticsearch 的轻量 Vector Graph RAG。"""
 
-    def __init__(self, es: Elasticsearch, graph_name: str, chat_model=None):
+    def __init__(
+        self,
+        es: Elasticsearch,
+        graph_name: str,
+        chat_model=None,
+        extraction_concurrency: Optional[int] = None,
+        extraction_requests_per_second: Optional[float] = None,
+        use_triplet_cache: Optional[bool] = None,
+        pack_extraction: Optional[bool] = None,
+        pack_token_budget: Optional[int] = None,
+        pack_max_passages: Optional[int] = None,
+    ):
+        """
+        extraction_concurrency: 三元组抽取的最大并发 LLM 请求数，默认取配置。
+        extraction_requests_per_second: 三元组抽取的限速（每秒请求数），<=0 表示不限速。
+        use_triplet_cache: 是否读写三元组抽取缓存，默认取配置；False 时总是调用 LLM。
+        pack_extraction: 是否把多个短分块打包进一次抽取请求，默认取配置。
+        pack_token_budget / pack_max_passages: 每次打包请求的估算 token 上限和最多分块数。
+        """
         self.es = es
         self.graph_name = graph_name
         self.chat_model = chat_model
         self.indexes = self.index_names(graph_name)
+        self.extraction_concurrency = max(
+            1,
+            extraction_concurrency
+            if extraction_concurrency is not None
+            else settings.TRIPLET_EXTRACTION_CONCURRENCY,
+        )
+        if extraction_requests_per_second is None:
+            extraction_requests_per_second = settings.TRIPLET_EXTRACTION_RPS
+        self._rate_limiter = (
+            InMemoryRateLimiter(
+                requests_per_second=extraction_requests_per_second,
+                check_every_n_seconds=0.05,
+                max_bucket_size=self.extraction_concurrency,
+            )
+            if extraction_requests_per_second and extraction_requests_per_second > 0
+            else None
+        )
+        if use_triplet_cache is None:
+            use_triplet_cache = settings.TRIPLET_CACHE_ENABLED
+        self.triplet_cache: Optional[TripletCache] = (
+            get_triplet_cache(max_bytes=settings.TRIPLET_CACHE_MAX_MB * 1024 * 1024)
+            if use_triplet_cache
+            else None
+        )
+        self.pack_extraction = (
+            pack_extraction
+            if pack_extraction is not None
+            else settings.TRIPLET_PACKING_ENABLED
+        )
+        self.pack_token_budget = (
+            pack_token_budget
+            if pack_token_budget is not None
+            else settings.TRIPLET_PACK_TOKEN_BUDGET
+        )
+        self.pack_max_passages = max(
+            1,
+            pack_max_passages
+            if pack_max_passages is not None
+            else settings.TRIPLET_PACK_MAX_PASSAGES,
+        )
 
     @staticmethod
     def index_names(prefix: str) -> Dict[str, str]:
@@ -79,14 +174,78 @@ class ElasticGraphRAG:
         return self.add_documents(documents, extract_triplets=extract_triplets)
 
     def add_documents(
-        self, documents: List[Document], extract_triplets: bool = True
+        self,
+        documents: List[Document],
+        extract_triplets: bool = True,
+        progress_callback: Optional[Callable[[str], None]] = None,
     ) -> Dict[str, Any]:
-        """把 Document 转成 passage/entity/relation 三类 ES 向量索引。"""
+        """
+        把 Document 转成 passage/entity/relation 三类 ES 向量索引。
+
+        progress_callback 会依次收到 "extract"、"embed"、"index" 三个阶段名。
+        """
+        self._report_progress(progress_callback, "extract")
         graph = self.build_graph(documents, extract_triplets=extract_triplets)
 
-        self._bulk_upsert(self.indexes["entity"], graph["entities"])
-        self._bulk_upsert(self.indexes["relation"], graph["relations"])
-        self._bulk_upsert(self.indexes["passage"], graph["passages"])
+        # 已存在的实体、关系只合并 id 列表，不重新向量化，也不覆盖其他文档写入的引用
+        entity_index = self.indexes["entity"]
+        relation_index = self.indexes["relation"]
+        existing_entities = self._existing_ids(
+            entity_index, [doc["id"] for doc in graph["entities"]]
+        )
+        existing_relations = self._existing_ids(
+            relation_index, [doc["id"] for doc in graph["relations"]]
+        )
+        new_entities = [
+            doc for doc in graph["entities"] if doc["id"] not in existing_entities
+        ]
+        new_relations = [
+            doc for doc in graph["relations"] if doc["id"] not in existing_relations
+        ]
+
+        self._report_progress(progress_callback, "embed")
+        groups = [
+            (entity_index, new_entities),
+            (relation_index, new_relations),
+            (self.indexes["passage"], graph["passages"]),
+        ]
+        embeddings = [self._embed_docs(index_name, docs) for index_name, docs in groups]
+
+        self._report_progress(progress_callback, "index")
+        merge_fields = {
+            entity_index: ("relation_ids", "passage_ids"),
+            relation_index: ("entity_ids", "passage_ids"),
+        }
+        for (index_name, docs), doc_embeddings in zip(groups, embeddings):
+            conflicts = self._bulk_index(
+                index_name,
+                docs,
+                doc_embeddings,
+                create_only=index_name in merge_fields,
+            )
+            if conflicts:
+                # 并发入库时其他任务先创建了同一实体/关系，退回合并
+                conflict_ids = set(conflicts)
+                self._bulk_merge_metadata(
+                    index_name,
+                    [doc for doc in docs if doc["id"] in conflict_ids],
+                    merge_fields[index_name],
+                )
+        self._bulk_merge_metadata(
+            entity_index,
+            [doc for doc in graph["entities"] if doc["id"] in existing_entities],
+            merge_fields[entity_index],
+        )
+        self._bulk_merge_metadata(
+            relation_index,
+            [doc for doc in graph["relations"] if doc["id"] in existing_relations],
+            merge_fields[relation_index],
+        )
+
+        self._invalidate_graph_index()
+        entity_matcher_index.add(
+            entity_index, [(doc["id"], doc["content"]) for doc in new_entities]
+        )
 
         result = {
             "graph_name": self.graph_name,
@@ -136,6 +295,8 @@ class ElasticGraphRAG:
 
             self.es.es_client.indices.delete(index=index_name)
             deleted[kind] = "deleted"
+        self._invalidate_graph_index()
+        entity_matcher_index.invalidate(self.indexes["entity"])
 
         return {
             "graph_name": self.graph_name,
@@ -178,6 +339,8 @@ class ElasticGraphRAG:
 
         if deleted_relations:
             self._detach_relation_ids_from_entities(deleted_relations)
+        self._invalidate_graph_index()
+        entity_matcher_index.remove(self.indexes["entity"], deleted_entities)
 
         return {
             "deleted_passages": deleted_passages,
@@ -186,6 +349,22 @@ class ElasticGraphRAG:
             "detached_relations": len(kept_relation_ids),
         }
 
+    def update_passage_metadata(self, documents: List[Document]) -> int:
+        """
+        只更新已有 passage 的 metadata（局部合并），不重新向量化、不重新抽取三元组。
+
+        用于文档替换时内容未变化的分块，例如分块序号、页码、文件名变化。
+        """
+        if not documents:
+            return 0
+        index_name = self.indexes["passage"]
+        operations = []
+        for document in documents:
+            operations.append({"update": {"_index": index_name, "_id": str(document.id)}})
+            operations.append({"doc": {"metadata": dict(document.metadata or {})}})
+        self.es.es_client.bulk(operations=operations, refresh=True)
+        return len(documents)
+
     def delete_by_query(self, query: str) -> Dict[str, Any]:
         """先检索 passage，再按召回到的 passage id 删除。"""
         result = self.retrieve(query=query, k=100, return_debug=False)
@@ -209,10 +388,11 @@ class ElasticGraphRAG:
         relation_triplets: Dict[str, Tuple[str, str, str]] = {}
 
         for document in documents:
-            passage_id = str(document.id or uuid.uuid4())
-            document.id = passage_id
-            triplets = self._get_document_triplets(document, extract_triplets)
+            document.id = str(document.id or uuid.uuid4())
+        document_triplets = self._get_documents_triplets(documents, extract_triplets)
 
+        for document, triplets in zip(documents, document_triplets):
+            passage_id = document.id
             for subject, predicate, object_ in triplets:
                 subject_id = self._get_entity_id(subject, entity_name_to_id)
                 object_id = self._get_entity_id(object_, entity_name_to_id)
@@ -320,17 +500,177 @@ class ElasticGraphRAG:
             )
         return docs
 
-    def _get_document_triplets(
-        self, document: Document, extract_triplets: bool
-    ) -> List[Tuple[str, str, str]]:
-        raw_triplets = document.metadata.get("triplets") if document.metadata else None
-        if raw_triplets:
-            return self._parse_triplets(raw_triplets)
-        if not extract_triplets:
+    def _get_documents_triplets(
+        self, documents: List[Document], extract_triplets: bool
+    ) -> List[List[Tuple[str, str, str]]]:
+        """按 documents 的顺序返回每个 passage 的三元组，需要 LLM 抽取的并发执行。"""
+        results: List[List[Tuple[str, str, str]]] = []
+        pending: List[int] = []
+        for index, document in enumerate(documents):
+            raw_triplets = document.metadata.get("triplets") if document.metadata else None
+            if raw_triplets:
+                results.append(self._parse_triplets(raw_triplets))
+                continue
+            results.append([])
+            if extract_triplets:
+                pending.append(index)
+
+        extracted = self._extract_triplets_cached(
+            [documents[index].page_content for index in pending]
+        )
+        for index, triplets in zip(pending, extracted):
+            results[index] = triplets
+        return results
+
+    def _extract_triplets_cached(
+        self, texts: List[str]
+    ) -> List[List[Tuple[str, str, str]]]:
+        if self.triplet_cache is None or not texts:
+            return self._extract_triplets_concurrently(texts)
+
+        model_name = self._chat_model_name()
+        # 打包与逐个抽取的 prompt 不同，结果分开缓存
+        prompt_version = (
+            f"{TRIPLET_PROMPT_VERSION}-packed"
+            if self.pack_extraction
+            else TRIPLET_PROMPT_VERSION
+        )
+        keys = [TripletCache.key(model_name, prompt_version, text) for text in texts]
+        cached = self.triplet_cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        logger.info(
+            "三元组缓存: graph={}, 分块数={}, 命中={}, 需抽取={}",
+            self.graph_name,
+            len(texts),
+            sum(1 for key in keys if key in cached),
+            len(missing),
+        )
+        if missing:
+            extracted = dict(
+                zip(
+                    missing.keys(),
+                    self._extract_triplets_concurrently(list(missing.values())),
+                )
+            )
+            self.triplet_cache.set_many(model_name, extracted)
+            cached.update(extracted)
+
+        return [list(cached[key]) for key in keys]
+
+    def _extract_triplets_concurrently(
+        self, texts: List[str]
+    ) -> List[List[Tuple[str, str, str]]]:
+        if not texts:
             return []
-        return self._extract_triplets(document.page_content)
+
+        started_at = time.perf_counter()
+        self._get_chat_model()
+        groups = (
+            self._pack_texts(texts)
+            if self.pack_extraction
+            else [[index] for index in range(len(texts))]
+        )
+        max_workers = min(self.extraction_concurrency, len(groups))
+        group_texts = [[texts[index] for index in group] for group in groups]
+        if max_workers == 1:
+            group_results = [self._extract_group_triplets(item) for item in group_texts]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # executor.map 按输入顺序返回，保证图中 passage 顺序与分块顺序一致
+                group_results = list(
+                    executor.map(self._extract_group_triplets, group_texts)
+                )
+
+        results: List[List[Tuple[str, str, str]]] = [[] for _ in texts]
+        for group, triplets_list in zip(groups, group_results):
+            for index, triplets in zip(group, triplets_list):
+                results[index] = triplets
+
+        logger.info(
+            "三元组抽取完成: graph={}, 分块数={}, LLM请求数={}, 并发={}, 耗时={:.2f}s",
+            self.graph_name,
+            len(texts),
+            len(groups),
+            max_workers,
+            time.perf_counter() - started_at,
+        )
+        return results
+
+    def _pack_texts(self, texts: List[str]) -> List[List[int]]:
+        """按顺序把分块贪心打包，每包不超过 token 预算和最大分块数；超预算的分块单独成包。"""
+        groups: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (
+                current_tokens + tokens > self.pack_token_budget
+                or len(current) >= self.pack_max_passages
+            ):
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def _extract_group_triplets(
+        self, texts: List[str]
+    ) -> List[List[Tuple[str, str, str]]]:
+        if len(texts) == 1:
+            return [self._extract_triplets(texts[0])]
+        try:
+            return self._extract_packed_triplets(texts)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("打包三元组抽取失败，逐个分块重新抽取: {}", exc)
+            return [self._extract_triplets(text) for text in texts]
+
+    def _extract_packed_triplets(
+        self, texts: List[str]
+    ) -> List[List[Tuple[str, str, str]]]:
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        model = self._get_chat_model().with_structured_output(
+            PackedTripletExtractionResult, method="json_mode"
+        )
+        packed_text = "\n\n".join(
+            f"[段落 {number}]\n{text}" for number, text in enumerate(texts, start=1)
+        )
+        result: PackedTripletExtractionResult = model.invoke(
+            PACKED_TRIPLET_PROMPT.format(text=packed_text)
+        )
+
+        triplets_by_passage: List[List[Tuple[str, str, str]]] = [[] for _ in texts]
+        returned: Set[int] = set()
+        for passage in result.passages:
+            if not 1 <= passage.passage <= len(texts):
+                continue
+            returned.add(passage.passage - 1)
+            triplets_by_passage[passage.passage - 1].extend(
+                (triplet.subject, triplet.predicate, triplet.object)
+                for triplet in passage.triplets
+                if triplet.subject and triplet.predicate and triplet.object
+            )
+
+        # LLM 漏掉的段落不能当作没有三元组（会被缓存），逐个重新抽取
+        missing = [index for index in range(len(texts)) if index not in returned]
+        if missing:
+            logger.warning(
+                "打包三元组抽取缺少 {} 个段落的结果，逐个重新抽取", len(missing)
+            )
+            for index in missing:
+                triplets_by_passage[index] = self._extract_triplets(texts[index])
+        return triplets_by_passage
 
     def _extract_triplets(self, text: str) -> List[Tuple[str, str, str]]:
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
         model = self._get_chat_model().with_structured_output(
             TripletExtractionResult, method="json_mode"
         )
@@ -343,6 +683,14 @@ class ElasticGraphRAG:
 
     def _extract_query_entities(self, query: str) -> List[str]:
         try:
+            # 先用知识库实体名称词典匹配，匹配不到时才调用 LLM 抽取
+            if settings.ENTITY_MATCHER_ENABLED:
+                entities = entity_matcher_index.match(
+                    self.es.es_client, self.indexes["entity"], query
+                )
+                if entities:
+                    logger.debug("查询实体词典匹配: {}", entities)
+                    return entities
             model = self._get_chat_model().with_structured_output(
                 QueryEntityExtractionResult, method="json_mode"
             )
@@ -357,20 +705,34 @@ class ElasticGraphRAG:
             return self._simple_extract_entities(query)
 
     def _bulk_upsert(self, index_name: str, docs: List[Dict[str, Any]]) -> None:
+        self._bulk_index(index_name, docs, self._embed_docs(index_name, docs))
+
+    def _embed_docs(
+        self, index_name: str, docs: List[Dict[str, Any]]
+    ) -> List[List[float]]:
+        return self.es.embed_documents(
+            [doc["content"] for doc in docs], log_label=index_name
+        )
+
+    def _bulk_index(
+        self,
+        index_name: str,
+        docs: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        create_only: bool = False,
+    ) -> List[str]:
+        """
+        批量写入文档；create_only 时已存在的文档不会被覆盖，返回这些冲突的 id。
+        """
         if not docs:
-            return
+            return []
 
-        first_embedding = self.es.embedding_model.embed_query(docs[0]["content"])
-        self._ensure_index(index_name, len(first_embedding))
+        self._ensure_index(index_name, len(embeddings[0]))
 
+        op_type = "create" if create_only else "index"
         operations = []
-        for index, doc in enumerate(docs):
-            embedding = (
-                first_embedding
-                if index == 0
-                else self.es.embedding_model.embed_query(doc["content"])
-            )
-            operations.append({"index": {"_index": index_name, "_id": doc["id"]}})
+        for doc, embedding in zip(docs, embeddings):
+            operations.append({op_type: {"_index": index_name, "_id": doc["id"]}})
             operations.append(
                 {
                     "content": doc["content"],
@@ -379,6 +741,73 @@ class ElasticGraphRAG:
                 }
             )
 
+        result = self.es.es_client.bulk(operations=operations, refresh=True)
+        return [
+            item[op_type]["_id"]
+            for item in result.get("items", [])
+            if item.get(op_type, {}).get("status") == 409
+        ]
+
+    def _existing_ids(self, index_name: str, doc_ids: List[str]) -> set:
+        if not doc_ids or not self.es.es_client.indices.exists(index=index_name):
+            return set()
+        existing = set()
+        for start in range(0, len(doc_ids), 1000):
+            result = self.es.es_client.mget(
+                index=index_name,
+                ids=doc_ids[start : start + 1000],
+                source=False,
+            )
+            existing.update(doc["_id"] for doc in result["docs"] if doc.get("found"))
+        return existing
+
+    def _bulk_merge_metadata(
+        self,
+        index_name: str,
+        docs: List[Dict[str, Any]],
+        list_fields: Tuple[str, ...],
+    ) -> None:
+        """把 docs 中的 id 列表并入已存在文档的 metadata（脚本更新，保证并发安全）。"""
+        if not docs:
+            return
+
+        script = (
+            "for (field in params.fields) {"
+            " def current = ctx._source.metadata[field];"
+            " if (current == null) { current = new ArrayList(); }"
+            " else if (!(current instanceof List)) { current = [current]; }"
+            " for (value in params.values[field]) {"
+            "  if (!current.contains(value)) { current.add(value); }"
+            " }"
+            " ctx._source.metadata[field] = current;"
+            "}"
+        )
+        operations = []
+        for doc in docs:
+            metadata = doc.get("metadata", {})
+            operations.append(
+                {
+                    "update": {
+                        "_index": index_name,
+                        "_id": doc["id"],
+                        "retry_on_conflict": 3,
+                    }
+                }
+            )
+            operations.append(
+                {
+                    "script": {
+                        "source": script,
+                        "lang": "painless",
+                        "params": {
+                            "fields": list(list_fields),
+                            "values": {
+                                field: metadata.get(field, []) for field in list_fields
+                            },
+                        },
+                    }
+                }
+            )
         self.es.es_client.bulk(operations=operations, refresh=True)
 
     def _ensure_index(self, index_name: str, dims: int) -> None:
@@ -423,11 +852,30 @@ class ElasticGraphRAG:
             },
         )
 
+    def _invalidate_graph_index(self) -> None:
+        # 实体、关系有变化时丢弃本进程内的图快照，下次检索重新构建
+        graph_index.invalidate(self.indexes["entity"], self.indexes["relation"])
+
+    @staticmethod
+    def _report_progress(
+        progress_callback: Optional[Callable[[str], None]], stage: str
+    ) -> None:
+        if progress_callback is not None:
+            progress_callback(stage)
+
     def _get_chat_model(self):
         if self.chat_model is None:
             self.chat_model = get_chat_model()
         return self.chat_model
 
+    def _chat_model_name(self) -> str:
+        model = self._get_chat_model()
+        return str(
+            getattr(model, "model_name", None)
+            or getattr(model, "model", None)
+            or type(model).__name__
+        )
+
     def _search_by_terms(
         self, index_name: str, field: str, values: List[str], size: int
     ) -> List[Dict[str, Any]]:
@@ -564,8 +1012,6 @@ class ElasticGraphRAG:
 if __name__ == "__main__":
     from pprint import pprint
 
-    from langchain_api.settings import settings
-
     es = Elasticsearch(
         url=settings.ES_URL,
         username=settings.ES_URSR,
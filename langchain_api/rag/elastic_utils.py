@@ -1,8 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from elasticsearch import Elasticsearch as ESClient
 from loguru import logger
 
+from langchain_api.rag.cache import TTLCache
+from langchain_api.rag.fusion import rrf_scores
+from langchain_api.rag.graph_index import GraphIndex
+
+
+class QueryEmbeddingContext:
+    """
+    单次检索内的查询向量表：每个不同的字符串最多向量化一次。
+
+    prefetch 把多个字符串一起（并发）向量化；get 对未预取的字符串按需向量化。
+    """
+
+    def __init__(self, es: "Elasticsearch"):
+        self._es = es
+        self._vectors: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def prefetch(self, texts: Iterable[str]) -> None:
+        missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            self._vectors.update(self._es.embed_queries(missing))
+
+    def get(self, text: str) -> List[float]:
+        self.prefetch([text])
+        return self._vectors[text]
+
+
+class RetrievalContext:
+    """
+    单次向量图检索的请求级状态。
+
+    embeddings 为本次检索的查询向量表；docs 缓存已按 id 取回的图文档
+    （(索引, id) -> 文档，未找到为 None），扩展多步时不重复读取；
+    round_trips 统计本次检索发出的 ES 请求数。
+    """
+
+    def __init__(self, es: "Elasticsearch"):
+        self.embeddings = QueryEmbeddingContext(es)
+        self.docs: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self.round_trips = 0
+
 
 class Elasticsearch:
     def __init__(
@@ -11,12 +56,27 @@ class Elasticsearch:
         username: Optional[str] = None,
         password: Optional[str] = None,
         embedding_model=None,
+        embedding_batch_size: int = 64,
+        embedding_concurrency: int = 4,
+        embedding_max_retries: int = 2,
+        query_cache_items: int = 256,
+        query_cache_ttl: float = 300.0,
+        graph_index: Optional[GraphIndex] = None,
     ):
         self._url = url
         self._username = username
         self._password = password
         self._embedding_model = embedding_model
+        self._embedding_batch_size = max(1, embedding_batch_size)
+        self._embedding_concurrency = max(1, embedding_concurrency)
+        self._embedding_max_retries = max(0, embedding_max_retries)
         self._es_client: Optional[ESClient] = None
+        # 短时间内重复的查询直接复用向量，如多轮对话中改写后相同的问题
+        self._query_cache = TTLCache(
+            max_items=query_cache_items, ttl_seconds=query_cache_ttl
+        )
+        # 提供时多跳扩展在知识库图的内存快照上完成，不再逐步查询 ES
+        self._graph_index = graph_index
 
     @property
     def embedding_model(self):
@@ -37,6 +97,106 @@ class Elasticsearch:
             )
         return self._es_client
 
+    def embed_documents(
+        self, texts: List[str], log_label: Optional[str] = None
+    ) -> List[List[float]]:
+        """
+        按批调用 embedding_model.embed_documents。
+
+        批与批之间最多 embedding_concurrency 个并发请求；某些批失败时只重试失败的批，
+        重试 embedding_max_retries 次后仍失败则抛出异常。
+        """
+        if not texts:
+            return []
+
+        started_at = time.perf_counter()
+        batch_size = self._embedding_batch_size
+        pending = [
+            (start, texts[start : start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ]
+        batch_count = len(pending)
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self._embedding_max_retries + 1):
+            if attempt:
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 8))
+                logger.warning(
+                    "向量化重试: 第{}次, 失败批次={}, label={}",
+                    attempt,
+                    len(pending),
+                    log_label,
+                )
+
+            failed = []
+            max_workers = min(self._embedding_concurrency, len(pending))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self.embedding_model.embed_documents, batch): (
+                        start,
+                        batch,
+                    )
+                    for start, batch in pending
+                }
+                for future in as_completed(futures):
+                    start, batch = futures[future]
+                    try:
+                        vectors = future.result()
+                        if len(vectors) != len(batch):
+                            raise ValueError(
+                                f"embedding 数量不匹配: 期望 {len(batch)}, 实际 {len(vectors)}"
+                            )
+                    except Exception as exc:  # noqa: BLE001
+                        last_error = exc
+                        failed.append((start, batch))
+                        continue
+                    embeddings[start : start + len(batch)] = vectors
+
+            if not failed:
+                break
+            pending = failed
+        else:
+            raise RuntimeError(
+                f"向量化失败: {len(pending)} 个批次重试后仍失败, label={log_label}"
+            ) from last_error
+
+        elapsed = time.perf_counter() - started_at
+        logger.info(
+            "向量化完成: label={}, 数量={}, 批次={}, 耗时={:.2f}s, 吞吐={:.1f}条/秒",
+            log_label,
+            len(texts),
+            batch_count,
+            elapsed,
+            len(texts) / elapsed if elapsed > 0 else float("inf"),
+        )
+        return embeddings
+
+    def embed_queries(self, texts: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        向量化查询字符串，返回 文本 -> 向量。
+
+        query_cache_ttl 秒内出现过的文本直接复用；未命中的文本都用 embed_query
+        向量化（部分模型对 query 与 document 的向量化方式不同），多个时最多
+        embedding_concurrency 个并发请求。
+        """
+        texts = list(dict.fromkeys(texts))
+        found: Dict[str, List[float]] = self._query_cache.get_many(texts)
+        missing = [text for text in texts if text not in found]
+        if len(missing) > 1:
+            max_workers = min(self._embedding_concurrency, len(missing))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                computed = dict(
+                    zip(missing, executor.map(self.embedding_model.embed_query, missing))
+                )
+        else:
+            computed = {
+                text: self.embedding_model.embed_query(text) for text in missing
+            }
+        self._query_cache.set_many(computed)
+        found.update(computed)
+        return found
+
     def vector_search(
         self,
         query: str,
@@ -46,19 +206,9 @@ class Elasticsearch:
     ) -> List[Dict[str, Any]]:
         if not index_name:
             raise ValueError("index_name is required for search operations")
-        query_vector = self.embedding_model.embed_query(query)
+        query_vector = self.embed_queries([query])[query]
         results = self.es_client.search(
-            index=index_name,
-            body={
-                "query": {
-                    "knn": {
-                        "field": "embedding",
-                        "query_vector": query_vector,
-                        "num_candidates": k * 2,
-                    }
-                }
-            },
-            size=k,
+            index=index_name, body=self._knn_body(query_vector, k)
         )
         processed_results = []
         for hit in results["hits"]["hits"]:
@@ -80,18 +230,7 @@ class Elasticsearch:
         if not index_name:
             raise ValueError("index_name is required for search operations")
         results = self.es_client.search(
-            index=index_name,
-            body={
-                "query": {
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["content", "title", "summary"],
-                        "type": "best_fields",
-                        "boost": 0.3,
-                    }
-                }
-            },
-            size=k,
+            index=index_name, body=self._keyword_body(query, k)
         )
         return [
             {
@@ -102,32 +241,72 @@ class Elasticsearch:
         ]
 
     def retrieve(
-        self, query: str, k: int = 3, index_name: Optional[str] = None
+        self,
+        query: str,
+        k: int = 3,
+        index_name: Optional[str] = None,
+        vector_weight: float = 0.5,
+        keyword_weight: float = 0.5,
+        rrf_k: int = 60,
+        query_vector: Optional[List[float]] = None,
     ) -> List[Dict[str, Any]]:
+        """
+        混合检索：向量 knn 与 BM25 multi_match 通过一次 _msearch 发给 ES，
+        再按 ES 文档 id 做加权 RRF 融合。
+
+        返回结果中 score 为融合分数，vector_score / keyword_score 为两路各自的
+        原始分数（该路未召回时为 None）。query_vector 已知时不再向量化 query。
+        """
         if not index_name:
             raise ValueError("index_name is required for retrieve operations")
-        vector_results = self.vector_search(query, k, index_name)
-        keyword_results = self.keyword_search(query, k, index_name)
+        if query_vector is None:
+            query_vector = self.embed_queries([query])[query]
+        response = self.es_client.msearch(
+            searches=[
+                {"index": index_name},
+                self._knn_body(query_vector, k),
+                {"index": index_name},
+                self._keyword_body(query, k),
+            ]
+        )
+        vector_hits, keyword_hits = [
+            self._msearch_hits(item, label)
+            for item, label in zip(response["responses"], ("向量检索", "关键字检索"))
+        ]
 
-        seen_contents = set()
+        vector_scores = {hit["_id"]: hit["_score"] for hit in vector_hits}
+        keyword_scores = {hit["_id"]: hit["_score"] for hit in keyword_hits}
         merged_results = []
-        for doc in vector_results:
-            content_hash = hash(doc.get("content", ""))
-            if content_hash not in seen_contents:
-                seen_contents.add(content_hash)
-                merged_results.append(doc)
-
-        for doc in keyword_results:
-            content_hash = hash(doc.get("content", ""))
-            if content_hash not in seen_contents:
-                seen_contents.add(content_hash)
-                merged_results.append(doc)
+        for hit, score in rrf_scores(
+            [vector_hits, keyword_hits],
+            weights=(vector_weight, keyword_weight),
+            k=rrf_k,
+            key=lambda hit: hit["_id"],
+        ):
+            merged_results.append(
+                {
+                    "id": hit["_id"],
+                    "content": hit["_source"].get("content", ""),
+                    "metadata": hit["_source"].get("metadata", {}),
+                    "score": score,
+                    "vector_score": vector_scores.get(hit["_id"]),
+                    "keyword_score": keyword_scores.get(hit["_id"]),
+                }
+            )
 
         logger.info(
-            f"ES检索结果数量：向量检索{len(vector_results)}，关键字检索{len(keyword_results)}，合并后{len(merged_results)}"
+            f"ES检索结果数量：向量检索{len(vector_hits)}，关键字检索{len(keyword_hits)}，合并后{len(merged_results)}"
         )
         return merged_results[:k]
 
+    @staticmethod
+    def _msearch_hits(item: Dict[str, Any], label: str) -> List[Dict[str, Any]]:
+        # _msearch 中单个查询失败不会抛异常，只在对应结果里带 error，这里降级为空结果
+        if "error" in item:
+            logger.warning("ES {}失败：{}", label, item["error"])
+            return []
+        return item["hits"]["hits"]
+
     def vector_graph_retrieve(
         self,
         query: str,
@@ -167,17 +346,19 @@ class Elasticsearch:
         relation_index_name = relation_index_name or index_name
         query_entities = query_entities or self._simple_extract_entities(query)
 
-        seed_entities = self._search_graph_items(
-            texts=query_entities,
-            index_name=entity_index_name,
-            k=entity_top_k,
-            min_similarity=min_similarity,
-        )
-        seed_relations = self._search_graph_items(
-            texts=[query],
-            index_name=relation_index_name,
-            k=relation_top_k,
+        context = RetrievalContext(self)
+        # 查询和所有查询实体合并为一次向量化，后续各阶段都从这里取向量
+        embeddings = context.embeddings
+        embeddings.prefetch(text for text in [query, *query_entities] if text.strip())
+
+        # 实体、关系种子检索合并为一次 _msearch
+        seed_entities, seed_relations = self._search_graph_items(
+            [
+                (query_entities, entity_index_name, entity_top_k),
+                ([query], relation_index_name, relation_top_k),
+            ],
             min_similarity=min_similarity,
+            context=context,
         )
 
         entity_ids = self._ids_from_hits(seed_entities)
@@ -189,6 +370,7 @@ class Elasticsearch:
             entity_index_name=entity_index_name,
             relation_index_name=relation_index_name,
             degree=expansion_degree,
+            context=context,
         )
 
         kept_relations, eviction = self._evict_relations_by_vector(
@@ -196,6 +378,7 @@ class Elasticsearch:
             relation_ids=expanded_relation_ids,
             relation_index_name=relation_index_name,
             limit=relation_limit,
+            context=context,
         )
 
         passages = self._search_passages_by_graph(
@@ -204,19 +387,27 @@ class Elasticsearch:
             relation_ids=kept_relations,
             entity_ids=expanded_entity_ids,
             k=k,
+            context=context,
         )
 
         if not passages:
-            passages = self.retrieve(query=query, k=k, index_name=index_name)
+            passages = self.retrieve(
+                query=query,
+                k=k,
+                index_name=index_name,
+                query_vector=embeddings.get(query),
+            )
+            self._track(context)
 
         logger.info(
-            "ES向量图RAG: query_entities={}, seed_entities={}, seed_relations={}, expanded_entities={}, expanded_relations={}, passages={}",
+            "ES向量图RAG: query_entities={}, seed_entities={}, seed_relations={}, expanded_entities={}, expanded_relations={}, passages={}, es_round_trips={}",
             len(query_entities),
             len(entity_ids),
             len(relation_ids),
             len(expanded_entity_ids),
             len(expanded_relation_ids),
             len(passages),
+            context.round_trips,
         )
 
         if not return_debug:
@@ -233,29 +424,47 @@ class Elasticsearch:
             "kept_relation_ids": kept_relations,
             "eviction": eviction,
             "expansion_steps": expansion_steps,
+            "embedded_texts": len(embeddings),
+            "es_round_trips": context.round_trips,
         }
 
     def _search_graph_items(
         self,
-        texts: List[str],
-        index_name: str,
-        k: int,
+        groups: List[Tuple[List[str], str, int]],
         min_similarity: Optional[float] = None,
-    ) -> List[Dict[str, Any]]:
-        hits: List[Dict[str, Any]] = []
-        seen_ids: Set[str] = set()
-
-        for text in texts:
-            if not text.strip():
-                continue
-            for item in self._vector_search_raw(text, k, index_name, min_similarity):
-                item_id = item["id"]
-                if item_id in seen_ids:
+        context: Optional[RetrievalContext] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量向量召回图节点：groups 中每项为 (文本列表, 索引, k)，
+        所有文本的 kNN 查询通过一次 _msearch 发出，按组返回去重后的结果。
+        """
+        embeddings = context.embeddings if context else QueryEmbeddingContext(self)
+        searches: List[Dict[str, Any]] = []
+        owners: List[int] = []
+        for group_index, (texts, index_name, k) in enumerate(groups):
+            for text in texts:
+                if not text.strip():
                     continue
-                seen_ids.add(item_id)
-                hits.append(item)
-
-        return hits
+                searches.append({"index": index_name})
+                searches.append(self._knn_body(embeddings.get(text), k))
+                owners.append(group_index)
+
+        grouped_hits: List[List[Dict[str, Any]]] = [[] for _ in groups]
+        if not searches:
+            return grouped_hits
+
+        response = self.es_client.msearch(searches=searches)
+        self._track(context)
+        seen_ids: List[Set[str]] = [set() for _ in groups]
+        for group_index, item in zip(owners, response["responses"]):
+            for hit in self._knn_hits(
+                self._msearch_hits(item, "图节点向量检索"), min_similarity
+            ):
+                if hit["id"] in seen_ids[group_index]:
+                    continue
+                seen_ids[group_index].add(hit["id"])
+                grouped_hits[group_index].append(hit)
+        return grouped_hits
 
     def _vector_search_raw(
         self,
@@ -264,8 +473,22 @@ class Elasticsearch:
         index_name: str,
         min_similarity: Optional[float] = None,
         ids: Optional[List[str]] = None,
+        query_vector: Optional[List[float]] = None,
+        context: Optional[RetrievalContext] = None,
     ) -> List[Dict[str, Any]]:
-        query_vector = self.embedding_model.embed_query(query)
+        if query_vector is None:
+            query_vector = self.embed_queries([query])[query]
+        results = self.es_client.search(
+            index=index_name,
+            body=self._knn_body(query_vector, k, ids),
+        )
+        self._track(context)
+        return self._knn_hits(results["hits"]["hits"], min_similarity)
+
+    @staticmethod
+    def _knn_body(
+        query_vector: List[float], k: int, ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
         knn_query: Dict[str, Any] = {
             "field": "embedding",
             "query_vector": query_vector,
@@ -281,15 +504,28 @@ class Elasticsearch:
                     "minimum_should_match": 1,
                 }
             }
+        return {"query": {"knn": knn_query}, "size": k}
 
-        results = self.es_client.search(
-            index=index_name,
-            body={"query": {"knn": knn_query}},
-            size=k,
-        )
+    @staticmethod
+    def _keyword_body(query: str, k: int) -> Dict[str, Any]:
+        return {
+            "query": {
+                "multi_match": {
+                    "query": query,
+                    "fields": ["content", "title", "summary"],
+                    "type": "best_fields",
+                    "boost": 0.3,
+                }
+            },
+            "size": k,
+        }
 
+    @staticmethod
+    def _knn_hits(
+        raw_hits: List[Dict[str, Any]], min_similarity: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
         hits = []
-        for hit in results["hits"]["hits"]:
+        for hit in raw_hits:
             score = hit["_score"]
             if min_similarity is not None and score < min_similarity:
                 continue
@@ -313,7 +549,15 @@ class Elasticsearch:
         entity_index_name: str,
         relation_index_name: str,
         degree: int,
+        context: Optional[RetrievalContext] = None,
     ) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        if self._graph_index is not None and entity_index_name != relation_index_name:
+            snapshot = self._graph_index.get(
+                self.es_client, entity_index_name, relation_index_name
+            )
+            if snapshot is not None:
+                return snapshot.expand(entity_ids, relation_ids, degree)
+
         all_entity_ids = set(entity_ids)
         all_relation_ids = set(relation_ids)
         steps: List[Dict[str, Any]] = []
@@ -322,6 +566,7 @@ class Elasticsearch:
             entity_ids=list(all_entity_ids),
             entity_index_name=entity_index_name,
             relation_index_name=relation_index_name,
+            context=context,
         )
         new_relation_ids = relation_ids_from_seed_entities - all_relation_ids
         all_relation_ids.update(new_relation_ids)
@@ -335,8 +580,11 @@ class Elasticsearch:
         )
 
         for step in range(1, degree + 1):
+            # context 缓存了已读取的关系，每步实际只 mget 新增的关系
             found_entity_ids = self._entities_by_relations(
-                relation_ids=list(all_relation_ids), relation_index_name=relation_index_name
+                relation_ids=list(all_relation_ids),
+                relation_index_name=relation_index_name,
+                context=context,
             )
             new_entity_ids = found_entity_ids - all_entity_ids
             all_entity_ids.update(new_entity_ids)
@@ -345,6 +593,7 @@ class Elasticsearch:
                 entity_ids=list(new_entity_ids),
                 entity_index_name=entity_index_name,
                 relation_index_name=relation_index_name,
+                context=context,
             )
             new_relation_ids = found_relation_ids - all_relation_ids
             all_relation_ids.update(new_relation_ids)
@@ -368,9 +617,10 @@ class Elasticsearch:
         entity_ids: List[str],
         entity_index_name: str,
         relation_index_name: str,
+        context: Optional[RetrievalContext] = None,
     ) -> Set[str]:
         relation_ids: Set[str] = set()
-        for entity in self._get_docs_by_ids(entity_index_name, entity_ids):
+        for entity in self._get_docs_by_ids(entity_index_name, entity_ids, context):
             relation_ids.update(self._metadata_list(entity, "relation_ids"))
 
         if relation_ids:
@@ -381,15 +631,21 @@ class Elasticsearch:
             field="metadata.entity_ids",
             values=entity_ids,
             size=max(len(entity_ids) * 20, 50),
+            context=context,
         ):
             relation_ids.add(relation["id"])
         return relation_ids
 
     def _entities_by_relations(
-        self, relation_ids: List[str], relation_index_name: str
+        self,
+        relation_ids: List[str],
+        relation_index_name: str,
+        context: Optional[RetrievalContext] = None,
     ) -> Set[str]:
         entity_ids: Set[str] = set()
-        for relation in self._get_docs_by_ids(relation_index_name, relation_ids):
+        for relation in self._get_docs_by_ids(
+            relation_index_name, relation_ids, context
+        ):
             entity_ids.update(self._metadata_list(relation, "entity_ids"))
         return entity_ids
 
@@ -399,6 +655,7 @@ class Elasticsearch:
         relation_ids: List[str],
         relation_index_name: str,
         limit: int,
+        context: Optional[RetrievalContext] = None,
     ) -> Tuple[List[str], Dict[str, Any]]:
         before_count = len(relation_ids)
         if before_count <= limit:
@@ -415,6 +672,8 @@ class Elasticsearch:
                 k=limit,
                 index_name=relation_index_name,
                 ids=relation_ids,
+                query_vector=context.embeddings.get(query) if context else None,
+                context=context,
             )
         ]
         return kept, {
@@ -430,6 +689,7 @@ class Elasticsearch:
         relation_ids: List[str],
         entity_ids: List[str],
         k: int,
+        context: Optional[RetrievalContext] = None,
     ) -> List[Dict[str, Any]]:
         should_clauses = []
         if relation_ids:
@@ -462,13 +722,46 @@ class Elasticsearch:
             },
             size=k,
         )
+        self._track(context)
         return [self._hit_to_result(hit) for hit in results["hits"]["hits"]]
 
-    def _get_docs_by_ids(self, index_name: str, doc_ids: Iterable[str]) -> List[Dict[str, Any]]:
-        ids = [doc_id for doc_id in doc_ids if doc_id]
+    def _get_docs_by_ids(
+        self,
+        index_name: str,
+        doc_ids: Iterable[str],
+        context: Optional[RetrievalContext] = None,
+    ) -> List[Dict[str, Any]]:
+        ids = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
         if not ids:
             return []
+        cache = context.docs if context is not None else {}
+        pending = [doc_id for doc_id in ids if (index_name, doc_id) not in cache]
+        if pending:
+            for doc_id in pending:
+                cache[(index_name, doc_id)] = None
+            for doc in self._fetch_docs_by_ids(index_name, pending, context):
+                cache[(index_name, doc["id"])] = doc
+                alias = doc["metadata"].get("id")
+                if alias is not None:
+                    cache[(index_name, str(alias))] = doc
+
+        docs = []
+        seen: Set[int] = set()
+        for doc_id in ids:
+            doc = cache[(index_name, doc_id)]
+            if doc is not None and id(doc) not in seen:
+                seen.add(id(doc))
+                docs.append(doc)
+        return docs
+
+    def _fetch_docs_by_ids(
+        self,
+        index_name: str,
+        ids: List[str],
+        context: Optional[RetrievalContext] = None,
+    ) -> List[Dict[str, Any]]:
         results = self.es_client.mget(index=index_name, ids=ids)
+        self._track(context)
         docs = []
         found_ids = set()
         for doc in results.get("docs", []):
@@ -494,12 +787,18 @@ class Elasticsearch:
                 field="metadata.id",
                 values=missed_ids,
                 size=len(missed_ids),
+                context=context,
             )
         )
         return docs
 
     def _search_by_terms(
-        self, index_name: str, field: str, values: List[str], size: int
+        self,
+        index_name: str,
+        field: str,
+        values: List[str],
+        size: int,
+        context: Optional[RetrievalContext] = None,
     ) -> List[Dict[str, Any]]:
         if not values:
             return []
@@ -508,8 +807,14 @@ class Elasticsearch:
             body={"query": {"terms": {field: values}}},
             size=size,
         )
+        self._track(context)
         return [self._hit_to_result(hit) for hit in results["hits"]["hits"]]
 
+    @staticmethod
+    def _track(context: Optional[RetrievalContext]) -> None:
+        if context is not None:
+            context.round_trips += 1
+
     def _hit_to_result(self, hit: Dict[str, Any]) -> Dict[str, Any]:
         source = hit.get("_source", {})
         metadata = source.get("metadata", {})
@@ -576,10 +881,10 @@ class Elasticsearch:
             raise ValueError("index_name is required for add_batch operations")
         if not documents:
             return []
+        contents = [doc.get("content", "") for doc in documents]
+        embeddings = self.embed_documents(contents, log_label=index_name)
         operations = []
-        for doc in documents:
-            content = doc.get("content", "")
-            embedding = self.embedding_model.embed_query(content)
+        for doc, content, embedding in zip(documents, contents, embeddings):
             operations.append({"index": {"_index": index_name}})
             operations.append(
                 {
@@ -0,0 +1,354 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch as ESClient
+from elasticsearch.helpers import scan
+from loguru import logger
+
+from langchain_api.settings import settings
+
+
+def normalize_entity_name(text: str) -> str:
+    """与 ElasticGraphRAG._normalize 一致：小写并压缩空白。"""
+    return " ".join(str(text).lower().strip().split())
+
+
+def _is_ascii_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _on_word_boundary(text: str, start: int, end: int) -> bool:
+    """英文、数字开头/结尾的命中不能紧挨其他英文、数字（"ai" 不匹配 "said"）。"""
+    if (
+        start > 0
+        and _is_ascii_word_char(text[start])
+        and _is_ascii_word_char(text[start - 1])
+    ):
+        return False
+    if (
+        end < len(text)
+        and _is_ascii_word_char(text[end - 1])
+        and _is_ascii_word_char(text[end])
+    ):
+        return False
+    return True
+
+
+class AhoCorasick:
+    """
+    支持增删词条的 Aho-Corasick 自动机。
+
+    增删只修改 trie，失败指针在下一次匹配前按需整体重建；删除的词只清除终止标记，
+    废弃节点过多时按现有词条压缩重建。
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._reset()
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, word: str) -> bool:
+        node = self._find(word)
+        return node is not None and self._terminal[node]
+
+    def add(self, word: str) -> bool:
+        if not word:
+            return False
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._terminal.append(False)
+                self._depth.append(self._depth[node] + 1)
+            node = next_node
+        if self._terminal[node]:
+            return False
+        self._terminal[node] = True
+        self._size += 1
+        self._dirty = True
+        return True
+
+    def remove(self, word: str) -> bool:
+        node = self._find(word)
+        if node is None or not self._terminal[node]:
+            return False
+        self._terminal[node] = False
+        self._size -= 1
+        self._removed += 1
+        self._dirty = True
+        if self._removed > max(self._size, 1024):
+            self._compact()
+        return True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """线性扫描 text，按结束位置依次产出所有命中的 (start, end)。"""
+        if self._dirty:
+            self._build_links()
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            output = node if self._terminal[node] else self._output[node]
+            while output:
+                yield index + 1 - self._depth[output], index + 1
+                output = self._output[output]
+
+    def words(self) -> List[str]:
+        words = []
+        stack: List[Tuple[int, str]] = [(0, "")]
+        while stack:
+            node, prefix = stack.pop()
+            if self._terminal[node]:
+                words.append(prefix)
+            for char, child in self._goto[node].items():
+                stack.append((child, prefix + char))
+        return words
+
+    def _reset(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminal: List[bool] = [False]
+        self._depth: List[int] = [0]
+        self._fail: List[int] = [0]
+        # 沿失败链能到达的最近终止节点，0 表示没有
+        self._output: List[int] = [0]
+        self._size = 0
+        self._removed = 0
+        self._dirty = False
+
+    def _find(self, word: str) -> Optional[int]:
+        node = 0
+        for char in word:
+            node = self._goto[node].get(char)
+            if node is None:
+                return None
+        return node
+
+    def _build_links(self) -> None:
+        count = len(self._goto)
+        self._fail = [0] * count
+        self._output = [0] * count
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._output[child] = (
+                    fail if self._terminal[fail] else self._output[fail]
+                )
+                queue.append(child)
+        self._dirty = False
+
+    def _compact(self) -> None:
+        words = self.words()
+        self._reset()
+        for word in words:
+            self.add(word)
+
+
+class EntityMatcher:
+    """某个知识库实体名称的词典匹配器，可按实体 id 增删。"""
+
+    def __init__(self, min_length: int = 2):
+        self.min_length = min_length
+        self._automaton = AhoCorasick()
+        # 实体 id -> 归一化名称；归一化名称 -> (展示名称, 引用的实体 id 数)
+        self._entity_names: Dict[str, str] = {}
+        self._names: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, entities: Iterable[Tuple[str, str]]) -> None:
+        """entities 为 (实体 id, 实体名称)。"""
+        with self._lock:
+            for entity_id, name in entities:
+                normalized = normalize_entity_name(name)
+                if (
+                    len(normalized) < self.min_length
+                    or entity_id in self._entity_names
+                ):
+                    continue
+                self._entity_names[entity_id] = normalized
+                display, count = self._names.get(
+                    normalized, (" ".join(str(name).split()), 0)
+                )
+                self._names[normalized] = (display, count + 1)
+                self._automaton.add(normalized)
+
+    def remove(self, entity_ids: Iterable[str]) -> None:
+        with self._lock:
+            for entity_id in entity_ids:
+                normalized = self._entity_names.pop(entity_id, None)
+                if normalized is None:
+                    continue
+                display, count = self._names[normalized]
+                if count > 1:
+                    self._names[normalized] = (display, count - 1)
+                else:
+                    del self._names[normalized]
+                    self._automaton.remove(normalized)
+
+    def match(self, query: str, limit: int = 8) -> List[str]:
+        """
+        返回 query 中出现的实体名称：重叠时取最左、最长的一个，按出现顺序去重。
+
+        英文、数字需按词边界命中，中文等不分词的文字按子串命中。
+        """
+        text = normalize_entity_name(query)
+        with self._lock:
+            spans = sorted(
+                (
+                    span
+                    for span in self._automaton.iter_matches(text)
+                    if _on_word_boundary(text, *span)
+                ),
+                key=lambda span: (span[0], -span[1]),
+            )
+            entities: List[str] = []
+            last_end = 0
+            for start, end in spans:
+                if start < last_end:
+                    continue
+                last_end = end
+                name = self._names[text[start:end]][0]
+                if name not in entities:
+                    entities.append(name)
+                if len(entities) >= limit:
+                    break
+            return entities
+
+
+class EntityMatcherIndex:
+    """
+    进程内按实体索引缓存的 EntityMatcher，首次检索时从实体索引扫描构建。
+
+    入库、删除文档时由 ElasticGraphRAG 增量增删实体；与 GraphIndex 一样另有
+    ttl_seconds 有效期以感知其他进程的写入。实体数超过 max_entities 时不构建。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 600.0,
+        max_entities: int = 500_000,
+        min_length: int = 2,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entities = max_entities
+        self.min_length = min_length
+        # 实体索引 -> 匹配器；None 表示索引不存在或实体过多
+        self._matchers: Dict[str, Optional[EntityMatcher]] = {}
+        self._built_at: Dict[str, float] = {}
+        self._generations: Dict[str, int] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def match(
+        self, es_client: ESClient, entity_index: str, query: str, limit: int = 8
+    ) -> List[str]:
+        matcher = self.get(es_client, entity_index)
+        return matcher.match(query, limit=limit) if matcher is not None else []
+
+    def get(self, es_client: ESClient, entity_index: str) -> Optional[EntityMatcher]:
+        found, matcher = self._cached(entity_index)
+        if found:
+            return matcher
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(entity_index, threading.Lock())
+        with build_lock:
+            found, matcher = self._cached(entity_index)
+            if found:
+                return matcher
+            with self._lock:
+                generation = self._generations.get(entity_index, 0)
+            matcher = self._build(es_client, entity_index)
+            with self._lock:
+                # 构建期间有增删时不缓存，下次检索重新构建
+                if self._generations.get(entity_index, 0) == generation:
+                    self._matchers[entity_index] = matcher
+                    self._built_at[entity_index] = time.monotonic()
+            return matcher
+
+    def add(self, entity_index: str, entities: Iterable[Tuple[str, str]]) -> None:
+        with self._lock:
+            self._generations[entity_index] = self._generations.get(entity_index, 0) + 1
+            matcher = self._matchers.get(entity_index)
+            if matcher is None:
+                # 尚未构建或此前索引不存在，下次检索时重新扫描
+                self._matchers.pop(entity_index, None)
+                return
+        matcher.add(entities)
+
+    def remove(self, entity_index: str, entity_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._generations[entity_index] = self._generations.get(entity_index, 0) + 1
+            matcher = self._matchers.get(entity_index)
+        if matcher is not None:
+            matcher.remove(entity_ids)
+
+    def invalidate(self, entity_index: str) -> None:
+        with self._lock:
+            self._generations[entity_index] = self._generations.get(entity_index, 0) + 1
+            self._matchers.pop(entity_index, None)
+
+    def _cached(self, entity_index: str) -> Tuple[bool, Optional[EntityMatcher]]:
+        with self._lock:
+            if entity_index not in self._matchers:
+                return False, None
+            if time.monotonic() - self._built_at[entity_index] > self.ttl_seconds:
+                del self._matchers[entity_index]
+                return False, None
+            return True, self._matchers[entity_index]
+
+    def _build(self, es_client: ESClient, entity_index: str) -> Optional[EntityMatcher]:
+        if not es_client.indices.exists(index=entity_index):
+            return None
+        entity_count = int(es_client.count(index=entity_index)["count"])
+        if entity_count > self.max_entities:
+            logger.warning(
+                "实体数超过词典匹配上限，查询实体改用 LLM 抽取: index={}, 实体数={}",
+                entity_index,
+                entity_count,
+            )
+            return None
+
+        started_at = time.perf_counter()
+        matcher = EntityMatcher(min_length=self.min_length)
+        matcher.add(
+            (hit["_id"], hit.get("_source", {}).get("content", ""))
+            for hit in scan(
+                es_client,
+                index=entity_index,
+                query={"query": {"match_all": {}}},
+                _source=["content"],
+                size=5000,
+            )
+        )
+        logger.info(
+            "实体词典构建完成: index={}, 实体名称={}, 耗时={:.2f}s",
+            entity_index,
+            len(matcher),
+            time.perf_counter() - started_at,
+        )
+        return matcher
+
+
+entity_matcher_index = EntityMatcherIndex(
+    ttl_seconds=settings.ENTITY_MATCHER_TTL,
+    max_entities=settings.ENTITY_MATCHER_MAX_ENTITIES,
+    min_length=settings.ENTITY_MATCHER_MIN_LENGTH,
+)
@@ -0,0 +1,58 @@
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, List, Sequence, Tuple, TypeVar
+
+from langchain_core.documents import Document
+
+T = TypeVar("T")
+
+
+def _doc_unique_id(doc: Document) -> str:
+    """
+    定义文档唯一ID：
+    优先用 metadata['id']，否则用 page_content
+    """
+    if doc.metadata and "id" in doc.metadata:
+        return str(doc.metadata["id"])
+    return doc.page_content
+
+
+def rrf_scores(
+    rank_lists: Sequence[Sequence[T]],
+    weights: Sequence[float] = (0.5, 0.5),
+    k: int = 60,
+    key: Callable[[T], Hashable] = _doc_unique_id,
+) -> List[Tuple[T, float]]:
+    """
+    加权倒数排名融合（RRF），返回按融合分数降序排列的 (item, score)。
+
+    :param rank_lists: 多个召回结果，每个是按相关性排序的列表
+    :param weights: 每路召回的权重，与 rank_lists 一一对应
+    :param k: 平滑参数（默认60）
+    :param key: 判定同一结果的唯一标识，默认按 Document 的 metadata['id'] / 正文
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    item_map: Dict[Hashable, T] = {}
+    for weight, rank_list in zip(weights, rank_lists):
+        for rank, item in enumerate(rank_list, start=1):
+            item_id = key(item)
+            # 累加 RRF 分数
+            scores[item_id] += weight / (k + rank)
+            # 保存一个代表结果（用于最终返回）
+            if item_id not in item_map:
+                item_map[item_id] = item
+    sorted_items = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return [(item_map[item_id], score) for item_id, score in sorted_items]
+
+
+# 实现倒数排名融合RRF算法
+def rrf_fusion(
+    rank_lists: List[List[Document]], weights: List[float] = [0.5, 0.5], k: int = 60
+) -> List[Document]:
+    """
+    RRF 融合多个 Document 排序结果
+
+    :param rank_lists: 多个召回结果，每个是按相关性排序的 Document 列表
+    :param k: 平滑参数（默认60）
+    :return: 融合后的 Document 排序列表
+    """
+    return [doc for doc, _ in rrf_scores(rank_lists, weights=weights, k=k)]
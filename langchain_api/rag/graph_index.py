@@ -0,0 +1,299 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from elasticsearch import Elasticsearch as ESClient
+from elasticsearch.helpers import scan
+from loguru import logger
+
+from langchain_api.settings import settings
+
+
+def _build_csr(
+    rows: List[int], cols: List[int], n_rows: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """由 (行, 列) 边列表构建去重、按列排序的 CSR 邻接数组。"""
+    if not rows:
+        return np.zeros(n_rows + 1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+    edges = np.unique(
+        np.stack(
+            [np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)],
+            axis=1,
+        ),
+        axis=0,
+    )
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=n_rows), out=indptr[1:])
+    return indptr, edges[:, 1].astype(np.int32)
+
+
+def _neighbors(
+    indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray
+) -> np.ndarray:
+    """一次取出多个节点的全部邻居（去重）。"""
+    if nodes.size == 0:
+        return nodes
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int32)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.unique(indices[offsets + np.arange(total)])
+
+
+class _IdTable:
+    """字符串 id 与连续整数之间的映射；别名（metadata.id）指向同一个整数。"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+
+    def intern(self, node_id: str) -> int:
+        position = self.positions.get(node_id)
+        if position is None:
+            position = len(self.ids)
+            self.ids.append(node_id)
+            self.positions[node_id] = position
+        return position
+
+    def alias(self, alias: str, position: int) -> None:
+        self.positions.setdefault(alias, position)
+
+    def lookup(self, node_ids: Iterable[str]) -> np.ndarray:
+        positions = [
+            self.positions[node_id] for node_id in node_ids if node_id in self.positions
+        ]
+        return np.asarray(positions, dtype=np.int64)
+
+    def names(self, positions: np.ndarray) -> Set[str]:
+        return {self.ids[position] for position in positions.tolist()}
+
+
+class GraphSnapshot:
+    """
+    某个知识库实体/关系图的内存快照，邻接关系以 CSR 整数数组保存。
+
+    - entity_relations：实体 -> 关系（实体文档 metadata.relation_ids）
+    - relation_entities：关系 -> 实体（关系文档 metadata.entity_ids）
+    - entity_relations_reverse：由关系文档反推的实体 -> 关系，对应 ES 上
+      按 metadata.entity_ids 检索关系的兜底逻辑
+
+    passage 需要结合 BM25 打分排序，仍由 ES 按 relation_ids/entity_ids 检索。
+    """
+
+    def __init__(
+        self,
+        entity_docs: Iterable[Dict[str, Any]],
+        relation_docs: Iterable[Dict[str, Any]],
+    ):
+        self.entities = _IdTable()
+        self.relations = _IdTable()
+
+        entity_rows: List[int] = []
+        entity_cols: List[int] = []
+        for doc in entity_docs:
+            position = self._intern_doc(self.entities, doc)
+            for relation_id in _metadata_list(doc, "relation_ids"):
+                entity_rows.append(position)
+                entity_cols.append(self.relations.intern(relation_id))
+
+        relation_rows: List[int] = []
+        relation_cols: List[int] = []
+        for doc in relation_docs:
+            position = self._intern_doc(self.relations, doc)
+            for entity_id in _metadata_list(doc, "entity_ids"):
+                relation_rows.append(position)
+                relation_cols.append(self.entities.intern(entity_id))
+
+        n_entities = len(self.entities.ids)
+        n_relations = len(self.relations.ids)
+        self.entity_relations = _build_csr(entity_rows, entity_cols, n_entities)
+        self.relation_entities = _build_csr(relation_rows, relation_cols, n_relations)
+        self.entity_relations_reverse = _build_csr(
+            relation_cols, relation_rows, n_entities
+        )
+
+    @property
+    def edge_count(self) -> int:
+        return int(self.entity_relations[1].size + self.relation_entities[1].size)
+
+    def relations_by_entities(self, entity_ids: Iterable[str]) -> Set[str]:
+        nodes = self.entities.lookup(entity_ids)
+        found = _neighbors(*self.entity_relations, nodes)
+        if found.size == 0:
+            found = _neighbors(*self.entity_relations_reverse, nodes)
+        return self.relations.names(found)
+
+    def entities_by_relations(self, relation_ids: Iterable[str]) -> Set[str]:
+        nodes = self.relations.lookup(relation_ids)
+        return self.entities.names(_neighbors(*self.relation_entities, nodes))
+
+    def expand(
+        self, entity_ids: List[str], relation_ids: List[str], degree: int
+    ) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """与 Elasticsearch._expand_es_graph 相同的多跳扩展，全部在内存中完成。"""
+        all_entity_ids = set(entity_ids)
+        all_relation_ids = set(relation_ids)
+        steps: List[Dict[str, Any]] = []
+
+        new_relation_ids = self.relations_by_entities(all_entity_ids) - all_relation_ids
+        all_relation_ids.update(new_relation_ids)
+        steps.append(
+            {
+                "step": 0,
+                "operation": "entity_to_relation",
+                "new_entity_ids": [],
+                "new_relation_ids": sorted(new_relation_ids),
+            }
+        )
+
+        for step in range(1, degree + 1):
+            new_entity_ids = (
+                self.entities_by_relations(all_relation_ids) - all_entity_ids
+            )
+            all_entity_ids.update(new_entity_ids)
+            new_relation_ids = (
+                self.relations_by_entities(new_entity_ids) - all_relation_ids
+            )
+            all_relation_ids.update(new_relation_ids)
+            steps.append(
+                {
+                    "step": step,
+                    "operation": "relation_to_entity_to_relation",
+                    "new_entity_ids": sorted(new_entity_ids),
+                    "new_relation_ids": sorted(new_relation_ids),
+                }
+            )
+            if not new_entity_ids and not new_relation_ids:
+                break
+
+        return sorted(all_entity_ids), sorted(all_relation_ids), steps
+
+    @staticmethod
+    def _intern_doc(table: _IdTable, doc: Dict[str, Any]) -> int:
+        position = table.intern(str(doc["_id"]))
+        alias = doc.get("_source", {}).get("metadata", {}).get("id")
+        if alias is not None:
+            table.alias(str(alias), position)
+        return position
+
+
+def _metadata_list(doc: Dict[str, Any], key: str) -> List[str]:
+    value = doc.get("_source", {}).get("metadata", {}).get(key)
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+class GraphIndex:
+    """
+    进程内的知识库图快照注册表，按 (实体索引, 关系索引) 懒加载构建。
+
+    入库、删除文档后由 ElasticGraphRAG 调用 invalidate 使快照失效；多进程部署时
+    其他进程的写入感知不到，因此快照另有 ttl_seconds 的有效期。实体与关系文档
+    总数超过 max_nodes 时不建快照，检索退回逐步查询 ES。
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, max_nodes: int = 2_000_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_nodes = max_nodes
+        # key -> (构建时间, 快照)；快照为 None 表示索引不存在或图过大
+        self._snapshots: Dict[
+            Tuple[str, str], Tuple[float, Optional[GraphSnapshot]]
+        ] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, es_client: ESClient, entity_index: str, relation_index: str
+    ) -> Optional[GraphSnapshot]:
+        key = (entity_index, relation_index)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[1]
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached[1]
+            with self._lock:
+                generation = self._generations.get(key, 0)
+            snapshot = self._build(es_client, entity_index, relation_index)
+            with self._lock:
+                # 构建期间发生过写入时不缓存结果，下次检索重新构建
+                if self._generations.get(key, 0) == generation:
+                    self._snapshots[key] = (time.monotonic(), snapshot)
+            return snapshot
+
+    def invalidate(self, entity_index: str, relation_index: str) -> None:
+        key = (entity_index, relation_index)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._snapshots.pop(key, None)
+
+    def _cached(
+        self, key: Tuple[str, str]
+    ) -> Optional[Tuple[float, Optional[GraphSnapshot]]]:
+        with self._lock:
+            cached = self._snapshots.get(key)
+            if cached is not None and time.monotonic() - cached[0] > self.ttl_seconds:
+                del self._snapshots[key]
+                return None
+            return cached
+
+    def _build(
+        self, es_client: ESClient, entity_index: str, relation_index: str
+    ) -> Optional[GraphSnapshot]:
+        if not (
+            es_client.indices.exists(index=entity_index)
+            and es_client.indices.exists(index=relation_index)
+        ):
+            return None
+        node_count = sum(
+            int(es_client.count(index=index_name)["count"])
+            for index_name in (entity_index, relation_index)
+        )
+        if node_count > self.max_nodes:
+            logger.warning(
+                "图规模超过快照上限，检索时逐步查询 ES: entity_index={}, 节点数={}",
+                entity_index,
+                node_count,
+            )
+            return None
+
+        started_at = time.perf_counter()
+        snapshot = GraphSnapshot(
+            entity_docs=self._scan(es_client, entity_index, "relation_ids"),
+            relation_docs=self._scan(es_client, relation_index, "entity_ids"),
+        )
+        logger.info(
+            "图快照构建完成: entity_index={}, 实体={}, 关系={}, 边数={}, 耗时={:.2f}s",
+            entity_index,
+            len(snapshot.entities.ids),
+            len(snapshot.relations.ids),
+            snapshot.edge_count,
+            time.perf_counter() - started_at,
+        )
+        return snapshot
+
+    @staticmethod
+    def _scan(es_client: ESClient, index_name: str, field: str):
+        return scan(
+            es_client,
+            index=index_name,
+            query={"query": {"match_all": {}}},
+            _source=["metadata.id", f"metadata.{field}"],
+            size=5000,
+        )
+
+
+graph_index = GraphIndex(
+    ttl_seconds=settings.GRAPH_INDEX_TTL, max_nodes=settings.GRAPH_INDEX_MAX_NODES
+)
@@ -0,0 +1,477 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from langchain_api.constant import home_path
+from langchain_api.rag.knowledge_base import (
+    KnowledgeBaseManager,
+    StagedKnowledgeFile,
+    UploadedKnowledgeFile,
+    knowledge_base_manager,
+)
+from langchain_api.settings import settings
+
+# 文件处理阶段，按顺序推进
+INGEST_STAGES = ("queued", "parse", "split", "extract", "embed", "index", "done")
+# 文件已结束的状态；duplicate 表示知识库中已有相同内容的文件，未重复入库
+FINISHED_STATUSES = ("succeeded", "duplicate", "failed")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class IngestJob(SQLModel, table=True):
+    __tablename__ = "ingest_jobs"
+
+    job_id: str = Field(primary_key=True)
+    user_id: str = Field(index=True)
+    knowledge_base_id: str = Field(index=True)
+    use_triplet_cache: Optional[bool] = None
+    # ingest 新增文件；replace 用新文件替换已有文档，只重建变化的分块
+    operation: str = Field(default="ingest")
+    status: str = Field(default="queued")
+    created_at: datetime = Field(default_factory=_utcnow)
+    updated_at: datetime = Field(default_factory=_utcnow)
+
+
+class IngestJobFile(SQLModel, table=True):
+    __tablename__ = "ingest_job_files"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(index=True)
+    document_id: str
+    file_name: str
+    content_type: str = ""
+    storage_path: str
+    file_size: int = 0
+    stage: str = Field(default="queued")
+    status: str = Field(default="queued")
+    error: Optional[str] = None
+    chunk_count: int = 0
+    updated_at: datetime = Field(default_factory=_utcnow)
+
+
+class IngestJobFileRecord(BaseModel):
+    document_id: str
+    file_name: str
+    stage: str
+    status: str
+    error: str | None = None
+    chunk_count: int = 0
+    updated_at: datetime
+
+
+class IngestJobRecord(BaseModel):
+    job_id: str
+    user_id: str
+    knowledge_base_id: str
+    operation: str = "ingest"
+    status: str
+    total_files: int
+    finished_files: int
+    failed_files: int
+    duplicate_files: int = 0
+    files: list[IngestJobFileRecord]
+    created_at: datetime
+    updated_at: datetime
+
+
+class IngestJobManager:
+    """
+    知识库文件后台入库任务。
+
+    上传时文件先落盘并登记到 sqlite，随后由线程池逐个文件执行解析、切分、抽取、
+    向量化和写入索引；任务状态持久化，服务重启后未完成的文件会重新入队。
+    """
+
+    def __init__(
+        self,
+        manager: KnowledgeBaseManager,
+        db_url: Optional[str] = None,
+        max_workers: int = 2,
+    ):
+        if db_url is None:
+            os.makedirs(home_path, exist_ok=True)
+            db_url = f"sqlite:///{os.path.join(home_path, 'ingest_jobs.db')}"
+
+        self.manager = manager
+        self.engine = create_engine(
+            db_url, echo=False, connect_args={"check_same_thread": False}
+        )
+        SQLModel.metadata.create_all(
+            self.engine, tables=[IngestJob.__table__, IngestJobFile.__table__]
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="ingest"
+        )
+        self._lock = threading.Lock()
+        self._resumed = False
+
+    def submit(
+        self,
+        user_id: str,
+        knowledge_base_id: str,
+        files: Iterable[UploadedKnowledgeFile],
+        *,
+        use_triplet_cache: bool | None = None,
+    ) -> IngestJobRecord:
+        # 提前校验知识库归属，避免无效任务入队
+        self.manager.get_knowledge_base(user_id, knowledge_base_id)
+        job_id = uuid.uuid4().hex
+        job = IngestJob(
+            job_id=job_id,
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            use_triplet_cache=use_triplet_cache,
+        )
+        job_files: list[IngestJobFile] = []
+        try:
+            for uploaded_file in files:
+                staged_file = self.manager.stage_file(
+                    user_id=user_id,
+                    knowledge_base_id=knowledge_base_id,
+                    uploaded_file=uploaded_file,
+                )
+                job_files.append(
+                    IngestJobFile(
+                        job_id=job_id,
+                        document_id=staged_file.document_id,
+                        file_name=staged_file.file_name,
+                        content_type=staged_file.content_type,
+                        storage_path=str(staged_file.storage_path),
+                        file_size=staged_file.file_size,
+                    )
+                )
+
+            with Session(self.engine) as session:
+                session.add(job)
+                session.add_all(job_files)
+                session.commit()
+                for job_file in job_files:
+                    session.refresh(job_file)
+                file_ids = [job_file.id for job_file in job_files]
+        except BaseException:
+            # 任务未落库，已暂存的文件没有任务引用，直接删除
+            self._discard_staged(job_file.storage_path for job_file in job_files)
+            raise
+
+        logger.info(
+            "入库任务已创建: job_id={}, 知识库={}, 文件数={}",
+            job_id,
+            knowledge_base_id,
+            len(file_ids),
+        )
+        for file_id in file_ids:
+            self._executor.submit(self._run_file, file_id)
+        return self.get_job(user_id, job_id)
+
+    def submit_replace(
+        self,
+        user_id: str,
+        knowledge_base_id: str,
+        document_id: str,
+        uploaded_file: UploadedKnowledgeFile,
+        *,
+        use_triplet_cache: bool | None = None,
+    ) -> IngestJobRecord:
+        """后台替换已有文档的文件，任务中只有一个文件，document_id 为被替换的文档。"""
+        self.manager.get_document(user_id, knowledge_base_id, document_id)
+        staged_file = self.manager.stage_file(
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            uploaded_file=uploaded_file,
+        )
+        job_id = uuid.uuid4().hex
+        try:
+            with Session(self.engine) as session:
+                session.add(
+                    IngestJob(
+                        job_id=job_id,
+                        user_id=user_id,
+                        knowledge_base_id=knowledge_base_id,
+                        use_triplet_cache=use_triplet_cache,
+                        operation="replace",
+                    )
+                )
+                job_file = IngestJobFile(
+                    job_id=job_id,
+                    document_id=document_id,
+                    file_name=staged_file.file_name,
+                    content_type=staged_file.content_type,
+                    storage_path=str(staged_file.storage_path),
+                    file_size=staged_file.file_size,
+                )
+                session.add(job_file)
+                session.commit()
+                session.refresh(job_file)
+                file_id = job_file.id
+        except BaseException:
+            self._discard_staged([staged_file.storage_path])
+            raise
+
+        logger.info(
+            "文档替换任务已创建: job_id={}, 知识库={}, 文档={}",
+            job_id,
+            knowledge_base_id,
+            document_id,
+        )
+        self._executor.submit(self._run_file, file_id)
+        return self.get_job(user_id, job_id)
+
+    @staticmethod
+    def _discard_staged(storage_paths: Iterable[str | Path]) -> None:
+        for storage_path in storage_paths:
+            Path(storage_path).unlink(missing_ok=True)
+
+    def get_job(self, user_id: str, job_id: str) -> IngestJobRecord:
+        with Session(self.engine) as session:
+            job = session.get(IngestJob, job_id)
+            if job is None or job.user_id != user_id:
+                raise ValueError("Ingest job not found.")
+            files = session.exec(
+                select(IngestJobFile)
+                .where(IngestJobFile.job_id == job_id)
+                .order_by(IngestJobFile.id)
+            ).all()
+            return self._to_record(job, files)
+
+    def list_jobs(
+        self, user_id: str, knowledge_base_id: str | None = None, limit: int = 20
+    ) -> list[IngestJobRecord]:
+        with Session(self.engine) as session:
+            statement = select(IngestJob).where(IngestJob.user_id == user_id)
+            if knowledge_base_id:
+                statement = statement.where(
+                    IngestJob.knowledge_base_id == knowledge_base_id
+                )
+            statement = statement.order_by(IngestJob.created_at.desc()).limit(limit)
+            records = []
+            for job in session.exec(statement).all():
+                files = session.exec(
+                    select(IngestJobFile)
+                    .where(IngestJobFile.job_id == job.job_id)
+                    .order_by(IngestJobFile.id)
+                ).all()
+                records.append(self._to_record(job, files))
+            return records
+
+    def resume_pending_jobs(self) -> int:
+        """重新入队上次进程退出时未完成的文件，只执行一次。"""
+        with self._lock:
+            if self._resumed:
+                return 0
+            self._resumed = True
+
+        with Session(self.engine) as session:
+            pending = session.exec(
+                select(IngestJobFile).where(
+                    IngestJobFile.status.in_(("queued", "running"))
+                )
+            ).all()
+            interrupted = []
+            for job_file in pending:
+                if job_file.status == "running":
+                    interrupted.append(job_file.id)
+                    job_file.status = "queued"
+                    job_file.stage = "queued"
+                    job_file.updated_at = _utcnow()
+                    session.add(job_file)
+            session.commit()
+            file_ids = [job_file.id for job_file in pending]
+
+        if file_ids:
+            logger.info(
+                "恢复未完成的入库文件: 数量={}, 其中中断={}",
+                len(file_ids),
+                len(interrupted),
+            )
+        for file_id in file_ids:
+            self._executor.submit(self._run_file, file_id, file_id in interrupted)
+        return len(file_ids)
+
+    def _run_file(self, file_id: int, interrupted: bool = False) -> None:
+        with Session(self.engine) as session:
+            job_file = session.get(IngestJobFile, file_id)
+            if job_file is None or job_file.status != "queued":
+                return
+            job = session.get(IngestJob, job_file.job_id)
+            job_file.status = "running"
+            job_file.updated_at = _utcnow()
+            job.status = "running"
+            job.updated_at = job_file.updated_at
+            session.add(job_file)
+            session.add(job)
+            session.commit()
+            job_id = job.job_id
+            user_id = job.user_id
+            knowledge_base_id = job.knowledge_base_id
+            use_triplet_cache = job.use_triplet_cache
+            operation = job.operation
+            staged_file = StagedKnowledgeFile(
+                document_id=job_file.document_id,
+                file_name=job_file.file_name,
+                content_type=job_file.content_type,
+                storage_path=Path(job_file.storage_path),
+                file_size=job_file.file_size,
+            )
+
+        try:
+            run = self._replace_file if operation == "replace" else self._ingest_file
+            run(
+                file_id,
+                user_id=user_id,
+                knowledge_base_id=knowledge_base_id,
+                staged_file=staged_file,
+                use_triplet_cache=use_triplet_cache,
+                interrupted=interrupted,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("入库文件处理失败: {}", staged_file.file_name)
+            self._update_file(file_id, status="failed", error=str(exc))
+
+        try:
+            self.manager.refresh_knowledge_base_stats(user_id, knowledge_base_id)
+        except Exception:  # noqa: BLE001
+            logger.exception("刷新知识库统计失败: {}", knowledge_base_id)
+        self._update_job_status(job_id)
+
+    def _ingest_file(
+        self,
+        file_id: int,
+        *,
+        user_id: str,
+        knowledge_base_id: str,
+        staged_file: StagedKnowledgeFile,
+        use_triplet_cache: bool | None,
+        interrupted: bool,
+    ) -> None:
+        if interrupted:
+            # 上次中断时可能已写入部分分块，先清理再重跑
+            self.manager.discard_document_data(
+                user_id, knowledge_base_id, staged_file.document_id
+            )
+        document = self.manager.ingest_staged_file(
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            staged_file=staged_file,
+            use_triplet_cache=use_triplet_cache,
+            progress_callback=lambda stage: self._update_file(file_id, stage=stage),
+        )
+        if document.document_id != staged_file.document_id:
+            # 指向已有文档，便于前端直接定位
+            self._update_file(
+                file_id,
+                stage="done",
+                status="duplicate",
+                document_id=document.document_id,
+                chunk_count=document.chunk_count,
+            )
+        else:
+            self._update_file(
+                file_id,
+                stage="done",
+                status="succeeded",
+                chunk_count=document.chunk_count,
+            )
+
+    def _replace_file(
+        self,
+        file_id: int,
+        *,
+        user_id: str,
+        knowledge_base_id: str,
+        staged_file: StagedKnowledgeFile,
+        use_triplet_cache: bool | None,
+        interrupted: bool,
+    ) -> None:
+        # 替换可以重复执行：中断前写入的新分块会按内容哈希被复用，无需先清理
+        result = self.manager.replace_staged_file(
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            document_id=staged_file.document_id,
+            staged_file=staged_file,
+            use_triplet_cache=use_triplet_cache,
+            progress_callback=lambda stage: self._update_file(file_id, stage=stage),
+        )
+        self._update_file(
+            file_id,
+            stage="done",
+            status="succeeded",
+            chunk_count=result.document.chunk_count,
+        )
+
+    def _update_file(self, file_id: int, **values) -> None:
+        with Session(self.engine) as session:
+            job_file = session.get(IngestJobFile, file_id)
+            if job_file is None:
+                return
+            for key, value in values.items():
+                setattr(job_file, key, value)
+            job_file.updated_at = _utcnow()
+            session.add(job_file)
+            session.commit()
+
+    def _update_job_status(self, job_id: str) -> None:
+        with Session(self.engine) as session:
+            job = session.get(IngestJob, job_id)
+            statuses = session.exec(
+                select(IngestJobFile.status).where(IngestJobFile.job_id == job_id)
+            ).all()
+            if any(status in ("queued", "running") for status in statuses):
+                return
+            if all(status in ("succeeded", "duplicate") for status in statuses):
+                job.status = "succeeded"
+            elif any(status in ("succeeded", "duplicate") for status in statuses):
+                job.status = "partial"
+            else:
+                job.status = "failed"
+            job.updated_at = _utcnow()
+            session.add(job)
+            session.commit()
+            logger.info("入库任务结束: job_id={}, 状态={}", job_id, job.status)
+
+    @staticmethod
+    def _to_record(job: IngestJob, files: list[IngestJobFile]) -> IngestJobRecord:
+        return IngestJobRecord(
+            job_id=job.job_id,
+            user_id=job.user_id,
+            knowledge_base_id=job.knowledge_base_id,
+            operation=job.operation,
+            status=job.status,
+            total_files=len(files),
+            finished_files=sum(
+                1 for job_file in files if job_file.status in FINISHED_STATUSES
+            ),
+            duplicate_files=sum(
+                1 for job_file in files if job_file.status == "duplicate"
+            ),
+            failed_files=sum(1 for job_file in files if job_file.status == "failed"),
+            files=[
+                IngestJobFileRecord(
+                    document_id=job_file.document_id,
+                    file_name=job_file.file_name,
+                    stage=job_file.stage,
+                    status=job_file.status,
+                    error=job_file.error,
+                    chunk_count=job_file.chunk_count,
+                    updated_at=job_file.updated_at,
+                )
+                for job_file in files
+            ],
+            created_at=job.created_at,
+            updated_at=job.updated_at,
+        )
+
+
+ingest_job_manager = IngestJobManager(
+    knowledge_base_manager, max_workers=settings.INGEST_WORKERS
+)
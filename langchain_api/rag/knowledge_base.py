@@ -1,20 +1,27 @@
 from __future__ import annotations
 
+import hashlib
+import itertools
 import re
+import threading
 import uuid
+import weakref
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, BinaryIO, Callable, Iterable
 
 from elasticsearch import NotFoundError
+from elasticsearch.helpers import scan
 from langchain_core.documents import Document
 from loguru import logger
 from pydantic import BaseModel, Field
 
 from langchain_api.constant import workspace_path
+from langchain_api.rag.cache import EmbeddingCacheStats, get_triplet_cache
 from langchain_api.rag.elastic_graph_rag import ElasticGraphRAG
 from langchain_api.rag.elastic_utils import Elasticsearch
+from langchain_api.rag.graph_index import graph_index
 from langchain_api.rag.text_splitter import PDFParser
 from langchain_api.settings import settings
 from langchain_api.utils import get_embedding_model
@@ -45,6 +52,7 @@ class KnowledgeBaseDocumentRecord(BaseModel):
     file_size: int = 0
     chunk_count: int = 0
     storage_path: str
+    content_hash: str = ""
     created_at: str
     updated_at: str
 
@@ -64,6 +72,20 @@ class KnowledgeBaseUploadResponse(BaseModel):
     knowledge_base: KnowledgeBaseRecord
     documents: list[KnowledgeBaseDocumentRecord] = Field(default_factory=list)
     errors: list[KnowledgeBaseUploadError] = Field(default_factory=list)
+    # 与知识库中已有文件内容相同、未重复入库的文件，返回已有的文档记录
+    duplicates: list[KnowledgeBaseDocumentRecord] = Field(default_factory=list)
+    job_id: str | None = None
+
+
+class KnowledgeBaseDocumentReplaceResponse(BaseModel):
+    knowledge_base: KnowledgeBaseRecord
+    # 后台替换时为 None，结果通过 job_id 查询
+    document: KnowledgeBaseDocumentRecord | None = None
+    # 内容未变化、沿用原有向量和三元组的分块数
+    reused_chunks: int = 0
+    added_chunks: int = 0
+    removed_chunks: int = 0
+    job_id: str | None = None
 
 
 class PaginatedKnowledgeBaseResponse(BaseModel):
@@ -112,16 +134,60 @@ class KnowledgeBaseDocumentDetailResponse(BaseModel):
 class UploadedKnowledgeFile:
     file_name: str
     content_type: str
-    data: bytes
+    data: bytes = b""
+    # 上传文件的文件对象（如 UploadFile.file）；提供时按块流式写入存储目录，
+    # 不把整个文件读进内存
+    stream: BinaryIO | None = None
+
+
+@dataclass(slots=True)
+class StagedKnowledgeFile:
+    """已经写入知识库存储目录、等待解析入库的文件。"""
+
+    document_id: str
+    file_name: str
+    content_type: str
+    storage_path: Path
+    file_size: int
+    content_hash: str = ""
+
+
+class _PassageIdAllocator:
+    """
+    按分块内容哈希分配 passage id：{document_id}_{hash前16位}。
+
+    同一文档内重复的分块或与 reserved 中的 id 冲突时追加序号。
+    """
+
+    def __init__(self, document_id: str, reserved: Iterable[str] = ()):
+        self.document_id = document_id
+        self._used = set(reserved)
+
+    def allocate(self, chunk_hash: str) -> str:
+        base = f"{self.document_id}_{chunk_hash[:16]}"
+        passage_id = base
+        suffix = 1
+        while passage_id in self._used:
+            passage_id = f"{base}_{suffix}"
+            suffix += 1
+        self._used.add(passage_id)
+        return passage_id
 
 
 class KnowledgeBaseManager:
     KNOWLEDGE_BASE_INDEX = "rag_knowledge_bases"
     DOCUMENT_INDEX = "rag_knowledge_base_documents"
     STORAGE_ROOT = workspace_path / "pdf_files" / "knowledge_bases"
+    # 上传文件落盘、计算哈希时每次读取的字节数
+    STAGE_CHUNK_SIZE = 1024 * 1024
 
     def __init__(self, es: Elasticsearch):
         self.es = es
+        # (知识库, 文件内容哈希) -> 锁，同一文件并发上传时只入库一次
+        self._content_locks: weakref.WeakValueDictionary[
+            tuple[str, str], threading.Lock
+        ] = weakref.WeakValueDictionary()
+        self._content_locks_guard = threading.Lock()
         self._ensure_metadata_indexes()
 
     def list_knowledge_bases(self, user_id: str) -> list[KnowledgeBaseRecord]:
@@ -349,6 +415,20 @@ class KnowledgeBaseManager:
         )
         return KnowledgeBaseDocumentRecord(**source)
 
+    def get_document(
+        self, user_id: str, knowledge_base_id: str, document_id: str
+    ) -> KnowledgeBaseDocumentRecord:
+        self.get_knowledge_base(user_id, knowledge_base_id)
+        source = self._get_owned_document(
+            index_name=self.DOCUMENT_INDEX,
+            document_id=document_id,
+            user_id=user_id,
+            error_message="Document not found.",
+        )
+        if source["knowledge_base_id"] != knowledge_base_id:
+            raise ValueError("Document does not belong to this knowledge base.")
+        return KnowledgeBaseDocumentRecord(**source)
+
     def get_document_detail(
         self,
         user_id: str,
@@ -428,7 +508,6 @@ class KnowledgeBaseManager:
             index_name=knowledge_base.passage_index,
             field="metadata.file_id",
             value=document_id,
-            size=10000,
         )
         rag = ElasticGraphRAG(self.es, knowledge_base.index_prefix)
         delete_result = rag.delete_documents(passage_ids)
@@ -491,30 +570,54 @@ class KnowledgeBaseManager:
             knowledge_base=knowledge_base,
         )
 
+    def embedding_cache_stats(self) -> EmbeddingCacheStats:
+        stats = getattr(self.es.embedding_model, "stats", None)
+        if not callable(stats):
+            raise ValueError("Embedding cache is disabled.")
+        return stats()
+
+    def purge_triplet_cache(self, chat_model: str | None = None) -> dict[str, Any]:
+        deleted = get_triplet_cache(
+            max_bytes=settings.TRIPLET_CACHE_MAX_MB * 1024 * 1024
+        ).purge(chat_model)
+        return {"chat_model": chat_model, "deleted": deleted}
+
     def upload_documents(
         self,
         user_id: str,
         knowledge_base_id: str,
         files: Iterable[UploadedKnowledgeFile],
+        *,
+        use_triplet_cache: bool | None = None,
     ) -> KnowledgeBaseUploadResponse:
         knowledge_base = self.get_knowledge_base(user_id, knowledge_base_id)
-        rag = ElasticGraphRAG(self.es, knowledge_base.index_prefix)
-        storage_dir = self._storage_dir(user_id, knowledge_base_id)
-        storage_dir.mkdir(parents=True, exist_ok=True)
+        rag = ElasticGraphRAG(
+            self.es,
+            knowledge_base.index_prefix,
+            use_triplet_cache=use_triplet_cache,
+        )
 
         documents: list[KnowledgeBaseDocumentRecord] = []
+        duplicates: list[KnowledgeBaseDocumentRecord] = []
         errors: list[KnowledgeBaseUploadError] = []
 
         for uploaded_file in files:
             try:
+                staged_file = self.stage_file(
+                    user_id=user_id,
+                    knowledge_base_id=knowledge_base_id,
+                    uploaded_file=uploaded_file,
+                )
                 document_record = self._ingest_file(
                     user_id=user_id,
                     knowledge_base=knowledge_base,
                     rag=rag,
-                    storage_dir=storage_dir,
-                    uploaded_file=uploaded_file,
+                    staged_file=staged_file,
                 )
-                documents.append(document_record)
+                if document_record.document_id == staged_file.document_id:
+                    documents.append(document_record)
+                else:
+                    duplicates.append(document_record)
             except Exception as exc:  # noqa: BLE001
                 logger.exception("Knowledge file upload failed: {}", uploaded_file.file_name)
                 errors.append(
@@ -529,25 +632,280 @@ class KnowledgeBaseManager:
             knowledge_base=knowledge_base,
             documents=documents,
             errors=errors,
+            duplicates=duplicates,
         )
 
-    def _ingest_file(
+    def stage_file(
         self,
         *,
         user_id: str,
-        knowledge_base: KnowledgeBaseRecord,
-        rag: ElasticGraphRAG,
-        storage_dir: Path,
+        knowledge_base_id: str,
         uploaded_file: UploadedKnowledgeFile,
-    ) -> KnowledgeBaseDocumentRecord:
+    ) -> StagedKnowledgeFile:
         original_file_name = Path(uploaded_file.file_name or "unnamed").name
         if not original_file_name:
             raise ValueError("Uploaded file name is required.")
 
+        storage_dir = self._storage_dir(user_id, knowledge_base_id)
+        storage_dir.mkdir(parents=True, exist_ok=True)
         document_id = uuid.uuid4().hex
-        storage_name = f"{document_id}_{self._safe_file_name(original_file_name)}"
-        storage_path = storage_dir / storage_name
-        storage_path.write_bytes(uploaded_file.data)
+        storage_path = (
+            storage_dir / f"{document_id}_{self._safe_file_name(original_file_name)}"
+        )
+        if uploaded_file.stream is None:
+            storage_path.write_bytes(uploaded_file.data)
+            file_size = len(uploaded_file.data)
+            content_hash = hashlib.sha256(uploaded_file.data).hexdigest()
+        else:
+            file_size, content_hash = self._write_stream(
+                uploaded_file.stream, storage_path
+            )
+        return StagedKnowledgeFile(
+            document_id=document_id,
+            file_name=original_file_name,
+            content_type=uploaded_file.content_type or "",
+            storage_path=storage_path,
+            file_size=file_size,
+            content_hash=content_hash,
+        )
+
+    def ingest_staged_file(
+        self,
+        *,
+        user_id: str,
+        knowledge_base_id: str,
+        staged_file: StagedKnowledgeFile,
+        use_triplet_cache: bool | None = None,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> KnowledgeBaseDocumentRecord:
+        knowledge_base = self.get_knowledge_base(user_id, knowledge_base_id)
+        rag = ElasticGraphRAG(
+            self.es,
+            knowledge_base.index_prefix,
+            use_triplet_cache=use_triplet_cache,
+        )
+        return self._ingest_file(
+            user_id=user_id,
+            knowledge_base=knowledge_base,
+            rag=rag,
+            staged_file=staged_file,
+            progress_callback=progress_callback,
+        )
+
+    def replace_document(
+        self,
+        user_id: str,
+        knowledge_base_id: str,
+        document_id: str,
+        uploaded_file: UploadedKnowledgeFile,
+        *,
+        use_triplet_cache: bool | None = None,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> KnowledgeBaseDocumentReplaceResponse:
+        self.get_document(user_id, knowledge_base_id, document_id)
+        staged_file = self.stage_file(
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            uploaded_file=uploaded_file,
+        )
+        return self.replace_staged_file(
+            user_id=user_id,
+            knowledge_base_id=knowledge_base_id,
+            document_id=document_id,
+            staged_file=staged_file,
+            use_triplet_cache=use_triplet_cache,
+            progress_callback=progress_callback,
+        )
+
+    def replace_staged_file(
+        self,
+        *,
+        user_id: str,
+        knowledge_base_id: str,
+        document_id: str,
+        staged_file: StagedKnowledgeFile,
+        use_triplet_cache: bool | None = None,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> KnowledgeBaseDocumentReplaceResponse:
+        """
+        用新文件替换已有文档，只对内容发生变化的分块做向量化、三元组抽取和写入。
+
+        新旧分块按内容哈希对齐：相同的分块保留原 passage（只更新 metadata），
+        新增的分块走正常入库流程，旧文件独有的分块最后通过 delete_documents 删除，
+        其实体、关系引用也随之清理。过程失败时回滚本次新增的分块，原文档保持不变。
+        重复执行是安全的，可用于恢复中断的替换任务。
+        """
+        knowledge_base = self.get_knowledge_base(user_id, knowledge_base_id)
+        content_hash = staged_file.content_hash or self._hash_file(
+            staged_file.storage_path
+        )
+        document_lock = self._document_lock(knowledge_base_id, document_id)
+        with document_lock, self._content_lock(knowledge_base_id, content_hash):
+            try:
+                current = self.get_document(user_id, knowledge_base_id, document_id)
+            except ValueError:
+                staged_file.storage_path.unlink(missing_ok=True)
+                raise
+            if content_hash == current.content_hash:
+                logger.info("替换文件与原文件内容相同，跳过: {}", document_id)
+                if staged_file.storage_path != Path(current.storage_path):
+                    staged_file.storage_path.unlink(missing_ok=True)
+                return KnowledgeBaseDocumentReplaceResponse(
+                    knowledge_base=knowledge_base,
+                    document=current,
+                    reused_chunks=current.chunk_count,
+                )
+            existing = self._find_document_by_hash(
+                user_id=user_id,
+                knowledge_base_id=knowledge_base_id,
+                content_hash=content_hash,
+            )
+            if existing is not None and existing.document_id != document_id:
+                staged_file.storage_path.unlink(missing_ok=True)
+                raise ValueError(
+                    "A document with the same content already exists: "
+                    f"{existing.display_name}"
+                )
+
+            rag = ElasticGraphRAG(
+                self.es,
+                knowledge_base.index_prefix,
+                use_triplet_cache=use_triplet_cache,
+            )
+            try:
+                result = self._replace_passages(
+                    user_id=user_id,
+                    knowledge_base=knowledge_base,
+                    rag=rag,
+                    document_id=document_id,
+                    staged_file=staged_file,
+                    progress_callback=progress_callback,
+                )
+            except Exception:
+                staged_file.storage_path.unlink(missing_ok=True)
+                raise
+
+            source = current.model_dump()
+            source.update(
+                {
+                    "file_name": staged_file.file_name,
+                    "content_type": staged_file.content_type,
+                    "file_size": staged_file.file_size,
+                    "chunk_count": result["chunk_count"],
+                    "storage_path": str(staged_file.storage_path),
+                    "content_hash": content_hash,
+                    "updated_at": self._now(),
+                }
+            )
+            if current.display_name == current.file_name:
+                # 未手动改名的文档跟随新文件名
+                source["display_name"] = staged_file.file_name
+            self.es.es_client.index(
+                index=self.DOCUMENT_INDEX,
+                id=document_id,
+                document=source,
+                refresh=True,
+            )
+            if Path(current.storage_path) != staged_file.storage_path:
+                Path(current.storage_path).unlink(missing_ok=True)
+
+        logger.info(
+            "文档替换完成: document_id={}, 复用={}, 新增={}, 删除={}",
+            document_id,
+            result["reused_chunks"],
+            result["added_chunks"],
+            result["removed_chunks"],
+        )
+        return KnowledgeBaseDocumentReplaceResponse(
+            knowledge_base=self._refresh_knowledge_base_stats(knowledge_base),
+            document=KnowledgeBaseDocumentRecord(**source),
+            reused_chunks=result["reused_chunks"],
+            added_chunks=result["added_chunks"],
+            removed_chunks=result["removed_chunks"],
+        )
+
+    def discard_document_data(
+        self, user_id: str, knowledge_base_id: str, document_id: str
+    ) -> None:
+        """删除某个 document_id 已写入的 passage/实体/关系和文档记录，用于清理中断的入库。"""
+        knowledge_base = self.get_knowledge_base(user_id, knowledge_base_id)
+        passage_ids = self._search_ids_by_term(
+            index_name=knowledge_base.passage_index,
+            field="metadata.file_id",
+            value=document_id,
+        )
+        if passage_ids:
+            ElasticGraphRAG(self.es, knowledge_base.index_prefix).delete_documents(
+                passage_ids
+            )
+        try:
+            self.es.es_client.delete(
+                index=self.DOCUMENT_INDEX,
+                id=document_id,
+                refresh=True,
+            )
+        except NotFoundError:
+            pass
+
+    def refresh_knowledge_base_stats(
+        self, user_id: str, knowledge_base_id: str
+    ) -> KnowledgeBaseRecord:
+        return self._refresh_knowledge_base_stats(
+            self.get_knowledge_base(user_id, knowledge_base_id)
+        )
+
+    def _ingest_file(
+        self,
+        *,
+        user_id: str,
+        knowledge_base: KnowledgeBaseRecord,
+        rag: ElasticGraphRAG,
+        staged_file: StagedKnowledgeFile,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> KnowledgeBaseDocumentRecord:
+        """
+        解析并写入一个文件；知识库中已有内容相同的文件时不再入库，
+        删除本次暂存的文件并返回已有的文档记录（document_id 与 staged_file 不同）。
+        """
+        content_hash = staged_file.content_hash or self._hash_file(
+            staged_file.storage_path
+        )
+        with self._content_lock(knowledge_base.knowledge_base_id, content_hash):
+            existing = self._find_document_by_hash(
+                user_id=user_id,
+                knowledge_base_id=knowledge_base.knowledge_base_id,
+                content_hash=content_hash,
+            )
+            if existing is not None:
+                logger.info(
+                    "文件内容已存在，跳过入库: file={}, 已有文档={}",
+                    staged_file.file_name,
+                    existing.document_id,
+                )
+                staged_file.storage_path.unlink(missing_ok=True)
+                return existing
+            return self._ingest_new_file(
+                user_id=user_id,
+                knowledge_base=knowledge_base,
+                rag=rag,
+                staged_file=staged_file,
+                content_hash=content_hash,
+                progress_callback=progress_callback,
+            )
+
+    def _ingest_new_file(
+        self,
+        *,
+        user_id: str,
+        knowledge_base: KnowledgeBaseRecord,
+        rag: ElasticGraphRAG,
+        staged_file: StagedKnowledgeFile,
+        content_hash: str,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> KnowledgeBaseDocumentRecord:
+        document_id = staged_file.document_id
+        storage_path = staged_file.storage_path
+        storage_name = storage_path.name
 
         parser = PDFParser(
             bucket_name=self._storage_bucket_name(
@@ -556,32 +914,54 @@ class KnowledgeBaseManager:
             ),
             file_path=storage_name,
             file_id=document_id,
+            parse_workers=settings.PDF_PARSE_WORKERS,
+            page_workers=settings.PDF_PAGE_WORKERS,
+            min_pages_per_shard=settings.PDF_PAGE_SHARD_MIN_PAGES,
         )
-        chunks = parser.get_chunk()
-        prepared_documents = self._prepare_documents(
-            knowledge_base=knowledge_base,
-            user_id=user_id,
-            document_id=document_id,
-            storage_name=storage_name,
-            storage_path=storage_path,
-            original_file_name=original_file_name,
-            content_type=uploaded_file.content_type,
-            chunks=chunks,
-        )
-
-        rag.add_documents(prepared_documents, extract_triplets=True)
+        # 分块边切分边入库，大文件不需要把全部分块留在内存里
+        chunk_count = 0
+        batch_size = settings.INGEST_CHUNK_BATCH_SIZE
+        chunks = parser.iter_chunks(progress_callback=progress_callback)
+        allocator = _PassageIdAllocator(document_id)
+        try:
+            while batch := list(itertools.islice(chunks, batch_size)):
+                prepared_documents = self._prepare_documents(
+                    knowledge_base=knowledge_base,
+                    user_id=user_id,
+                    document_id=document_id,
+                    storage_name=storage_name,
+                    storage_path=storage_path,
+                    original_file_name=staged_file.file_name,
+                    content_type=staged_file.content_type,
+                    chunks=batch,
+                    allocator=allocator,
+                )
+                rag.add_documents(
+                    prepared_documents,
+                    extract_triplets=True,
+                    progress_callback=progress_callback,
+                )
+                chunk_count += len(prepared_documents)
+        except Exception:
+            if chunk_count:
+                # 清理已写入的批次，避免留下不完整的文档
+                self.discard_document_data(
+                    user_id, knowledge_base.knowledge_base_id, document_id
+                )
+            raise
 
         now = self._now()
         source = {
             "document_id": document_id,
             "knowledge_base_id": knowledge_base.knowledge_base_id,
             "user_id": user_id,
-            "file_name": original_file_name,
-            "display_name": original_file_name,
-            "content_type": uploaded_file.content_type or "",
-            "file_size": len(uploaded_file.data),
-            "chunk_count": len(prepared_documents),
+            "file_name": staged_file.file_name,
+            "display_name": staged_file.file_name,
+            "content_type": staged_file.content_type,
+            "file_size": staged_file.file_size,
+            "chunk_count": chunk_count,
             "storage_path": str(storage_path),
+            "content_hash": content_hash,
             "created_at": now,
             "updated_at": now,
         }
@@ -593,6 +973,176 @@ class KnowledgeBaseManager:
         )
         return KnowledgeBaseDocumentRecord(**source)
 
+    def _replace_passages(
+        self,
+        *,
+        user_id: str,
+        knowledge_base: KnowledgeBaseRecord,
+        rag: ElasticGraphRAG,
+        document_id: str,
+        staged_file: StagedKnowledgeFile,
+        progress_callback: Callable[[str], None] | None = None,
+    ) -> dict[str, int]:
+        old_passages = self._passage_ids_by_hash(
+            index_name=knowledge_base.passage_index, document_id=document_id
+        )
+        allocator = _PassageIdAllocator(
+            document_id,
+            reserved=itertools.chain.from_iterable(old_passages.values()),
+        )
+        storage_path = staged_file.storage_path
+        parser = PDFParser(
+            bucket_name=self._storage_bucket_name(
+                user_id=user_id,
+                knowledge_base_id=knowledge_base.knowledge_base_id,
+            ),
+            file_path=storage_path.name,
+            file_id=document_id,
+            parse_workers=settings.PDF_PARSE_WORKERS,
+            page_workers=settings.PDF_PAGE_WORKERS,
+            min_pages_per_shard=settings.PDF_PAGE_SHARD_MIN_PAGES,
+        )
+
+        reused: list[Document] = []
+        added_ids: list[str] = []
+        chunk_count = 0
+        batch_size = settings.INGEST_CHUNK_BATCH_SIZE
+        chunks = parser.iter_chunks(progress_callback=progress_callback)
+        try:
+            while batch := list(itertools.islice(chunks, batch_size)):
+                passage_ids = []
+                for chunk in batch:
+                    # 旧分块按多重集合匹配，重复内容的分块各自对应一个旧 passage
+                    matched = old_passages.get(self._chunk_hash(chunk.page_content))
+                    passage_ids.append(matched.pop() if matched else None)
+                prepared_documents = self._prepare_documents(
+                    knowledge_base=knowledge_base,
+                    user_id=user_id,
+                    document_id=document_id,
+                    storage_name=storage_path.name,
+                    storage_path=storage_path,
+                    original_file_name=staged_file.file_name,
+                    content_type=staged_file.content_type,
+                    chunks=batch,
+                    passage_ids=passage_ids,
+                    allocator=allocator,
+                )
+                new_documents = []
+                for passage_id, document in zip(passage_ids, prepared_documents):
+                    if passage_id is None:
+                        new_documents.append(document)
+                    else:
+                        # 只保留 metadata，避免长时间持有整段正文
+                        reused.append(
+                            Document(
+                                id=document.id,
+                                page_content="",
+                                metadata=document.metadata,
+                            )
+                        )
+                if new_documents:
+                    added_ids.extend(document.id for document in new_documents)
+                    rag.add_documents(
+                        new_documents,
+                        extract_triplets=True,
+                        progress_callback=progress_callback,
+                    )
+                chunk_count += len(prepared_documents)
+        except Exception:
+            if added_ids:
+                rag.delete_documents(added_ids)
+            raise
+
+        # 新分块全部写入后再改动原有 passage，失败时原文档仍然完整可检索
+        rag.update_passage_metadata(reused)
+        removed_ids = list(itertools.chain.from_iterable(old_passages.values()))
+        if removed_ids:
+            rag.delete_documents(removed_ids)
+        return {
+            "chunk_count": chunk_count,
+            "reused_chunks": len(reused),
+            "added_chunks": len(added_ids),
+            "removed_chunks": len(removed_ids),
+        }
+
+    def _passage_ids_by_hash(
+        self, *, index_name: str, document_id: str
+    ) -> dict[str, list[str]]:
+        if not self.es.es_client.indices.exists(index=index_name):
+            return {}
+        passages: dict[str, list[str]] = {}
+        for hit in scan(
+            self.es.es_client,
+            index=index_name,
+            query={"query": {"term": {"metadata.file_id": document_id}}},
+            _source=["content"],
+            size=5000,
+        ):
+            content = hit.get("_source", {}).get("content", "")
+            passages.setdefault(self._chunk_hash(content), []).append(hit["_id"])
+        return passages
+
+    def _document_lock(self, knowledge_base_id: str, document_id: str) -> threading.Lock:
+        return self._content_lock(knowledge_base_id, f"document:{document_id}")
+
+    def _content_lock(
+        self, knowledge_base_id: str, content_hash: str
+    ) -> threading.Lock:
+        with self._content_locks_guard:
+            key = (knowledge_base_id, content_hash)
+            lock = self._content_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._content_locks[key] = lock
+            return lock
+
+    def _find_document_by_hash(
+        self, *, user_id: str, knowledge_base_id: str, content_hash: str
+    ) -> KnowledgeBaseDocumentRecord | None:
+        hits = self._search(
+            index_name=self.DOCUMENT_INDEX,
+            query={
+                "bool": {
+                    "filter": [
+                        {"term": {"user_id": user_id}},
+                        {"term": {"knowledge_base_id": knowledge_base_id}},
+                        {"term": {"content_hash": content_hash}},
+                    ]
+                }
+            },
+            size=1,
+        )
+        if not hits:
+            return None
+        return KnowledgeBaseDocumentRecord(**hits[0]["_source"])
+
+    def _write_stream(self, stream: BinaryIO, path: Path) -> tuple[int, str]:
+        """按块把文件对象写入 path，同时计算 sha256；失败时删除写了一半的文件。"""
+        digest = hashlib.sha256()
+        file_size = 0
+        try:
+            with path.open("wb") as file:
+                while block := stream.read(self.STAGE_CHUNK_SIZE):
+                    digest.update(block)
+                    file.write(block)
+                    file_size += len(block)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return file_size, digest.hexdigest()
+
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with path.open("rb") as file:
+            while block := file.read(KnowledgeBaseManager.STAGE_CHUNK_SIZE):
+                digest.update(block)
+        return digest.hexdigest()
+
     def _prepare_documents(
         self,
         *,
@@ -604,11 +1154,18 @@ class KnowledgeBaseManager:
         original_file_name: str,
         content_type: str,
         chunks: list[Document],
+        allocator: _PassageIdAllocator,
+        passage_ids: list[str | None] | None = None,
     ) -> list[Document]:
+        """
+        补全分块 metadata 并分配 passage id；passage_ids 中非空的位置沿用给定 id，
+        其余按内容哈希由 allocator 分配。
+        """
         prepared_documents: list[Document] = []
         for index, chunk in enumerate(chunks, start=1):
             metadata = dict(chunk.metadata or {})
             segment_id = metadata.get("segment_id") or index
+            chunk_hash = self._chunk_hash(chunk.page_content)
             metadata.update(
                 {
                     "user_id": user_id,
@@ -620,11 +1177,14 @@ class KnowledgeBaseManager:
                     "storage_name": storage_name,
                     "storage_path": str(storage_path),
                     "content_type": content_type or "",
+                    "segment_id": segment_id,
+                    "chunk_hash": chunk_hash,
                 }
             )
+            passage_id = passage_ids[index - 1] if passage_ids else None
             prepared_documents.append(
                 Document(
-                    id=f"{document_id}_{segment_id}",
+                    id=passage_id or allocator.allocate(chunk_hash),
                     page_content=chunk.page_content,
                     metadata=metadata,
                 )
@@ -706,11 +1266,18 @@ class KnowledgeBaseManager:
                         "file_size": {"type": "long"},
                         "chunk_count": {"type": "integer"},
                         "storage_path": {"type": "keyword"},
+                        "content_hash": {"type": "keyword"},
                         "created_at": {"type": "date"},
                         "updated_at": {"type": "date"},
                     }
                 },
             )
+        else:
+            # 旧索引补充 content_hash 映射，新增字段不影响已有数据
+            self.es.es_client.indices.put_mapping(
+                index=self.DOCUMENT_INDEX,
+                properties={"content_hash": {"type": "keyword"}},
+            )
 
     def _get_owned_document(
         self,
@@ -795,16 +1362,20 @@ class KnowledgeBaseManager:
         return normalized_page, normalized_page_size
 
     def _search_ids_by_term(
-        self, *, index_name: str, field: str, value: str, size: int
+        self, *, index_name: str, field: str, value: str
     ) -> list[str]:
         if not self.es.es_client.indices.exists(index=index_name):
             return []
-        results = self.es.es_client.search(
-            index=index_name,
-            body={"query": {"term": {field: value}}, "_source": False},
-            size=size,
-        )
-        return [hit["_id"] for hit in results["hits"]["hits"]]
+        return [
+            hit["_id"]
+            for hit in scan(
+                self.es.es_client,
+                index=index_name,
+                query={"query": {"term": {field: value}}},
+                _source=False,
+                size=5000,
+            )
+        ]
 
     def _count_documents(self, *, index_name: str, query: dict[str, Any]) -> int:
         if not self.es.es_client.indices.exists(index=index_name):
@@ -852,5 +1423,9 @@ knowledge_base_manager = KnowledgeBaseManager(
         username=settings.ES_URSR,
         password=settings.ES_PWD,
         embedding_model=embeddings,
+        embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+        embedding_concurrency=settings.EMBEDDING_CONCURRENCY,
+        embedding_max_retries=settings.EMBEDDING_MAX_RETRIES,
+        graph_index=graph_index if settings.GRAPH_INDEX_ENABLED else None,
     )
 )
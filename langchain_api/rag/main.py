@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from langchain_api.rag.ingest_jobs import ingest_job_manager
 from langchain_api.rag.management_api import add_knowledge_base_management_endpoints
 from langchain_api.rag.service import add_rag_api_endpoint
 
@@ -8,6 +9,7 @@ def create_rag_router() -> APIRouter:
     router = APIRouter(prefix="/api/rag")
     add_knowledge_base_management_endpoints(router)
     add_rag_api_endpoint(app=router, path="/general_api")
+    ingest_job_manager.resume_pending_jobs()
     return router
 
 
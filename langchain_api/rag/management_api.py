@@ -1,12 +1,16 @@
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
+from langchain_api.rag.cache import EmbeddingCacheStats
+from langchain_api.rag.ingest_jobs import IngestJobRecord, ingest_job_manager
 from langchain_api.rag.knowledge_base import (
     BulkDeleteDocumentResponse,
     BulkDeleteKnowledgeBaseResponse,
     KnowledgeBaseDeleteResult,
     KnowledgeBaseDocumentDetailResponse,
     KnowledgeBaseDocumentRecord,
+    KnowledgeBaseDocumentReplaceResponse,
     KnowledgeBaseRecord,
     PaginatedKnowledgeBaseDocumentResponse,
     PaginatedKnowledgeBaseResponse,
@@ -81,10 +85,35 @@ class BulkDeleteKnowledgeBaseDocumentRequest(BaseModel):
     document_ids: list[str] = Field(default_factory=list)
 
 
+class PurgeTripletCacheRequest(BaseModel):
+    chat_model: str | None = Field(
+        None, description="Only purge entries of this chat model; purge all when empty"
+    )
+
+
+class IngestJobDetailRequest(BaseModel):
+    user_id: str = Field(..., description="User ID")
+    job_id: str = Field(..., description="Ingest job ID")
+
+
+class IngestJobListRequest(BaseModel):
+    user_id: str = Field(..., description="User ID")
+    knowledge_base_id: str | None = Field(None, description="Knowledge base ID")
+    limit: int = Field(20, description="Max number of jobs")
+
+
 def _handle_value_error(exc: ValueError) -> HTTPException:
     return HTTPException(status_code=400, detail=str(exc))
 
 
+def _to_uploaded_file(file: UploadFile) -> UploadedKnowledgeFile:
+    return UploadedKnowledgeFile(
+        file_name=file.filename or "unnamed",
+        content_type=file.content_type or "",
+        stream=file.file,
+    )
+
+
 def add_knowledge_base_management_endpoints(router: APIRouter) -> None:
     @router.post("/knowledge-bases/list", response_model=PaginatedKnowledgeBaseResponse)
     def list_knowledge_bases(request: KnowledgeBaseListRequest):
@@ -191,27 +220,112 @@ def add_knowledge_base_management_endpoints(router: APIRouter) -> None:
         user_id: str = Form(..., description="User ID"),
         knowledge_base_id: str = Form(..., description="Knowledge base ID"),
         files: list[UploadFile] = File(..., description="Uploaded files"),
+        use_triplet_cache: bool | None = Form(
+            None, description="Reuse cached triplet extraction results"
+        ),
+        background: bool = Form(
+            True, description="Ingest in a background job and return its job_id"
+        ),
     ):
-        uploaded_files: list[UploadedKnowledgeFile] = []
-        for file in files:
-            uploaded_files.append(
-                UploadedKnowledgeFile(
-                    file_name=file.filename or "unnamed",
-                    content_type=file.content_type or "",
-                    data=await file.read(),
+        # 直接把上传的临时文件按块写入存储目录，不把文件内容读进内存
+        uploaded_files = [_to_uploaded_file(file) for file in files]
+        try:
+            if background:
+                job = await run_in_threadpool(
+                    ingest_job_manager.submit,
+                    user_id,
+                    knowledge_base_id,
+                    uploaded_files,
+                    use_triplet_cache=use_triplet_cache,
+                )
+                knowledge_base = await run_in_threadpool(
+                    knowledge_base_manager.get_knowledge_base,
+                    user_id,
+                    knowledge_base_id,
+                )
+                return KnowledgeBaseUploadResponse(
+                    knowledge_base=knowledge_base, job_id=job.job_id
                 )
+            return await run_in_threadpool(
+                knowledge_base_manager.upload_documents,
+                user_id=user_id,
+                knowledge_base_id=knowledge_base_id,
+                files=uploaded_files,
+                use_triplet_cache=use_triplet_cache,
             )
+        except ValueError as exc:
+            raise _handle_value_error(exc) from exc
+        finally:
+            for file in files:
+                await file.close()
+
+    @router.post(
+        "/knowledge-bases/documents/replace",
+        response_model=KnowledgeBaseDocumentReplaceResponse,
+    )
+    async def replace_document(
+        user_id: str = Form(..., description="User ID"),
+        knowledge_base_id: str = Form(..., description="Knowledge base ID"),
+        document_id: str = Form(..., description="Document ID to replace"),
+        file: UploadFile = File(..., description="New version of the file"),
+        use_triplet_cache: bool | None = Form(
+            None, description="Reuse cached triplet extraction results"
+        ),
+        background: bool = Form(
+            True, description="Replace in a background job and return its job_id"
+        ),
+    ):
+        uploaded_file = _to_uploaded_file(file)
+        try:
+            if background:
+                job = await run_in_threadpool(
+                    ingest_job_manager.submit_replace,
+                    user_id,
+                    knowledge_base_id,
+                    document_id,
+                    uploaded_file,
+                    use_triplet_cache=use_triplet_cache,
+                )
+                # 替换结果在任务完成后才有，这里只返回 job_id
+                knowledge_base = await run_in_threadpool(
+                    knowledge_base_manager.get_knowledge_base,
+                    user_id,
+                    knowledge_base_id,
+                )
+                return KnowledgeBaseDocumentReplaceResponse(
+                    knowledge_base=knowledge_base, job_id=job.job_id
+                )
+            return await run_in_threadpool(
+                knowledge_base_manager.replace_document,
+                user_id,
+                knowledge_base_id,
+                document_id,
+                uploaded_file,
+                use_triplet_cache=use_triplet_cache,
+            )
+        except ValueError as exc:
+            raise _handle_value_error(exc) from exc
+        finally:
             await file.close()
 
+    @router.post("/knowledge-bases/jobs/detail", response_model=IngestJobRecord)
+    def get_ingest_job(request: IngestJobDetailRequest):
         try:
-            return knowledge_base_manager.upload_documents(
-                user_id=user_id,
-                knowledge_base_id=knowledge_base_id,
-                files=uploaded_files,
+            return ingest_job_manager.get_job(
+                user_id=request.user_id,
+                job_id=request.job_id,
             )
         except ValueError as exc:
             raise _handle_value_error(exc) from exc
 
+    @router.post("/knowledge-bases/jobs/list", response_model=list[IngestJobRecord])
+    def list_ingest_jobs(request: IngestJobListRequest):
+        return ingest_job_manager.list_jobs(
+            user_id=request.user_id,
+            knowledge_base_id=request.knowledge_base_id,
+            limit=request.limit,
+        )
+
     @router.post(
         "/knowledge-bases/documents/update",
         response_model=KnowledgeBaseDocumentRecord,
@@ -251,3 +365,14 @@ def add_knowledge_base_management_endpoints(router: APIRouter) -> None:
             )
         except ValueError as exc:
             raise _handle_value_error(exc) from exc
+
+    @router.post("/embedding-cache/stats", response_model=EmbeddingCacheStats)
+    def embedding_cache_stats():
+        try:
+            return knowledge_base_manager.embedding_cache_stats()
+        except ValueError as exc:
+            raise _handle_value_error(exc) from exc
+
+    @router.post("/triplet-cache/purge")
+    def purge_triplet_cache(request: PurgeTripletCacheRequest):
+        return knowledge_base_manager.purge_triplet_cache(chat_model=request.chat_model)
@@ -2,6 +2,7 @@ from langchain.tools import tool
 
 from langchain_api.rag.elastic_graph_rag import ElasticGraphRAG
 from langchain_api.rag.elastic_utils import Elasticsearch
+from langchain_api.rag.graph_index import graph_index
 from langchain_api.settings import settings
 from langchain_api.utils import get_embedding_model
 
@@ -13,6 +14,10 @@ es_retriever = Elasticsearch(
     username=settings.ES_URSR,
     password=settings.ES_PWD,
     embedding_model=embeddings,
+    embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+    embedding_concurrency=settings.EMBEDDING_CONCURRENCY,
+    embedding_max_retries=settings.EMBEDDING_MAX_RETRIES,
+    graph_index=graph_index if settings.GRAPH_INDEX_ENABLED else None,
 )
 
 
@@ -37,6 +42,10 @@ def retrieve_graph_context(query: str, graph_name: str = DEFAULT_INDEX_NAME):
         username=settings.ES_URSR,
         password=settings.ES_PWD,
         embedding_model=embeddings,
+        embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+        embedding_concurrency=settings.EMBEDDING_CONCURRENCY,
+        embedding_max_retries=settings.EMBEDDING_MAX_RETRIES,
+        graph_index=graph_index if settings.GRAPH_INDEX_ENABLED else None,
     )
     rag = ElasticGraphRAG(es=es, graph_name=graph_name)
     result = rag.retrieve(query=query, k=5)
@@ -1,22 +1,33 @@
+import bisect
 import copy
+import csv
 import io
+import itertools
+import multiprocessing
+import multiprocessing.util
 import os
+import queue
 import re
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import unicodedata
 import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
 from importlib import import_module
+from multiprocessing.managers import SyncManager
 from pathlib import Path
-from typing import Any, Iterable, List, Optional, Protocol
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Protocol
 
 import fitz
 import pandas as pd
 import pdfplumber
-import PyPDF2
 from langchain_core.documents import Document
 from langchain_text_splitters.character import (
     RecursiveCharacterTextSplitter,
@@ -25,6 +36,46 @@ from loguru import logger
 from PIL import Image, UnidentifiedImageError
 
 from langchain_api.constant import workspace_path
+from langchain_api.rag.cache import ConvertedPDFCache, get_converted_pdf_cache
+from langchain_api.settings import settings
+
+
+# 以标点结尾的文本不是标题
+ENDS_IN_PUNCT_RE = re.compile(r"[^\w\s]\Z")
+MULTI_NEWLINE_RE = re.compile(r"\n{2,}")
+MARKDOWN_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)(?:\s+#+)?\s*$")
+MARKDOWN_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文按 1 字 1 token，其余按 4 字符 1 token。"""
+    cjk_count = sum(1 for char in text if "\u4e00" <= char <= "\u9fff")
+    return cjk_count + (len(text) - cjk_count) // 4 + 1
+
+
+def get_length_function(unit: str) -> Callable[[str], int]:
+    """
+    分块长度的计量方式：
+    - chars：字符数（默认）；
+    - estimate：按 estimate_tokens 估算 token 数，不依赖分词器；
+    - 其他值视为 tiktoken 编码名（如 cl100k_base），需要安装 tiktoken。
+    """
+    if unit in ("", "chars"):
+        return len
+    if unit == "estimate":
+        return estimate_tokens
+    try:
+        import tiktoken
+    except ImportError as exc:
+        raise ImportError(
+            f"TEXT_SPLITTER_LENGTH_UNIT={unit} 需要安装 tiktoken：pip install tiktoken"
+        ) from exc
+    encoding = tiktoken.get_encoding(unit)
+
+    def _tiktoken_length(text: str) -> int:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return _tiktoken_length
 
 
 def _split_text_with_regex_from_end(
@@ -34,13 +85,26 @@ def _split_text_with_regex_from_end(
     if separator:
         if keep_separator:
             # The parentheses in the pattern keep the delimiters in the result.
-            _splits = re.split(f"({separator})", text)
+            pattern = re.compile(f"({separator})")
+        else:
+            pattern = re.compile(separator)
+    else:
+        pattern = None
+    return _split_text_with_pattern(text, pattern, keep_separator)
+
+
+def _split_text_with_pattern(
+    text: str, pattern: Optional[re.Pattern], keep_separator: bool
+) -> List[str]:
+    """按预编译的分隔符切分；keep_separator 时 pattern 需带一个捕获分组。"""
+    if pattern is not None:
+        if keep_separator:
+            _splits = pattern.split(text)
             splits = ["".join(i) for i in zip(_splits[0::2], _splits[1::2])]
             if len(_splits) % 2 == 1:
                 splits += _splits[-1:]
-            # splits = [_splits[0]] + splits
         else:
-            splits = re.split(separator, text)
+            splits = pattern.split(text)
     else:
         splits = list(text)
     return [s for s in splits if s != ""]
@@ -52,10 +116,13 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
         separators: Optional[List[str]] = None,
         keep_separator: bool = True,
         is_separator_regex: bool = True,
+        merge_max_length: int = 2000,
         **kwargs: Any,
     ) -> None:
         """Create a new TextSplitter."""
         super().__init__(keep_separator=keep_separator, **kwargs)
+        # 小分块合并后的目标长度，与 chunk_size 使用同一个 length_function 计量
+        self._merge_max_length = merge_max_length
         self._separators = separators or [
             "\n\n",
             "\n",
@@ -65,6 +132,25 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
             r"，|,\s",
         ]
         self._is_separator_regex = is_separator_regex
+        # 分隔符 -> (查找用正则, 切分用正则)，递归切分时复用
+        self._separator_patterns: dict[
+            str, tuple[re.Pattern, Optional[re.Pattern]]
+        ] = {}
+
+    def _get_separator_patterns(
+        self, separator: str
+    ) -> tuple[re.Pattern, Optional[re.Pattern]]:
+        patterns = self._separator_patterns.get(separator)
+        if patterns is None:
+            regex = separator if self._is_separator_regex else re.escape(separator)
+            split_pattern = None
+            if separator:
+                split_pattern = re.compile(
+                    f"({regex})" if self._keep_separator else regex
+                )
+            patterns = (re.compile(regex), split_pattern)
+            self._separator_patterns[separator] = patterns
+        return patterns
 
     def under_non_alpha_ratio(self, text: str, threshold: float = 0.5):
         """Checks if the proportion of non-alpha characters in the text snippet exceeds a given
@@ -82,8 +168,13 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
         if len(text) == 0:
             return False
 
-        alpha_count = len([char for char in text if char.strip() and char.isalpha()])
-        total_count = len([char for char in text if char.strip()])
+        alpha_count = 0
+        total_count = 0
+        for char in text:
+            if char.strip():
+                total_count += 1
+                if char.isalpha():
+                    alpha_count += 1
         try:
             ratio = alpha_count / total_count
             return ratio < threshold
@@ -114,8 +205,6 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
             return (False, 0)
 
         # 文本中有标点符号，就不是title
-        ENDS_IN_PUNCT_PATTERN = r"[^\w\s]\Z"
-        ENDS_IN_PUNCT_RE = re.compile(ENDS_IN_PUNCT_PATTERN)
         if ENDS_IN_PUNCT_RE.search(text) is not None:
             return (False, 0)
 
@@ -142,27 +231,58 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
             text_5 = text
         else:
             text_5 = text[:5]
-        alpha_in_text_5 = sum(list(map(lambda x: x.isnumeric(), list(text_5))))
-        if not alpha_in_text_5:
+        if not any(char.isnumeric() for char in text_5):
             return (False, 0)
 
         return (True, 0)
 
     def split_documents3(
-        self, documents: Iterable[Document], chunk_size: int = 20
+        self,
+        documents: Iterable[Document],
+        chunk_size: int = 20,
+        merge_max_length: Optional[int] = None,
     ) -> List[Document]:
         """
         处理Document对象列表，合并跨页标题内容
         输入: List[Document] (每个Document包含content和metadata)
         输出: 按标题分块的新Document列表
         """
-        chunks = []
+        # 按页码排序确保顺序（假设metadata中有page_num）
+        sorted_docs = sorted(documents, key=lambda x: x.metadata.get("pages_number", 0))
+        return list(
+            self.iter_split_documents3(sorted_docs, merge_max_length=merge_max_length)
+        )
+
+    def iter_split_documents3(
+        self,
+        documents: Iterable[Document],
+        merge_threshold: int = 100,
+        merge_max_length: Optional[int] = None,
+    ) -> Iterator[Document]:
+        """
+        split_documents3 的流式版本，documents 需已按页码排序。
+
+        分块数不超过 merge_threshold 时原样输出；超过后与 split_documents3 一致，
+        改为合并小分块输出。因此只有前 merge_threshold + 1 个分块需要缓存。
+        """
+        if merge_max_length is None:
+            merge_max_length = self._merge_max_length
+        chunks = self._iter_title_chunks(documents)
+        buffered: list[Document] = []
+        for chunk in chunks:
+            buffered.append(chunk)
+            if len(buffered) > merge_threshold:
+                yield from self.iter_merge_chunks_simple(
+                    itertools.chain(buffered, chunks), max_length=merge_max_length
+                )
+                return
+        yield from buffered
+
+    def _iter_title_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
         current_chunk_content = []
         current_chunk_meta = None
 
-        # 按页码排序确保顺序（假设metadata中有page_num）
-        sorted_docs = sorted(documents, key=lambda x: x.metadata.get("pages_number", 0))
-        for doc in sorted_docs:
+        for doc in documents:
             lines = doc.page_content.split("\n")
             for line in lines:
                 line = line.strip()
@@ -180,11 +300,9 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
                             if not line.startswith("#  ")
                         )
                         # 创建新Document对象
-                        chunks.append(
-                            Document(
-                                page_content="\n".join(current_chunk_content),
-                                metadata=current_chunk_meta,
-                            )
+                        yield Document(
+                            page_content="\n".join(current_chunk_content),
+                            metadata=current_chunk_meta,
                         )
 
                     # 开始新chunk
@@ -221,44 +339,53 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
                 line for line in current_chunk_content if not line.startswith("#  ")
             )
 
-            chunks.append(
-                Document(
-                    page_content="\n".join(current_chunk_content),
-                    metadata=current_chunk_meta,
-                )
+            yield Document(
+                page_content="\n".join(current_chunk_content),
+                metadata=current_chunk_meta,
             )
 
-        if len(chunks) > 100:
-            chunks = self.merge_chunks_simple(chunks=chunks, max_length=2000)
-
-        return chunks
-
     #     pass
 
     def merge_chunks_simple(
-        self, chunks: List[Document], max_length: int = 500
+        self,
+        chunks: List[Document],
+        max_length: int = 500,
+        length_function: Optional[Callable[[str], int]] = None,
     ) -> List[Document]:
         """
         合并过小的chunks直到达到指定长度
         chunks: 已划分的Document列表
-        max_length: 最小目标长度（字符数）
+        max_length: 最小目标长度（按 length_function 计量，默认与分块器一致）
         返回: 合并后的Document列表
         """
-        if not chunks:
-            return []
+        return list(
+            self.iter_merge_chunks_simple(
+                chunks, max_length=max_length, length_function=length_function
+            )
+        )
 
-        merged_chunks = []
+    def iter_merge_chunks_simple(
+        self,
+        chunks: Iterable[Document],
+        max_length: int = 500,
+        length_function: Optional[Callable[[str], int]] = None,
+    ) -> Iterator[Document]:
+        """
+        merge_chunks_simple 的流式版本，每个合并块完成后立即输出。
+
+        合并块长度按分块累加，每个分块只计量一次。
+        """
+        if length_function is None:
+            length_function = self._length_function
         current_content = []
         current_meta = None
         temp_contents = []  # 用于收集原始内容
+        current_len = 0
 
         for chunk in chunks:
             # 获取chunk的原始文本（不含markdown标记）
             page_content = chunk.page_content
-
-            # 计算当前内容长度（如果已经有内容）
-            current_len = len("".join(temp_contents)) if temp_contents else 0
-            chunk_len = len(page_content)
+            chunk_len = length_function(page_content)
 
             # 如果是第一个chunk或者当前合并块还很小
             if current_meta is None or current_len + chunk_len <= max_length:
@@ -275,26 +402,25 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
                 # 收集内容
                 temp_contents.append(page_content)
                 current_content.append(page_content)
+                current_len += chunk_len
             else:
                 # 当前合并块已达标，保存它
                 if current_content:
-                    merged_chunks.append(
-                        Document(
-                            page_content="\n".join(current_content),
-                            metadata={
-                                "title": current_meta.get(
-                                    "title", "无标题"
-                                ),  # 使用第一个chunk的title
-                                "pages_number": current_meta.get(
-                                    "pages_number"
-                                ),  # 使用第一个chunk的页码
-                                "content_table": [],
-                                "content_image": [],
-                                "ori_text": "\n".join(temp_contents),
-                                "is_merged": True,
-                                "merged_from": current_meta["merged_from"],
-                            },
-                        )
+                    yield Document(
+                        page_content="\n".join(current_content),
+                        metadata={
+                            "title": current_meta.get(
+                                "title", "无标题"
+                            ),  # 使用第一个chunk的title
+                            "pages_number": current_meta.get(
+                                "pages_number"
+                            ),  # 使用第一个chunk的页码
+                            "content_table": [],
+                            "content_image": [],
+                            "ori_text": "\n".join(temp_contents),
+                            "is_merged": True,
+                            "merged_from": current_meta["merged_from"],
+                        },
                     )
 
                 # 开始新的合并块，以当前chunk为起点
@@ -302,26 +428,23 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
                 current_meta = chunk.metadata.copy()
                 current_meta["merged_from"] = [current_meta.get("title", "无标题")]
                 temp_contents = [page_content]
+                current_len = chunk_len
 
         # 处理最后一个合并块
         if current_content:
-            merged_chunks.append(
-                Document(
-                    page_content="\n".join(current_content),
-                    metadata={
-                        "title": current_meta.get("title", "无标题"),
-                        "pages_number": current_meta.get("pages_number"),
-                        "content_table": [],
-                        "content_image": [],
-                        "ori_text": "\n".join(temp_contents),
-                        "is_merged": True,
-                        "merged_from": current_meta["merged_from"],
-                    },
-                )
+            yield Document(
+                page_content="\n".join(current_content),
+                metadata={
+                    "title": current_meta.get("title", "无标题"),
+                    "pages_number": current_meta.get("pages_number"),
+                    "content_table": [],
+                    "content_image": [],
+                    "ori_text": "\n".join(temp_contents),
+                    "is_merged": True,
+                    "merged_from": current_meta["merged_from"],
+                },
             )
 
-        return merged_chunks
-
     def split_documents2(
         self, documents: Iterable[Document], chunk_size: int = 20
     ) -> List[Document]:
@@ -368,17 +491,17 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
         separator = separators[-1]
         new_separators = []
         for i, _s in enumerate(separators):
-            _separator = _s if self._is_separator_regex else re.escape(_s)
             if _s == "":
                 separator = _s
                 break
-            if re.search(_separator, text):
+            if self._get_separator_patterns(_s)[0].search(text):
                 separator = _s
                 new_separators = separators[i + 1 :]
                 break
 
-        _separator = separator if self._is_separator_regex else re.escape(separator)
-        splits = _split_text_with_regex_from_end(text, _separator, self._keep_separator)
+        splits = _split_text_with_pattern(
+            text, self._get_separator_patterns(separator)[1], self._keep_separator
+        )
 
         # Now go merging things, recursively splitting longer texts.
         _good_splits = []
@@ -399,72 +522,156 @@ class ChineseRecursiveTextSplitter(RecursiveCharacterTextSplitter):
         if _good_splits:
             merged_text = self._merge_splits(_good_splits, _separator)
             final_chunks.extend(merged_text)
+        stripped_chunks = (chunk.strip() for chunk in final_chunks)
         return [
-            re.sub(r"\n{2,}", "\n", chunk.strip())
-            for chunk in final_chunks
-            if chunk.strip() != ""
+            MULTI_NEWLINE_RE.sub("\n", chunk) for chunk in stripped_chunks if chunk
         ]
 
 
+# 分块长度默认按字符计量；设置 TEXT_SPLITTER_LENGTH_UNIT 后 chunk_size 与合并长度按 token 计量
 text_splitter = ChineseRecursiveTextSplitter(
-    chunk_size=600,
+    chunk_size=settings.TEXT_SPLITTER_CHUNK_SIZE,
     chunk_overlap=0,
+    merge_max_length=settings.TEXT_SPLITTER_MERGE_MAX_LENGTH,
+    length_function=get_length_function(settings.TEXT_SPLITTER_LENGTH_UNIT),
 )
 
 
-def get_max_depth(outline, current_depth=1):
-    """
-    递归地遍历目录结构，确定最大深度。
-
-    :param outline: 目录项列表
-    :param current_depth: 当前深度
-    :return: 最大深度
-    """
-    max_depth = current_depth
-    for item in outline:
-        if isinstance(item, list):
-            max_depth = max(max_depth, get_max_depth(item, current_depth + 1))
-    return max_depth
-
-
-def detect_pdf_structure(file_bytes):
-    # new way
-    # doc = fitz.Document(stream=file_bytes)
-    # title_info = doc.get_toc()
-    # title_level_list = [i[0] for i in title_info]
-
-    # TextIO and BinaryIO.
-    stream = io.BytesIO(file_bytes)
-    reader = PyPDF2.PdfReader(stream)
-    outlines = reader.outline
-
-    toc = list(outlines)
-    if not toc:
+def get_toc_structure(title_info: list) -> dict[str, Any]:
+    """根据 fitz 的 get_toc() 结果判断切分策略：没有目录时按长度切分，否则按目录最大层级切分。"""
+    if not title_info:
         return {"split_strategy": "chunksplit"}
-
-    max_depth = get_max_depth(toc)
     return {
         "split_strategy": "titlesplit",
-        "max_title_level": max_depth,
+        "max_title_level": max(item[0] for item in title_info),
     }
 
 
+def extract_fitz_page_text(
+    page: fitz.Page, y_tolerance: float = 3.0, x_tolerance: float = 3.0
+) -> str:
+    """
+    用 fitz 的单词坐标重建页面文本行，行为与 pdfplumber 的 extract_text 保持一致：
+    底边相差 y_tolerance 以内的单词归为同一行，行内间距超过 x_tolerance 时补空格。
+    """
+    words = page.get_text("words")
+    if not words:
+        return ""
+
+    words.sort(key=lambda word: (word[3], word[0]))
+    lines: list[list[tuple]] = []
+    line_bottom = 0.0
+    for word in words:
+        if not lines or abs(word[3] - line_bottom) > y_tolerance:
+            lines.append([])
+            line_bottom = word[3]
+        lines[-1].append(word)
+
+    lines.sort(key=lambda line: min(word[1] for word in line))
+    text_lines = []
+    for line in lines:
+        line.sort(key=lambda word: word[0])
+        parts = []
+        previous_x1 = None
+        for word in line:
+            if previous_x1 is not None and word[0] - previous_x1 > x_tolerance:
+                parts.append(" ")
+            parts.append(word[4])
+            previous_x1 = word[2]
+        text_lines.append("".join(parts))
+    return "\n".join(text_lines)
+
+
 def find_nearest_line(text_lines, chars, anchor_y):
-    nearest_line_index = None
-    nearest_line_y = None
-    min_distance = float("inf")
-
-    for index, line in enumerate(text_lines):
-        line_chars = [char for char in chars if char["text"] in line]
-        if line_chars:
-            line_y = sum(char["top"] for char in line_chars) / len(line_chars)
-            distance = abs(line_y - anchor_y)
-            if distance < min_distance:
+    return PageLineIndex(text_lines, chars).find_nearest_line(anchor_y)
+
+
+class PageLineIndex:
+    """
+    页面文本行的纵向位置索引，同一页的所有图片共用。
+
+    行的 y 坐标沿用原算法：页面上所有字符文本出现在该行中的字符 top 的平均值。
+    字符先按文本聚合出 top 之和与个数，每行只需遍历行内的不同字符；
+    行按 y 排序后用 bisect 查找最近行，距离相同时取行号最小者。
+    插入图片标记会改变所在行的内容，只重新计算这一行。
+    """
+
+    def __init__(self, text_lines: list[str], chars: list[dict[str, Any]]):
+        self.text_lines = list(text_lines)
+        self._top_by_text: dict[str, list[float]] = {}
+        for char in chars:
+            stats = self._top_by_text.setdefault(char["text"], [0.0, 0])
+            stats[0] += char["top"]
+            stats[1] += 1
+        # 连字等多字符文本按子串判断是否属于某行
+        self._multi_char_texts = [
+            text for text in self._top_by_text if len(text) != 1
+        ]
+        self._line_y: list[float | None] = [
+            self._compute_line_y(line) for line in self.text_lines
+        ]
+        self._entries = sorted(
+            (line_y, index)
+            for index, line_y in enumerate(self._line_y)
+            if line_y is not None
+        )
+
+    def _compute_line_y(self, line: str) -> float | None:
+        total_top = 0.0
+        count = 0
+        for text in set(line):
+            stats = self._top_by_text.get(text)
+            if stats is not None:
+                total_top += stats[0]
+                count += stats[1]
+        for text in self._multi_char_texts:
+            if text in line:
+                total_top += self._top_by_text[text][0]
+                count += self._top_by_text[text][1]
+        if not count:
+            return None
+        return total_top / count
+
+    def find_nearest_line(self, anchor_y: float) -> tuple[int | None, float | None]:
+        if not self._entries:
+            return None, None
+
+        position = bisect.bisect_left(self._entries, (anchor_y, -1))
+        neighbours = []
+        if position > 0:
+            neighbours.append(self._entries[position - 1][0])
+        if position < len(self._entries):
+            neighbours.append(self._entries[position][0])
+        min_distance = min(abs(line_y - anchor_y) for line_y in neighbours)
+
+        nearest_line_index = None
+        nearest_line_y = None
+        for line_y in neighbours:
+            if abs(line_y - anchor_y) != min_distance:
+                continue
+            # 同一 y 值的行在 entries 中按行号升序排列，取第一个
+            index = self._entries[bisect.bisect_left(self._entries, (line_y, -1))][1]
+            if nearest_line_index is None or index < nearest_line_index:
                 nearest_line_index = index
                 nearest_line_y = line_y
-                min_distance = distance
-
-    return nearest_line_index, nearest_line_y
+        return nearest_line_index, nearest_line_y
+
+    def insert_mark(self, bbox, mark: str) -> str:
+        """在最接近 bbox 顶部的文本行末尾插入标记，返回整页文本。"""
+        nearest_line_index, _ = self.find_nearest_line(bbox[1])
+        if nearest_line_index is not None:
+            self.text_lines[nearest_line_index] += " " + mark
+            self._update_line(nearest_line_index)
+        return "\n".join(self.text_lines)
+
+    def _update_line(self, index: int) -> None:
+        old_y = self._line_y[index]
+        if old_y is not None:
+            del self._entries[bisect.bisect_left(self._entries, (old_y, index))]
+        new_y = self._compute_line_y(self.text_lines[index])
+        self._line_y[index] = new_y
+        if new_y is not None:
+            bisect.insort(self._entries, (new_y, index))
 
 
 def extract_parent_title(title_info, sub_title, cur_level):
@@ -521,6 +728,103 @@ def levenshtein_distance(s1, s2):
     return previous_row[-1]
 
 
+def bounded_levenshtein(s1: str, s2: str, max_distance: int) -> int:
+    """
+    带上界的编辑距离：只计算对角线附近宽度为 2 * max_distance + 1 的带状区域，
+    某一行的最小值超过上界时提前结束；距离大于 max_distance 时统一返回 max_distance + 1。
+    """
+    if s1 == s2:
+        return 0
+    limit = max_distance + 1
+    if abs(len(s1) - len(s2)) > max_distance:
+        return limit
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+
+    # 去掉公共前后缀，不影响编辑距离
+    start = 0
+    while start < len(s1) and s1[start] == s2[start]:
+        start += 1
+    end1, end2 = len(s1), len(s2)
+    while end1 > start and s1[end1 - 1] == s2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    s1 = s1[start:end1]
+    s2 = s2[start:end2]
+    len1, len2 = len(s1), len(s2)
+    if len1 == 0:
+        return len2 if len2 <= max_distance else limit
+
+    previous_row = [j if j <= max_distance else limit for j in range(len2 + 1)]
+    for i in range(1, len1 + 1):
+        c1 = s1[i - 1]
+        low = max(1, i - max_distance)
+        high = min(len2, i + max_distance)
+        current_row = [limit] * (len2 + 1)
+        current_row[0] = i if i <= max_distance else limit
+        row_min = current_row[0]
+        for j in range(low, high + 1):
+            value = min(
+                previous_row[j - 1] + (c1 != s2[j - 1]),
+                previous_row[j] + 1,
+                current_row[j - 1] + 1,
+                limit,
+            )
+            current_row[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return limit
+        previous_row = current_row
+
+    return previous_row[len2]
+
+
+class TitleLocator:
+    """
+    在一段文本行中定位目录标题，结果与逐行调用 levenshtein_distance(line, title) <= max_distance
+    取第一个命中行一致。
+
+    - 行文本精确匹配用字典查找，命中后只需在它之前的行里找模糊匹配；
+    - 编辑距离不超过 max_distance 的两行长度差也不超过 max_distance，按行长度建立索引，
+      只对长度相近的候选行计算带上界的编辑距离。
+    """
+
+    def __init__(self, lines: list[str], max_distance: int = 2):
+        self.max_distance = max_distance
+        self._exact: dict[str, int] = {}
+        self._by_length: dict[int, list[int]] = {}
+        self._lines = lines
+        for index, line in enumerate(lines):
+            self._exact.setdefault(line, index)
+            self._by_length.setdefault(len(line), []).append(index)
+
+    def find(self, title: str, skip: int | None = None) -> int | None:
+        """返回第一个与 title 距离不超过 max_distance 的行号，跳过行号 skip。"""
+        stop = self._exact.get(title)
+        if stop == skip:
+            # 被跳过的行不能作为上界，后面可能还有同样的行
+            stop = None
+        candidates = []
+        for length in range(
+            max(0, len(title) - self.max_distance),
+            len(title) + self.max_distance + 1,
+        ):
+            candidates.extend(self._by_length.get(length, ()))
+        candidates.sort()
+        for index in candidates:
+            if stop is not None and index >= stop:
+                break
+            if index == skip:
+                continue
+            if (
+                bounded_levenshtein(self._lines[index], title, self.max_distance)
+                <= self.max_distance
+            ):
+                return index
+        return stop
+
+
 def extract_toc_from_fitz(title_info, level):
     """
     从PDF目录大纲中提取指定级别的标题。
@@ -538,13 +842,10 @@ def extract_toc_from_fitz(title_info, level):
 
 def insert_mark_near_position(text_lines, chars, bbox, mark):
     # 找到最接近边界框顶部的文本行
-    nearest_line_index, nearest_line_y = find_nearest_line(text_lines, chars, bbox[1])
-
-    if nearest_line_index is not None:
-        # 在最接近的文本行插入标记
-        text_lines[nearest_line_index] += " " + mark
-
-    return "\n".join(text_lines)
+    line_index = PageLineIndex(text_lines, chars)
+    text = line_index.insert_mark(bbox, mark)
+    text_lines[:] = line_index.text_lines
+    return text
 
 
 def convert_title_with_paragraph_breaks(text):
@@ -697,6 +998,137 @@ class Boto3PDFReader:
         )
 
 
+class LibreOfficePool:
+    """
+    LibreOffice 转换槽位池。
+
+    每个槽位有独立的用户配置目录（-env:UserInstallation），首次转换后配置目录保留复用，
+    省去每次启动时初始化配置的开销，并避免多个 soffice 争用同一配置目录的锁。
+    同时运行的转换数不超过槽位数，其余请求排队等待；单次转换超时会结束整个进程组，
+    超时或异常退出的槽位会重置配置目录，下次转换时重新初始化。
+
+    每个进程各自持有一个池，启用解析进程池时总并发为 解析进程数 × 槽位数。
+    """
+
+    def __init__(
+        self,
+        soffice_path: Path,
+        max_workers: int = 2,
+        timeout: float = 120,
+        profile_root: str | Path | None = None,
+    ):
+        self.soffice_path = soffice_path
+        self.timeout = timeout
+        self.profile_root = Path(
+            profile_root or tempfile.mkdtemp(prefix="rag-soffice-profiles-")
+        )
+        self._slots: queue.Queue[int] = queue.Queue()
+        for slot in range(max(1, max_workers)):
+            self._slots.put(slot)
+
+    def _profile_dir(self, slot: int) -> Path:
+        return self.profile_root / f"slot_{slot}"
+
+    def _reset_profile(self, slot: int) -> None:
+        shutil.rmtree(self._profile_dir(slot), ignore_errors=True)
+
+    def convert(
+        self, source_path: Path, output_dir: Path
+    ) -> subprocess.CompletedProcess:
+        """把 source_path 转换为 PDF 写入 output_dir，返回 soffice 的执行结果。"""
+        slot = self._slots.get()
+        try:
+            command = [
+                str(self.soffice_path),
+                f"-env:UserInstallation={self._profile_dir(slot).as_uri()}",
+                "--headless",
+                "--norestore",
+                "--nologo",
+                "--nodefault",
+                "--convert-to",
+                "pdf",
+                "--outdir",
+                str(output_dir),
+                str(source_path),
+            ]
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                start_new_session=not sys.platform.startswith("win"),
+            )
+            try:
+                stdout, stderr = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self._kill(process)
+                process.communicate()
+                self._reset_profile(slot)
+                raise RuntimeError(
+                    f"LibreOffice 转换超时（{self.timeout}s），已终止进程："
+                    f"{source_path.name}"
+                )
+            if process.returncode != 0:
+                # 异常退出可能留下损坏的配置目录，重置后下次重新初始化
+                self._reset_profile(slot)
+            return subprocess.CompletedProcess(
+                command, process.returncode, stdout, stderr
+            )
+        finally:
+            self._slots.put(slot)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+        # soffice 会拉起 soffice.bin 子进程，需要结束整个进程组
+        if sys.platform.startswith("win"):
+            process.kill()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self) -> None:
+        shutil.rmtree(self.profile_root, ignore_errors=True)
+
+
+_libreoffice_pools: dict[str, LibreOfficePool] = {}
+_libreoffice_pools_lock = threading.Lock()
+
+
+def _close_libreoffice_pools() -> None:
+    with _libreoffice_pools_lock:
+        for pool in _libreoffice_pools.values():
+            pool.close()
+        _libreoffice_pools.clear()
+
+
+def get_libreoffice_pool(soffice_path: Path) -> LibreOfficePool:
+    """
+    按 soffice 路径共享的转换池；槽位数和超时读取环境变量
+    LIBREOFFICE_MAX_WORKERS、LIBREOFFICE_TIMEOUT。
+    """
+    key = str(soffice_path)
+    with _libreoffice_pools_lock:
+        pool = _libreoffice_pools.get(key)
+        if pool is None:
+            if not _libreoffice_pools:
+                # 与进程池一致，子进程启动时会清空 finalizer 注册表，首次创建时再注册
+                multiprocessing.util.Finalize(
+                    None, _close_libreoffice_pools, exitpriority=50
+                )
+            pool = LibreOfficePool(
+                soffice_path,
+                max_workers=settings.LIBREOFFICE_MAX_WORKERS,
+                timeout=settings.LIBREOFFICE_TIMEOUT,
+            )
+            _libreoffice_pools[key] = pool
+            logger.info(
+                f"LibreOffice 转换池已创建：{soffice_path}，配置目录：{pool.profile_root}"
+            )
+        return pool
+
+
 class FileToPDFConverter:
     IMAGE_SUFFIXES = {
         ".png",
@@ -741,36 +1173,63 @@ class FileToPDFConverter:
         Path(os.environ.get("WINDIR", r"C:\Windows")) / "Fonts" / "simsun.ttc",
     )
     DEFAULT_TEMP_DIR = workspace_path / "converted_pdf"
+    # 转换逻辑或依赖的转换工具行为变化时递增，使旧的转换缓存失效
+    CONVERTER_VERSION = "1"
 
     def __init__(
         self,
         save_converted_pdf_to_temp: bool | None = None,
         temp_dir: str | Path | None = None,
+        pdf_cache: ConvertedPDFCache | None = None,
     ):
+        """
+        pdf_cache 为 None 时按 settings.CONVERTED_PDF_CACHE_ENABLED 和
+        settings.CONVERTED_PDF_CACHE_MAX_MB 使用进程内共享的转换缓存。
+        """
         self.save_converted_pdf_to_temp = self._resolve_save_switch(
             save_converted_pdf_to_temp
         )
         self.temp_dir = Path(temp_dir) if temp_dir else self.DEFAULT_TEMP_DIR
+        if pdf_cache is None and settings.CONVERTED_PDF_CACHE_ENABLED:
+            pdf_cache = get_converted_pdf_cache(
+                max_bytes=settings.CONVERTED_PDF_CACHE_MAX_MB * 1024 * 1024
+            )
+        self.pdf_cache = pdf_cache
 
     def ensure_pdf(self, loaded_file: LoadedPDFFile) -> LoadedPDFFile:
         if self._is_pdf_bytes(loaded_file.file_bytes):
             return loaded_file
 
         suffix = Path(loaded_file.file_name).suffix.lower()
-        logger.info(f"检测到非 PDF 文件，开始转换为 PDF：{loaded_file.file_name}")
         text_content: str | None = None
         if suffix in self.TEXT_SUFFIXES:
             text_content = self._decode_text(loaded_file.file_bytes)
-            pdf_bytes = self._convert_text_to_pdf(text_content)
-        else:
-            pdf_bytes = self._convert_to_pdf(
-                file_bytes=loaded_file.file_bytes,
-                file_name=loaded_file.file_name,
-                suffix=suffix,
+
+        cache_key = None
+        pdf_bytes = None
+        if self.pdf_cache is not None:
+            cache_key = self.pdf_cache.key(
+                self.CONVERTER_VERSION, suffix, loaded_file.file_bytes
             )
+            pdf_bytes = self.pdf_cache.get(cache_key)
+        if pdf_bytes is not None:
+            logger.info(f"命中转换缓存，跳过 PDF 转换：{loaded_file.file_name}")
+        else:
+            logger.info(f"检测到非 PDF 文件，开始转换为 PDF：{loaded_file.file_name}")
+            if text_content is not None:
+                pdf_bytes = self._convert_text_to_pdf(text_content)
+            else:
+                pdf_bytes = self._convert_to_pdf(
+                    file_bytes=loaded_file.file_bytes,
+                    file_name=loaded_file.file_name,
+                    suffix=suffix,
+                )
+            if cache_key is not None:
+                self.pdf_cache.set(cache_key, pdf_bytes)
         converted_pdf_temp_path = self._save_converted_pdf_if_needed(
             pdf_bytes=pdf_bytes,
             source_file_name=loaded_file.file_name,
+            content_key=cache_key,
         )
         return LoadedPDFFile(
             file_bytes=pdf_bytes,
@@ -780,6 +1239,22 @@ class FileToPDFConverter:
             converted_pdf_temp_path=converted_pdf_temp_path,
         )
 
+    def is_text_file(self, loaded_file: LoadedPDFFile) -> bool:
+        return Path(
+            loaded_file.file_name
+        ).suffix.lower() in self.TEXT_SUFFIXES and not self._is_pdf_bytes(
+            loaded_file.file_bytes
+        )
+
+    def load_text(self, loaded_file: LoadedPDFFile) -> LoadedPDFFile:
+        """文本类文件只解码，不渲染为 PDF；切分直接使用 text_content。"""
+        return LoadedPDFFile(
+            file_bytes=loaded_file.file_bytes,
+            file_name=loaded_file.file_name,
+            upload_client=loaded_file.upload_client,
+            text_content=self._decode_text(loaded_file.file_bytes),
+        )
+
     def _is_pdf_bytes(self, file_bytes: bytes) -> bool:
         return file_bytes.lstrip().startswith(b"%PDF-")
 
@@ -945,20 +1420,8 @@ class FileToPDFConverter:
             output_path = source_path.with_suffix(".pdf")
             source_path.write_bytes(file_bytes)
 
-            completed = subprocess.run(
-                [
-                    str(soffice_path),
-                    "--headless",
-                    "--convert-to",
-                    "pdf",
-                    "--outdir",
-                    str(temp_dir_path),
-                    str(source_path),
-                ],
-                capture_output=True,
-                text=True,
-                timeout=120,
-                check=False,
+            completed = get_libreoffice_pool(soffice_path).convert(
+                source_path, temp_dir_path
             )
             if completed.returncode != 0 or not output_path.is_file():
                 stderr = completed.stderr.strip()
@@ -993,22 +1456,30 @@ class FileToPDFConverter:
     def _resolve_save_switch(self, save_converted_pdf_to_temp: bool | None) -> bool:
         if save_converted_pdf_to_temp is not None:
             return save_converted_pdf_to_temp
+        return self._env_switch("SAVE_CONVERTED_PDF_TO_TEMP", True)
 
-        env_value = os.getenv("SAVE_CONVERTED_PDF_TO_TEMP")
+    @staticmethod
+    def _env_switch(name: str, default: bool) -> bool:
+        env_value = os.getenv(name)
         if env_value is None:
-            return True
+            return default
         return env_value.strip().lower() in {"1", "true", "yes", "on"}
 
     def _save_converted_pdf_if_needed(
-        self, pdf_bytes: bytes, source_file_name: str
+        self, pdf_bytes: bytes, source_file_name: str, content_key: str | None = None
     ) -> str | None:
         if not self.save_converted_pdf_to_temp:
             logger.debug("已关闭转换后 PDF 临时落盘开关，跳过保存。")
             return None
 
         self.temp_dir.mkdir(parents=True, exist_ok=True)
-        temp_pdf_name = f"{Path(source_file_name).stem}_{uuid.uuid4().hex}.pdf"
+        # 有内容哈希时同一源文件复用同一个文件名，重复上传不再产生新文件
+        name_suffix = content_key[:16] if content_key else uuid.uuid4().hex
+        temp_pdf_name = f"{Path(source_file_name).stem}_{name_suffix}.pdf"
         temp_pdf_path = self.temp_dir / temp_pdf_name
+        if content_key and temp_pdf_path.is_file():
+            logger.info(f"转换后的 PDF 已存在，复用：{temp_pdf_path}")
+            return str(temp_pdf_path)
         temp_pdf_path.write_bytes(pdf_bytes)
         logger.info(f"已保存转换后的 PDF 到临时目录：{temp_pdf_path}")
         return str(temp_pdf_path)
@@ -1035,8 +1506,357 @@ class FileToPDFConverter:
         return "请安装 LibreOffice，并确认 `soffice` 命令已加入 PATH。"
 
 
+def _extract_single_page(
+    page,
+    page_number: int,
+    *,
+    bucket_name: str,
+    file_path: str,
+    file_id: str,
+    use_table: bool,
+    use_image: bool,
+    s3_client=None,
+) -> dict[str, Any] | None:
+    try:
+        text = page.extract_text() or ""
+    except Exception as exc:
+        logger.warning(f"提取 {file_path} 第 {page_number} 页文本失败：{exc}")
+        return None
+
+    page_image_list: list[str] = []
+    if use_image:
+        # 同一页的图片共用一份行位置索引，首次需要插入标记时再构建
+        line_index = None
+        for image_number, image in enumerate(page.images):
+            try:
+                image_data_bin = image["stream"].get_data()
+                image_data = io.BytesIO(image_data_bin)
+                try:
+                    image_data_ = copy.deepcopy(image_data)
+                    pil_image = Image.open(image_data_)
+                    pil_image.verify()
+                except UnidentifiedImageError:
+                    logger.warning("图片校验失败，跳过当前图片。")
+                    continue
+
+                if line_index is None:
+                    line_index = PageLineIndex(text.split("\n"), page.chars)
+                bbox = (
+                    image["x0"],
+                    image["top"],
+                    image["x1"],
+                    image["bottom"],
+                )
+                image_name = (
+                    f"image_{bucket_name}_{file_id}_"
+                    f"{page_number}_{image_number}.png"
+                )
+                page_image_list.append(f"{bucket_name}/{image_name}")
+                text = line_index.insert_mark(bbox, image_name)
+
+                upload_file_to_mino(
+                    s3_client=s3_client,
+                    bucket_name=bucket_name,
+                    object_name=image_name,
+                    file_data=image_data,
+                    length=len(image_data_bin),
+                )
+            except IndexError:
+                logger.warning("图片上传失败，跳过当前图片。")
+                continue
+
+    page_md_list: list[str] = []
+    if use_table:
+        tables_list = page.extract_tables()
+        tables = page.find_tables()
+        page_table_idx = []
+        if tables:
+            table_id = 0
+            for index, table in enumerate(tables):
+                try:
+                    table_area = page.within_bbox(table.bbox)
+                    table_inner_text = table_area.extract_text()
+                    idx = text.find(table_inner_text)
+                    if idx != -1:
+                        if len(table_inner_text.split("\n")) < 2:
+                            continue
+                        text = text.replace(
+                            table_inner_text,
+                            f"**[TABLE_{table_id}]**",
+                        )
+                        table_id += 1
+                        page_table_idx.append(index)
+                except ValueError:
+                    logger.warning(
+                        "表格解析出现 ValueError，已跳过当前表格。"
+                    )
+
+        for index in page_table_idx:
+            md_list = []
+            for row_index, row_list in enumerate(tables_list[index]):
+                if row_index == 0:
+                    header = [item for item in row_list if item]
+                    header_len = len(header)
+                    md_list.append(header)
+                    continue
+
+                sub_row = [item for item in row_list if item]
+                first_is_none = row_list[0] is None
+                if len(sub_row) == header_len:
+                    md_list.append(sub_row)
+                elif (
+                    len(sub_row) < header_len
+                    and row_index != len(tables_list[index]) - 1
+                ):
+                    md_list[-1][-1] += "".join(sub_row)
+                elif len(sub_row) < header_len and first_is_none:
+                    md_list[-1][-1] += "".join(sub_row)
+                else:
+                    sub_row.extend([""] * (header_len - len(sub_row)))
+                    md_list.append(sub_row)
+
+            columns = [item.replace("\n", "") for item in md_list[0]]
+            df = pd.DataFrame(md_list[1:], columns=columns).map(
+                lambda value: value.replace("\n", "")
+            )
+            page_md_list.append(df.to_markdown(index=False))
+
+    return {
+        "text": text,
+        "pages_number": page_number,
+        "content_table": page_md_list,
+        "content_image": page_image_list,
+    }
+
+
+def _extract_page_range(
+    pdf_path: str,
+    start: int,
+    end: int,
+    *,
+    bucket_name: str,
+    file_path: str,
+    file_id: str,
+    use_table: bool,
+) -> list[dict[str, Any]]:
+    """在子进程中独立打开 PDF，提取 [start, end) 页（从 0 开始）。"""
+    page_data: list[dict[str, Any]] = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_index in range(start, end):
+            page = pdf.pages[page_index]
+            page_info = _extract_single_page(
+                page,
+                page_index + 1,
+                bucket_name=bucket_name,
+                file_path=file_path,
+                file_id=file_id,
+                use_table=use_table,
+                use_image=False,
+            )
+            if page_info is not None:
+                page_data.append(page_info)
+            # 释放已处理页面的缓存，控制子进程内存
+            page.close()
+    return page_data
+
+
+def _iter_fitz_pages(
+    pdf_doc: fitz.Document, start: int, end: int, *, file_path: str
+) -> Iterator[dict[str, Any]]:
+    for page_index in range(start, end):
+        page_number = page_index + 1
+        try:
+            text = extract_fitz_page_text(pdf_doc[page_index])
+        except Exception as exc:
+            logger.warning(f"提取 {file_path} 第 {page_number} 页文本失败：{exc}")
+            continue
+        yield {
+            "text": text,
+            "pages_number": page_number,
+            "content_table": [],
+            "content_image": [],
+        }
+
+
+def _extract_fitz_page_range(
+    pdf_path: str, start: int, end: int, *, file_path: str
+) -> list[dict[str, Any]]:
+    """在子进程中独立打开 PDF，用 fitz 提取 [start, end) 页（从 0 开始）的文本。"""
+    with fitz.open(pdf_path) as pdf_doc:
+        return list(_iter_fitz_pages(pdf_doc, start, end, file_path=file_path))
+
+
+class _PageWindow:
+    """按页面位置切片的滑动窗口，页面从迭代器按需读取，release_before 释放旧页面。"""
+
+    def __init__(self, pages: Iterable[Document]):
+        self._pages = iter(pages)
+        self._window: list[Document] = []
+        self._start = 0
+
+    def slice(self, start: int, end: int | None) -> list[Document]:
+        if start < 0 or (end is not None and end < 0):
+            # 负数下标与列表切片语义一致，需要读完全部页面
+            self._fill(None)
+            return self._window[start:end]
+        self._fill(end)
+        lower = max(start - self._start, 0)
+        upper = None if end is None else max(end - self._start, 0)
+        return self._window[lower:upper]
+
+    def release_before(self, position: int) -> None:
+        drop = min(position - self._start, len(self._window))
+        if drop > 0:
+            del self._window[:drop]
+            self._start += drop
+
+    def _fill(self, end: int | None) -> None:
+        while end is None or self._start + len(self._window) < end:
+            page = next(self._pages, None)
+            if page is None:
+                return
+            self._window.append(page)
+
+
+_process_pools: dict[str, tuple[ProcessPoolExecutor, int]] = {}
+_process_pools_lock = threading.Lock()
+
+
+def _shutdown_process_pools() -> None:
+    with _process_pools_lock:
+        for executor, _ in _process_pools.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        _process_pools.clear()
+
+
+def _get_process_pool(name: str, max_workers: int) -> ProcessPoolExecutor:
+    """
+    按名称共享的进程池（spawn 方式启动，避免 fork 继承线程锁和 ES 连接）。
+
+    worker 数变化或进程池损坏时重新创建。
+    """
+    with _process_pools_lock:
+        executor, workers = _process_pools.get(name, (None, 0))
+        if (
+            executor is None
+            or getattr(executor, "_broken", False)
+            or workers != max_workers
+        ):
+            if executor is not None:
+                executor.shutdown(wait=False)
+            if not _process_pools:
+                # 解析进程内还会创建分页进程池；multiprocessing 子进程退出时会先 join
+                # 所有子进程，必须在此之前关闭进程池，否则空闲 worker 等不到退出信号。
+                # 子进程启动时会清空 finalizer 注册表，所以在创建进程池时注册
+                multiprocessing.util.Finalize(
+                    None, _shutdown_process_pools, exitpriority=100
+                )
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _process_pools[name] = (executor, max_workers)
+            logger.info(f"进程池 {name} 已启动，worker 数：{max_workers}")
+        return executor
+
+
+def get_parse_executor(max_workers: int) -> ProcessPoolExecutor:
+    """整文件解析进程池。"""
+    return _get_process_pool("parse", max_workers)
+
+
+def get_page_executor(max_workers: int) -> ProcessPoolExecutor:
+    """PDF 按页分片提取进程池。"""
+    return _get_process_pool("page", max_workers)
+
+
+_queue_manager: SyncManager | None = None
+
+
+def get_queue_manager() -> SyncManager:
+    """解析进程池回传分块用的共享队列管理进程（普通 multiprocessing.Queue 不能传给进程池任务）。"""
+    global _queue_manager
+    with _process_pools_lock:
+        if _queue_manager is None:
+            _queue_manager = multiprocessing.get_context("spawn").Manager()
+        return _queue_manager
+
+
+def _put_until_cancelled(chunk_queue, cancelled, item: tuple[str, Any]) -> bool:
+    # 队列满时等待消费方读取；消费方放弃读取后不再阻塞
+    while not cancelled.is_set():
+        try:
+            chunk_queue.put(item, timeout=1.0)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _stream_chunks_in_subprocess(
+    parser_kwargs: dict[str, Any], chunk_queue, cancelled, batch_size: int
+) -> None:
+    """
+    子进程内按路径重新读取文件并流式切分，分块按批放入 chunk_queue。
+
+    队列项为 ("stage", 阶段名)、("chunks", 分块列表)，结束时放入 ("done", None)；
+    异常由进程池的 Future 传回。
+    """
+    root_dir = parser_kwargs.pop("root_dir")
+    temp_dir = parser_kwargs.pop("temp_dir")
+    save_converted_pdf_to_temp = parser_kwargs.pop("save_converted_pdf_to_temp")
+    parser = PDFParser(
+        reader=LocalDirectoryPDFReader(root_dir),
+        converter=FileToPDFConverter(
+            save_converted_pdf_to_temp=save_converted_pdf_to_temp,
+            temp_dir=temp_dir,
+        ),
+        **parser_kwargs,
+    )
+    try:
+        batch: list[Document] = []
+        for chunk in parser.iter_chunks(
+            progress_callback=lambda stage: _put_until_cancelled(
+                chunk_queue, cancelled, ("stage", stage)
+            )
+        ):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                if not _put_until_cancelled(chunk_queue, cancelled, ("chunks", batch)):
+                    return
+                batch = []
+        if batch:
+            _put_until_cancelled(chunk_queue, cancelled, ("chunks", batch))
+    finally:
+        _put_until_cancelled(chunk_queue, cancelled, ("done", None))
+
+
+def _text_document(
+    text: str,
+    *,
+    pages_number: int,
+    title: str | None = None,
+    ori_text: str | None = None,
+) -> Document:
+    metadata: dict[str, Any] = {
+        "pages_number": pages_number,
+        "content_table": [],
+        "content_image": [],
+    }
+    if title is not None:
+        metadata["title"] = title
+    if ori_text is not None:
+        metadata["ori_text"] = ori_text
+    return Document(page_content=text, metadata=metadata)
+
+
 class PDFParser:
     DEFAULT_LOCAL_ROOT = workspace_path / "pdf_files"
+    # 解析进程每批回传的分块数，以及队列中最多积压的批数（超出时子进程等待）
+    STREAM_BATCH_SIZE = 50
+    STREAM_MAX_PENDING_BATCHES = 4
+    MARKDOWN_SUFFIXES = {".md", ".markdown"}
+    CSV_SUFFIXES = {".csv"}
 
     def __init__(
         self,
@@ -1046,7 +1866,20 @@ class PDFParser:
         reader: PDFFileReader | None = None,
         save_converted_pdf_to_temp: bool | None = None,
         converter: FileToPDFConverter | None = None,
+        parse_workers: int | None = None,
+        page_workers: int | None = None,
+        min_pages_per_shard: int | None = None,
     ):
+        """
+        parse_workers > 0 时在共享的进程池中解析（仅支持本地文件读取），
+        不阻塞调用线程所在进程的 GIL，分块按批经队列流式回传；为 None 时取
+        settings.PDF_PARSE_WORKERS，<= 0 表示在当前线程内解析。
+
+        page_workers > 1 时把逐页文本提取（fitz；启用表格解析时为 pdfplumber）
+        按 min_pages_per_shard 页一个分片交给多个进程并行执行，同时最多
+        page_workers 个分片在途；默认取 settings.PDF_PAGE_WORKERS、
+        settings.PDF_PAGE_SHARD_MIN_PAGES。
+        """
         self.bucket_name = bucket_name
         self.file_path = file_path
         self.file_id = file_id
@@ -1054,6 +1887,15 @@ class PDFParser:
         self.converter = converter or FileToPDFConverter(
             save_converted_pdf_to_temp=save_converted_pdf_to_temp
         )
+        if parse_workers is None:
+            parse_workers = settings.PDF_PARSE_WORKERS
+        self.parse_workers = parse_workers
+        if page_workers is None:
+            page_workers = settings.PDF_PAGE_WORKERS
+        self.page_workers = page_workers
+        if min_pages_per_shard is None:
+            min_pages_per_shard = settings.PDF_PAGE_SHARD_MIN_PAGES
+        self.min_pages_per_shard = max(1, min_pages_per_shard)
 
     def _build_file_id(self) -> str:
         if self.file_id:
@@ -1069,6 +1911,8 @@ class PDFParser:
             bucket_name=self.bucket_name,
             file_path=self.file_path,
         )
+        if self.converter.is_text_file(loaded_file):
+            return self.converter.load_text(loaded_file)
         return self.converter.ensure_pdf(loaded_file)
 
     def _extract_page_data(
@@ -1078,303 +1922,374 @@ class PDFParser:
         use_table: bool,
         use_image: bool,
         s3_client,
-        text_fallback: str | None = None,
     ) -> tuple[list[dict[str, Any]], int]:
-        if text_fallback is not None:
-            return (
-                [
-                    {
-                        "text": text_fallback,
-                        "pages_number": 1,
-                        "content_table": [],
-                        "content_image": [],
-                    }
-                ],
-                1,
-            )
-
-        page_data: list[dict[str, Any]] = []
-
         with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
             pdf_lens = len(pdf.pages)
             logger.debug(f"{self.file_path} 的 PDF 页数：{pdf_lens}")
 
-            for page_number, page in enumerate(pdf.pages, start=1):
-                try:
-                    text = page.extract_text() or ""
-                except Exception as exc:
-                    logger.warning(
-                        f"提取 {self.file_path} 第 {page_number} 页文本失败：{exc}"
+            shards = self._page_shards(pdf_lens, use_image=use_image)
+            if len(shards) <= 1:
+                page_data: list[dict[str, Any]] = []
+                for page_number, page in enumerate(pdf.pages, start=1):
+                    page_info = _extract_single_page(
+                        page,
+                        page_number,
+                        bucket_name=self.bucket_name,
+                        file_path=self.file_path,
+                        file_id=file_id,
+                        use_table=use_table,
+                        use_image=use_image,
+                        s3_client=s3_client,
                     )
-                    continue
+                    if page_info is not None:
+                        page_data.append(page_info)
+                return page_data, pdf_lens
+
+        page_data = list(
+            self._iter_sharded_pages(
+                file_bytes,
+                shards,
+                _extract_page_range,
+                bucket_name=self.bucket_name,
+                file_path=self.file_path,
+                file_id=file_id,
+                use_table=use_table,
+            )
+        )
+        return page_data, pdf_lens
 
-                page_image_list: list[str] = []
-                if use_image:
-                    for image_number, image in enumerate(page.images):
-                        try:
-                            image_data_bin = image["stream"].get_data()
-                            image_data = io.BytesIO(image_data_bin)
-                            try:
-                                image_data_ = copy.deepcopy(image_data)
-                                pil_image = Image.open(image_data_)
-                                pil_image.verify()
-                            except UnidentifiedImageError:
-                                logger.warning("图片校验失败，跳过当前图片。")
-                                continue
-
-                            text_lines = text.split("\n")
-                            bbox = (
-                                image["x0"],
-                                image["top"],
-                                image["x1"],
-                                image["bottom"],
-                            )
-                            image_name = (
-                                f"image_{self.bucket_name}_{file_id}_"
-                                f"{page_number}_{image_number}.png"
-                            )
-                            page_image_list.append(f"{self.bucket_name}/{image_name}")
-                            text = insert_mark_near_position(
-                                text_lines, page.chars, bbox, image_name
-                            )
+    def _iter_page_text(
+        self, pdf_doc: fitz.Document, file_bytes: bytes
+    ) -> Iterator[dict[str, Any]]:
+        # 不需要表格和图片时，页面文本同样来自 fitz；页数足够时按页分片到多个进程
+        pdf_lens = pdf_doc.page_count
+        logger.debug(f"{self.file_path} 的 PDF 页数：{pdf_lens}")
+        shards = self._page_shards(pdf_lens, use_image=False)
+        if len(shards) <= 1:
+            yield from _iter_fitz_pages(pdf_doc, 0, pdf_lens, file_path=self.file_path)
+            return
+        yield from self._iter_sharded_pages(
+            file_bytes, shards, _extract_fitz_page_range, file_path=self.file_path
+        )
 
-                            upload_file_to_mino(
-                                s3_client=s3_client,
-                                bucket_name=self.bucket_name,
-                                object_name=image_name,
-                                file_data=image_data,
-                                length=len(image_data_bin),
-                            )
-                        except IndexError:
-                            logger.warning("图片上传失败，跳过当前图片。")
-                            continue
+    def _page_shards(self, pdf_lens: int, use_image: bool) -> list[tuple[int, int]]:
+        # 图片需要在解析时上传对象存储，客户端无法跨进程传递，保持串行
+        if use_image or self.page_workers <= 1:
+            return [(0, pdf_lens)]
+        if pdf_lens < 2 * self.min_pages_per_shard:
+            return [(0, pdf_lens)]
+        bounds = list(range(0, pdf_lens, self.min_pages_per_shard)) + [pdf_lens]
+        return list(zip(bounds[:-1], bounds[1:]))
 
-                page_md_list: list[str] = []
-                if use_table:
-                    tables_list = page.extract_tables()
-                    tables = page.find_tables()
-                    page_table_idx = []
-                    if tables:
-                        table_id = 0
-                        for index, table in enumerate(tables):
-                            try:
-                                table_area = page.within_bbox(table.bbox)
-                                table_inner_text = table_area.extract_text()
-                                idx = text.find(table_inner_text)
-                                if idx != -1:
-                                    if len(table_inner_text.split("\n")) < 2:
-                                        continue
-                                    text = text.replace(
-                                        table_inner_text,
-                                        f"**[TABLE_{table_id}]**",
-                                    )
-                                    table_id += 1
-                                    page_table_idx.append(index)
-                            except ValueError:
-                                logger.warning(
-                                    "表格解析出现 ValueError，已跳过当前表格。"
-                                )
-
-                    for index in page_table_idx:
-                        md_list = []
-                        for row_index, row_list in enumerate(tables_list[index]):
-                            if row_index == 0:
-                                header = [item for item in row_list if item]
-                                header_len = len(header)
-                                md_list.append(header)
-                                continue
-
-                            sub_row = [item for item in row_list if item]
-                            first_is_none = row_list[0] is None
-                            if len(sub_row) == header_len:
-                                md_list.append(sub_row)
-                            elif (
-                                len(sub_row) < header_len
-                                and row_index != len(tables_list[index]) - 1
-                            ):
-                                md_list[-1][-1] += "".join(sub_row)
-                            elif len(sub_row) < header_len and first_is_none:
-                                md_list[-1][-1] += "".join(sub_row)
-                            else:
-                                sub_row.extend([""] * (header_len - len(sub_row)))
-                                md_list.append(sub_row)
-
-                        columns = [item.replace("\n", "") for item in md_list[0]]
-                        df = pd.DataFrame(md_list[1:], columns=columns).map(
-                            lambda value: value.replace("\n", "")
-                        )
-                        page_md_list.append(df.to_markdown(index=False))
-
-                page_data.append(
-                    {
-                        "text": text,
-                        "pages_number": page_number,
-                        "content_table": page_md_list,
-                        "content_image": page_image_list,
-                    }
-                )
+    def _iter_sharded_pages(
+        self,
+        file_bytes: bytes,
+        shards: list[tuple[int, int]],
+        extract_range: Callable[..., list[dict[str, Any]]],
+        **kwargs: Any,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        在页面进程池中按分片提取页面，按页序产出。
 
-        return page_data, pdf_lens
+        同时最多 page_workers 个分片在途，前一个分片产出后才提交下一个，
+        内存占用与文件页数无关。
+        """
+        logger.info(
+            f"{self.file_path} 按页分片并行提取，分片数：{len(shards)}，"
+            f"每片 {self.min_pages_per_shard} 页"
+        )
+        # 子进程各自按路径打开 PDF，避免把整份文件字节复制到每个分片
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+            temp_file.write(file_bytes)
+            pdf_path = temp_file.name
+        pending: deque[Future] = deque()
+        try:
+            executor = get_page_executor(self.page_workers)
+            shard_iter = iter(shards)
+            for start, end in itertools.islice(shard_iter, self.page_workers):
+                pending.append(
+                    executor.submit(extract_range, pdf_path, start, end, **kwargs)
+                )
+            while pending:
+                page_data = pending.popleft().result()
+                next_shard = next(shard_iter, None)
+                if next_shard is not None:
+                    pending.append(
+                        executor.submit(extract_range, pdf_path, *next_shard, **kwargs)
+                    )
+                yield from page_data
+        finally:
+            for future in pending:
+                future.cancel()
+            os.unlink(pdf_path)
 
-    def _split_documents_by_structure(
+    def _iter_split_documents(
         self,
-        docs: list[Document],
-        file_bytes: bytes,
+        pages: Iterable[Document],
+        title_info: list,
         structure_info: dict[str, Any],
         pdf_lens: int,
         use_table: bool,
         use_image: bool,
-    ) -> list[Document]:
+    ) -> Iterator[Document]:
+        """
+        按目录结构流式切分页面；pages 按页序逐个读取，只保留后续目录项还会用到的页面。
+
+        与原实现一致：如果没有任何标题块满足长度要求，退回 chunksplit 结果，
+        因此在产出第一个标题块之前需要保留已读取的全部页面。
+        """
         logger.debug("开始切分文档分块。")
         split_strategy = structure_info["split_strategy"]
         logger.info(f"分块策略：{split_strategy}")
 
         if split_strategy == "chunksplit":
-            return text_splitter.split_documents3(docs)
+            yield from text_splitter.iter_split_documents3(pages)
+            return
 
-        chunksplit_docs = text_splitter.split_documents3(docs)
         title_level = structure_info["max_title_level"]
         logger.info(f"标题层级：{title_level}")
 
-        pdf_doc = fitz.Document(stream=file_bytes)
-        try:
-            title_info = pdf_doc.get_toc()
-        finally:
-            pdf_doc.close()
-
         toc = list(extract_toc_from_fitz(title_info, level=title_level))
         toc.insert(0, ("$#", 1, 1))
         logger.info(f"目录项数量：{len(toc)}")
 
-        title_docs: list[Document] = []
+        # 每个目录项之后仍会用到的最小页面位置；目录页码异常（<1）时不释放页面
+        window = _PageWindow(pages)
+        releasable = all(page >= 1 for _, page, _ in toc)
+        min_future_start = [0] * (len(toc) + 1)
+        min_future_start[len(toc)] = pdf_lens
+        for idx in range(len(toc) - 1, -1, -1):
+            min_future_start[idx] = min(toc[idx][1] - 1, min_future_start[idx + 1])
+
+        yielded_title_doc = False
         for idx, (title, page, level) in enumerate(toc):
-            next_page = toc[idx + 1][1] if idx < len(toc) - 1 else pdf_lens
-            section_docs = (
-                docs[page - 1 : next_page] if idx < len(toc) - 1 else docs[page - 1 :]
-            )
-            if not section_docs:
-                continue
+            if idx < len(toc) - 1:
+                section_docs = window.slice(page - 1, toc[idx + 1][1])
+            else:
+                section_docs = window.slice(page - 1, None)
+
+            if section_docs:
+                title_doc = self._build_title_doc(
+                    idx=idx,
+                    toc=toc,
+                    section_docs=section_docs,
+                    title_info=title_info,
+                    use_table=use_table,
+                    use_image=use_image,
+                )
+                if len(title_doc.page_content) > 30:
+                    yielded_title_doc = True
+                    yield title_doc
 
-            text = "".join(doc.page_content for doc in section_docs)
-            content_table = []
-            content_image = []
-            for section_doc in section_docs:
-                content_table.extend(section_doc.metadata["content_table"])
-                content_image.extend(section_doc.metadata["content_image"])
-
-            if use_table:
-                pattern_table = r"\*\*\[TABLE_\d+\]\*\*"
-                table_matchers = re.findall(pattern_table, text)
-                logger.debug(f"标题 {title} 命中的表格标记数量：{len(table_matchers)}")
-                if len(table_matchers) >= 50:
-                    for table_mark in table_matchers:
-                        text = text.replace(table_mark, "")
-                else:
-                    for table_index, table_mark in enumerate(table_matchers):
-                        text = text.replace(table_mark, f"**[TABLE_{table_index}]**")
+            if yielded_title_doc and releasable:
+                window.release_before(min_future_start[idx + 1])
 
-            text_splits = text.split("\n")
-            ori_text_splits = copy.deepcopy(text_splits)
-            title_start_idx = 0
-            title_start_flag = False
-            title_end_idx = 100000
-            title_end_flag = False
+        if not yielded_title_doc:
+            yield from text_splitter.iter_split_documents3(window.slice(0, None))
 
-            for text_idx, line in enumerate(text_splits):
-                if title_start_flag and title_end_flag:
-                    break
+    def _build_title_doc(
+        self,
+        *,
+        idx: int,
+        toc: list[tuple[str, int, int]],
+        section_docs: list[Document],
+        title_info: list,
+        use_table: bool,
+        use_image: bool,
+    ) -> Document:
+        title, _, level = toc[idx]
+        text = "".join(doc.page_content for doc in section_docs)
+        content_table = []
+        content_image = []
+        for section_doc in section_docs:
+            content_table.extend(section_doc.metadata["content_table"])
+            content_image.extend(section_doc.metadata["content_image"])
+
+        if use_table:
+            pattern_table = r"\*\*\[TABLE_\d+\]\*\*"
+            table_matchers = re.findall(pattern_table, text)
+            logger.debug(f"标题 {title} 命中的表格标记数量：{len(table_matchers)}")
+            if len(table_matchers) >= 50:
+                for table_mark in table_matchers:
+                    text = text.replace(table_mark, "")
+            else:
+                for table_index, table_mark in enumerate(table_matchers):
+                    text = text.replace(table_mark, f"**[TABLE_{table_index}]**")
 
-                if not title_start_flag:
-                    distance_start = levenshtein_distance(s1=line, s2=title)
-                    if distance_start <= 2 or title == "$#":
-                        parent_title_list = extract_parent_title(
-                            title_info=title_info,
-                            sub_title=title,
-                            cur_level=level,
-                        )
-                        parent_title_str = "".join(
-                            "#" * int(parent_level) + " " + parent_title + "\n"
-                            for parent_level, parent_title in parent_title_list
-                        )
-                        text_splits[text_idx] = (
-                            parent_title_str
-                            + "#" * int(level)
-                            + " "
-                            + text_splits[text_idx]
-                            + "\n"
-                        )
-                        title_start_idx = text_idx
-                        title_start_flag = True
-                        continue
-
-                if not title_end_flag and idx + 1 < len(toc):
-                    distance_end = levenshtein_distance(s1=line, s2=toc[idx + 1][0])
-                    if distance_end <= 2:
-                        title_end_idx = text_idx
-                        title_end_flag = True
-
-            text = "".join(text_splits[title_start_idx:title_end_idx])
-            ori_text = "".join(ori_text_splits[title_start_idx:title_end_idx])
-            ori_text = convert_title_with_paragraph_breaks(ori_text)
-
-            new_content_image = []
-            if use_image:
-                pattern_image = r"image_[\w-]+_\d+_\d+\.png"
-                images_anchor = re.findall(pattern_image, text)
-                new_content_image = [
-                    f"{self.bucket_name}/{image_name}" for image_name in images_anchor
-                ]
-
-            new_content_table = []
-            if use_table:
-                pattern_table_id = r"\*\*\[TABLE_(\d+)\]\*\*"
-                table_id_matchers = re.findall(pattern_table_id, text)
-                for table_id in table_id_matchers:
-                    new_content_table.append(content_table[int(table_id)])
-
-            title_doc = Document(
-                page_content=text,
-                metadata={
-                    "pages_number": section_docs[0].metadata["pages_number"],
-                    "content_table": new_content_table,
-                    "content_image": new_content_image,
-                    "ori_text": ori_text,
-                },
+        text_splits = text.split("\n")
+        ori_text_splits = copy.deepcopy(text_splits)
+        title_locator = TitleLocator(text_splits, max_distance=2)
+        title_end_idx = 100000
+
+        if title == "$#":
+            title_start_idx = 0
+            title_start_flag = True
+        else:
+            title_start_idx = title_locator.find(title)
+            title_start_flag = title_start_idx is not None
+            if not title_start_flag:
+                title_start_idx = 0
+
+        if title_start_flag:
+            parent_title_list = extract_parent_title(
+                title_info=title_info,
+                sub_title=title,
+                cur_level=level,
+            )
+            parent_title_str = "".join(
+                "#" * int(parent_level) + " " + parent_title + "\n"
+                for parent_level, parent_title in parent_title_list
+            )
+            text_splits[title_start_idx] = (
+                parent_title_str
+                + "#" * int(level)
+                + " "
+                + text_splits[title_start_idx]
+                + "\n"
             )
-            if len(title_doc.page_content) > 30:
-                title_docs.append(title_doc)
 
-        return title_docs or chunksplit_docs
+        if idx + 1 < len(toc):
+            # 标题所在行不参与结束位置匹配
+            end_idx = title_locator.find(
+                toc[idx + 1][0], skip=title_start_idx if title_start_flag else None
+            )
+            if end_idx is not None:
+                title_end_idx = end_idx
+
+        text = "".join(text_splits[title_start_idx:title_end_idx])
+        ori_text = "".join(ori_text_splits[title_start_idx:title_end_idx])
+        ori_text = convert_title_with_paragraph_breaks(ori_text)
+
+        new_content_image = []
+        if use_image:
+            pattern_image = r"image_[\w-]+_\d+_\d+\.png"
+            images_anchor = re.findall(pattern_image, text)
+            new_content_image = [
+                f"{self.bucket_name}/{image_name}" for image_name in images_anchor
+            ]
+
+        new_content_table = []
+        if use_table:
+            pattern_table_id = r"\*\*\[TABLE_(\d+)\]\*\*"
+            table_id_matchers = re.findall(pattern_table_id, text)
+            for table_id in table_id_matchers:
+                new_content_table.append(content_table[int(table_id)])
+
+        title_doc = Document(
+            page_content=text,
+            metadata={
+                "pages_number": section_docs[0].metadata["pages_number"],
+                "content_table": new_content_table,
+                "content_image": new_content_image,
+                "ori_text": ori_text,
+            },
+        )
+        return title_doc
 
-    def _finalize_docs(
+    def _finalize_doc(
         self,
-        docs: list[Document],
+        doc: Document,
+        segment_id: int,
         file_name: str,
         file_id: str,
         converted_pdf_temp_path: str | None = None,
-    ) -> list[Document]:
-        if not docs:
-            raise Exception("PDF 解析失败，未提取到任何文本内容。")
+    ) -> Document:
+        doc.metadata.update(
+            {
+                "file_name": file_name,
+                "file_id": file_id,
+                "segment_id": segment_id,
+                "state": True,
+                "bucket_name": self.bucket_name,
+                "file_path": self.file_path,
+                "converted_pdf_temp_path": converted_pdf_temp_path,
+            }
+        )
+        return doc
+
+    def _can_use_process_pool(self) -> bool:
+        # 自定义 reader（如 S3）和 converter 无法在子进程中重建，退回当前线程解析
+        return (
+            self.parse_workers > 0
+            and type(self.reader) is LocalDirectoryPDFReader
+            and type(self.converter) is FileToPDFConverter
+        )
 
-        for segment_id, doc in enumerate(docs, start=1):
-            doc.metadata.update(
-                {
-                    "file_name": file_name,
-                    "file_id": file_id,
-                    "segment_id": segment_id,
-                    "state": True,
-                    "bucket_name": self.bucket_name,
-                    "file_path": self.file_path,
-                    "converted_pdf_temp_path": converted_pdf_temp_path,
-                }
+    def _submit_to_process_pool(self, *args: Any) -> Future:
+        parser_kwargs = {
+            "bucket_name": self.bucket_name,
+            "file_path": self.file_path,
+            "file_id": self._build_file_id(),
+            "parse_workers": 0,
+            "page_workers": self.page_workers,
+            "min_pages_per_shard": self.min_pages_per_shard,
+            "root_dir": str(self.reader.root_dir),
+            "temp_dir": str(self.converter.temp_dir),
+            "save_converted_pdf_to_temp": self.converter.save_converted_pdf_to_temp,
+        }
+        logger.info(f"提交到解析进程池：{self.file_path}")
+        try:
+            return get_parse_executor(self.parse_workers).submit(
+                _stream_chunks_in_subprocess, parser_kwargs, *args
+            )
+        except BrokenProcessPool:
+            # 进程池损坏时重建一次
+            return get_parse_executor(self.parse_workers).submit(
+                _stream_chunks_in_subprocess, parser_kwargs, *args
             )
 
-        logger.info(f"文件切分完成，file_name={file_name}，file_id={file_id}")
-        return docs
+    def _iter_chunks_from_process_pool(
+        self, progress_callback: Callable[[str], None] | None
+    ) -> Iterator[Document]:
+        manager = get_queue_manager()
+        chunk_queue = manager.Queue(maxsize=self.STREAM_MAX_PENDING_BATCHES)
+        cancelled = manager.Event()
+        future = self._submit_to_process_pool(
+            chunk_queue, cancelled, self.STREAM_BATCH_SIZE
+        )
+        try:
+            while True:
+                try:
+                    kind, payload = chunk_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if future.done() and chunk_queue.empty():
+                        # 子进程没有放入结束标记就退出（如进程崩溃），抛出其异常
+                        future.result()
+                        raise RuntimeError(f"解析进程异常退出：{self.file_path}")
+                    continue
+                if kind == "done":
+                    break
+                if kind == "stage":
+                    if progress_callback is not None:
+                        progress_callback(payload)
+                else:
+                    yield from payload
+            future.result()
+        finally:
+            # 调用方提前停止读取时通知子进程结束，释放进程池 worker
+            cancelled.set()
 
-    def get_chunk(self) -> List[Document]:
+    def get_chunk(
+        self, progress_callback: Callable[[str], None] | None = None
+    ) -> List[Document]:
+        """解析并切分文件；progress_callback 会依次收到 "parse"、"split" 阶段名。"""
+        return list(self.iter_chunks(progress_callback=progress_callback))
+
+    def iter_chunks(
+        self, progress_callback: Callable[[str], None] | None = None
+    ) -> Iterator[Document]:
+        """
+        流式解析并切分文件，每完成一个分块就产出（segment_id 按产出顺序递增）。
+
+        本地 fitz 解析路径下页面文本按需读取，内存占用与文件页数无关；
+        启用进程池解析时子进程同样流式切分，分块按批经有界队列回传。
+        """
         if not self.file_path:
-            return []
+            return
+
+        if self._can_use_process_pool():
+            yield from self._iter_chunks_from_process_pool(progress_callback)
+            return
 
         file_id = self._build_file_id()
         use_table = False
@@ -1382,40 +2297,204 @@ class PDFParser:
         logger.info(f"是否启用表格解析：{use_table}")
         logger.info(f"是否启用图片解析：{use_image}")
 
+        if progress_callback is not None:
+            progress_callback("parse")
         loaded_file = self._load_file()
-        structure_info = detect_pdf_structure(file_bytes=loaded_file.file_bytes)
-        page_data, pdf_lens = self._extract_page_data(
-            file_bytes=loaded_file.file_bytes,
-            file_id=file_id,
-            use_table=use_table,
-            use_image=use_image,
-            s3_client=loaded_file.upload_client,
-            text_fallback=loaded_file.text_content,
-        )
+        if loaded_file.text_content is not None:
+            # 文本类文件不经过 PDF，按文件类型直接切分原始文本
+            if progress_callback is not None:
+                progress_callback("split")
+            yield from self._iter_numbered_chunks(
+                self._iter_text_documents(loaded_file),
+                loaded_file=loaded_file,
+                file_id=file_id,
+            )
+            return
+
+        # 目录、页数和页面文本都来自同一次 fitz 解析；只有表格和图片才需要 pdfplumber
+        with fitz.open(stream=loaded_file.file_bytes, filetype="pdf") as pdf_doc:
+            if use_table or use_image:
+                page_data, _ = self._extract_page_data(
+                    file_bytes=loaded_file.file_bytes,
+                    file_id=file_id,
+                    use_table=use_table,
+                    use_image=use_image,
+                    s3_client=loaded_file.upload_client,
+                )
+            else:
+                page_data = self._iter_page_text(pdf_doc, loaded_file.file_bytes)
+            yield from self._iter_finalized_chunks(
+                page_data=page_data,
+                title_info=pdf_doc.get_toc(),
+                pdf_lens=pdf_doc.page_count,
+                loaded_file=loaded_file,
+                file_id=file_id,
+                use_table=use_table,
+                use_image=use_image,
+                progress_callback=progress_callback,
+            )
 
-        docs = [
+    def _iter_finalized_chunks(
+        self,
+        *,
+        page_data: Iterable[dict[str, Any]],
+        title_info: list,
+        pdf_lens: int,
+        loaded_file: LoadedPDFFile,
+        file_id: str,
+        use_table: bool,
+        use_image: bool,
+        progress_callback: Callable[[str], None] | None,
+    ) -> Iterator[Document]:
+        pages = (
             Document(page_content=page_info.get("text", ""), metadata=page_info)
             for page_info in page_data
-        ]
-        logger.debug(f"{self.file_path} 解析出的页面文档数：{len(docs)}")
-
-        docs = self._split_documents_by_structure(
-            docs=docs,
-            file_bytes=loaded_file.file_bytes,
-            structure_info=structure_info,
-            pdf_lens=pdf_lens,
-            use_table=use_table,
-            use_image=use_image,
         )
-        logger.info(f"最终分块数量：{len(docs)}")
 
-        return self._finalize_docs(
-            docs=docs,
-            file_name=loaded_file.file_name,
+        if progress_callback is not None:
+            progress_callback("split")
+        yield from self._iter_numbered_chunks(
+            self._iter_split_documents(
+                pages=pages,
+                title_info=title_info,
+                structure_info=get_toc_structure(title_info),
+                pdf_lens=pdf_lens,
+                use_table=use_table,
+                use_image=use_image,
+            ),
+            loaded_file=loaded_file,
             file_id=file_id,
-            converted_pdf_temp_path=loaded_file.converted_pdf_temp_path,
         )
 
+    def _iter_numbered_chunks(
+        self,
+        docs: Iterable[Document],
+        *,
+        loaded_file: LoadedPDFFile,
+        file_id: str,
+    ) -> Iterator[Document]:
+        segment_id = 0
+        for segment_id, doc in enumerate(docs, start=1):
+            yield self._finalize_doc(
+                doc,
+                segment_id,
+                loaded_file.file_name,
+                file_id,
+                loaded_file.converted_pdf_temp_path,
+            )
+
+        if not segment_id:
+            raise Exception("PDF 解析失败，未提取到任何文本内容。")
+        logger.info(f"最终分块数量：{segment_id}")
+        logger.info(
+            f"文件切分完成，file_name={loaded_file.file_name}，file_id={file_id}"
+        )
+
+    def _iter_text_documents(self, loaded_file: LoadedPDFFile) -> Iterator[Document]:
+        suffix = Path(loaded_file.file_name).suffix.lower()
+        text = loaded_file.text_content or ""
+        if suffix in self.MARKDOWN_SUFFIXES:
+            yield from self._iter_markdown_documents(text)
+        elif suffix in self.CSV_SUFFIXES:
+            yield from self._iter_csv_documents(text)
+        else:
+            yield from text_splitter.iter_split_documents3(
+                [_text_document(text, pages_number=1)]
+            )
+
+    def _iter_markdown_documents(self, text: str) -> Iterator[Document]:
+        """
+        按 Markdown 标题切分：每个标题下的正文为一个分块，内容前带上完整的标题路径；
+        正文超过 chunk_size 时再用 text_splitter 切分，代码块内的 # 不视为标题。
+        """
+        heading_path: list[tuple[int, str]] = []
+        section_lines: list[str] = []
+        in_fence = False
+
+        def build_section() -> Iterator[Document]:
+            body = "\n".join(section_lines).strip()
+            if not body:
+                return
+            heading_prefix = "".join(
+                "#" * level + " " + title + "\n" for level, title in heading_path
+            )
+            title = heading_path[-1][1] if heading_path else "无标题内容"
+            if text_splitter._length_function(body) > text_splitter._chunk_size:
+                pieces = text_splitter.split_text(body)
+            else:
+                pieces = [body]
+            for piece in pieces:
+                yield _text_document(
+                    heading_prefix + piece, pages_number=1, title=title, ori_text=piece
+                )
+
+        for line in text.splitlines():
+            if MARKDOWN_FENCE_RE.match(line):
+                in_fence = not in_fence
+            heading = None if in_fence else MARKDOWN_HEADING_RE.match(line)
+            if heading is None:
+                section_lines.append(line)
+                continue
+
+            yield from build_section()
+            level = len(heading.group(1))
+            while heading_path and heading_path[-1][0] >= level:
+                heading_path.pop()
+            heading_path.append((level, heading.group(2)))
+            section_lines = []
+        yield from build_section()
+
+    def _iter_csv_documents(self, text: str) -> Iterator[Document]:
+        """按行分组切分 CSV，每组不超过 chunk_size，并在每组开头重复表头。"""
+        length_function = text_splitter._length_function
+        chunk_size = text_splitter._chunk_size
+
+        def serialize(row: list[str]) -> str:
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="").writerow(row)
+            return buffer.getvalue()
+
+        try:
+            rows = [row for row in csv.reader(io.StringIO(text)) if any(row)]
+        except csv.Error as exc:
+            logger.warning(f"CSV 解析失败，按普通文本切分：{exc}")
+            yield from text_splitter.iter_split_documents3(
+                [_text_document(text, pages_number=1)]
+            )
+            return
+        if not rows:
+            return
+
+        header = serialize(rows[0])
+        budget = chunk_size - length_function(header)
+        group: list[str] = []
+        group_length = 0
+        first_row = 1
+
+        def build_group(last_row: int) -> Document:
+            rows_text = "\n".join(group)
+            return _text_document(
+                header + "\n" + rows_text,
+                pages_number=1,
+                title=f"第 {first_row}-{last_row} 行",
+                ori_text=rows_text,
+            )
+
+        for row_number, row in enumerate(rows[1:], start=1):
+            line = serialize(row)
+            line_length = length_function("\n" + line)
+            if group and group_length + line_length > budget:
+                yield build_group(row_number - 1)
+                group = []
+                group_length = 0
+                first_row = row_number
+            group.append(line)
+            group_length += line_length
+        if group:
+            yield build_group(len(rows) - 1)
+        elif len(rows) == 1:
+            yield _text_document(header, pages_number=1, title="表头", ori_text=header)
+
 
 if __name__ == "__main__":
     pdf_parser = PDFParser(bucket_name="法律", file_path="Quick Start.txt")
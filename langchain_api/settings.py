@@ -20,6 +20,57 @@ class Settings(BaseSettings):
 
     # Embedding模型配置
     EMBEDDING_MODEL_NAME: str
+    # 入库时 embedding 的批大小、批之间的最大并发数和失败批次的重试次数
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_MAX_RETRIES: int = 2
+    # embedding 缓存：内存 LRU 条数 + 本地磁盘缓存大小上限（MB）
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000
+    EMBEDDING_CACHE_MAX_MB: int = 1024
+
+    # 知识图谱三元组抽取：最大并发 LLM 请求数、每秒请求数限制（<=0 表示不限速）
+    TRIPLET_EXTRACTION_CONCURRENCY: int = 8
+    TRIPLET_EXTRACTION_RPS: float = 0
+    # 三元组抽取结果缓存（本地磁盘），重建知识库时未变化的分块不再调用 LLM
+    TRIPLET_CACHE_ENABLED: bool = True
+    TRIPLET_CACHE_MAX_MB: int = 256
+    # 三元组打包抽取：把多个短分块合并为一次请求（估算 token 上限、每包最多分块数）
+    TRIPLET_PACKING_ENABLED: bool = False
+    TRIPLET_PACK_TOKEN_BUDGET: int = 2000
+    TRIPLET_PACK_MAX_PASSAGES: int = 10
+
+    # 知识库后台入库任务的并发文件数
+    INGEST_WORKERS: int = 2
+    # 单个文件边切分边入库时每批写入的分块数
+    INGEST_CHUNK_BATCH_SIZE: int = 200
+    # 文件解析进程池 worker 数，<=0 表示在入库线程内直接解析
+    PDF_PARSE_WORKERS: int = 2
+    # PDF 按页分片并行提取的进程数（<=1 表示串行）与每个分片的最少页数
+    PDF_PAGE_WORKERS: int = 4
+    PDF_PAGE_SHARD_MIN_PAGES: int = 50
+    # 文本分块长度计量：chars（字符数）、estimate（估算 token）或 tiktoken 编码名
+    TEXT_SPLITTER_LENGTH_UNIT: Literal[
+        "chars", "estimate", "cl100k_base", "o200k_base", "p50k_base", "r50k_base"
+    ] = "chars"
+    # 分块大小与小分块合并后的目标长度，单位与 TEXT_SPLITTER_LENGTH_UNIT 一致
+    TEXT_SPLITTER_CHUNK_SIZE: int = 600
+    TEXT_SPLITTER_MERGE_MAX_LENGTH: int = 2000
+    # LibreOffice 同时转换的进程数（每个解析进程独立计数）与单个文件转换超时秒数
+    LIBREOFFICE_MAX_WORKERS: int = 2
+    LIBREOFFICE_TIMEOUT: float = 120
+    # 非 PDF 文件转换结果缓存（按源文件内容哈希复用）与磁盘上限
+    CONVERTED_PDF_CACHE_ENABLED: bool = True
+    CONVERTED_PDF_CACHE_MAX_MB: int = 1024
+    # 检索时的知识库图内存快照（多跳扩展不再逐步查询 ES）：有效期秒数与实体+关系数上限
+    GRAPH_INDEX_ENABLED: bool = True
+    GRAPH_INDEX_TTL: float = 600
+    GRAPH_INDEX_MAX_NODES: int = 2000000
+    # 查询实体词典匹配（Aho-Corasick，匹配不到时再调用 LLM 抽取）：有效期秒数、实体数上限与最短名称长度
+    ENTITY_MATCHER_ENABLED: bool = True
+    ENTITY_MATCHER_TTL: float = 600
+    ENTITY_MATCHER_MAX_ENTITIES: int = 500000
+    ENTITY_MATCHER_MIN_LENGTH: int = 2
 
     # elasticsearch配置
     ES_URL: str | None = None
@@ -1,6 +1,7 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from langchain_core.embeddings import Embeddings
 from langchain_deepseek import ChatDeepSeek
 from langchain_openai import OpenAIEmbeddings
 
@@ -37,8 +38,21 @@ def get_chat_model() -> ChatDeepSeek:
     )
 
 
-def get_embedding_model() -> OpenAIEmbeddings:
+def get_embedding_model() -> Embeddings:
 
-    return OpenAIEmbeddings(
+    embeddings = OpenAIEmbeddings(
         model=settings.EMBEDDING_MODEL_NAME,
     )
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+
+    from langchain_api.rag.cache import CachedEmbeddings, get_embedding_cache
+
+    return CachedEmbeddings(
+        embeddings,
+        model_name=settings.EMBEDDING_MODEL_NAME,
+        cache=get_embedding_cache(
+            max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            memory_items=settings.EMBEDDING_CACHE_MEMORY_ITEMS,
+        ),
+    )